@@ -0,0 +1,419 @@
+import asyncio
+import json
+import lzma
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from pathlib import PurePosixPath
+
+from starlette.concurrency import run_in_threadpool
+
+from images import (
+    IMAGE_DIR,
+    ImageQueueFull,
+    IMAGE_WORKERS,
+    store_fileobj,
+    run_image_job,
+    make_derivatives,
+    item_image_fields,
+)
+from ordering import POSITION_GAP
+from changes import record_change
+
+# Bulk item import from a zip or tar archive (optionally gzip/bz2/xz
+# compressed). The archive is spooled to a temp file in chunks, then its
+# members are copied one at a time into content-addressed storage while
+# thumbnails are generated in parallel in the image pool; nothing holds a
+# whole archive or more than one chunk of a member in memory. All items go
+# in with a few multi-row INSERTs at the end, in one transaction.
+#
+# An optional manifest.ndjson at the archive root picks files, names and
+# tiers, one JSON object per line:
+#   {"file": "cats/tom.png", "name": "Tom", "tier": "S"}   # tier name or tier id
+# Without one, every image file becomes an item named after the file.
+
+#######################
+# Configuration
+#######################
+
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 1024 * 1024 * 1024))
+IMPORT_MAX_ENTRIES = int(os.getenv("IMPORT_MAX_ENTRIES", 2000))
+IMPORT_MAX_ENTRY_BYTES = int(os.getenv("IMPORT_MAX_ENTRY_BYTES", 50 * 1024 * 1024))
+# Thumbnail jobs one import keeps in flight
+IMPORT_PARALLELISM = int(os.getenv("IMPORT_PARALLELISM", IMAGE_WORKERS))
+IMPORT_INSERT_BATCH = 500
+# How often a progress line is sent at most (seconds)
+IMPORT_PROGRESS_INTERVAL = 0.5
+# Waits for a saturated image pool before an entry is given up
+IMPORT_BUSY_RETRIES = 20
+IMPORT_BUSY_WAIT = 0.5
+
+MANIFEST_NAME = "manifest.ndjson"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".bmp", ".tif", ".tiff"}
+
+
+class InvalidArchive(ValueError):
+    """Raised for bodies that are neither zip nor tar, or have a broken manifest."""
+
+
+class ArchiveTooLarge(ValueError):
+    pass
+
+
+# What reading a truncated or corrupt zip/tar (or its compression) can raise
+ARCHIVE_ERRORS = (
+    tarfile.TarError,
+    zipfile.BadZipFile,
+    EOFError,
+    OSError,
+    zlib.error,
+    lzma.LZMAError,
+)
+# Reading a member can also fail on what zipfile doesn't support: encrypted
+# members (RuntimeError) and unknown compression methods (NotImplementedError)
+MEMBER_ERRORS = ARCHIVE_ERRORS + (RuntimeError, NotImplementedError)
+
+
+#######################
+# Spooling + archive access
+#######################
+
+
+async def spool_body(stream, max_bytes: int = IMPORT_MAX_BYTES):
+    """
+    Copies a request body (async iterator of chunks) into an anonymous temp
+    file. Raises ArchiveTooLarge past `max_bytes`. The caller closes the file.
+    """
+    f = await run_in_threadpool(tempfile.TemporaryFile)
+    size = 0
+    try:
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_bytes:
+                raise ArchiveTooLarge(max_bytes)
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(f.seek, 0)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        raise
+    return f
+
+
+class _Archive:
+    """Uniform, sequential access to the members of a zip or tar file."""
+
+    def __init__(self, f):
+        try:
+            if zipfile.is_zipfile(f):
+                f.seek(0)
+                self._zip = zipfile.ZipFile(f)
+                self._tar = None
+                members = [i for i in self._zip.infolist() if not i.is_dir()]
+                self._members = {i.filename: i for i in members}
+            else:
+                f.seek(0)
+                self._tar = tarfile.open(fileobj=f, mode="r:*")
+                self._zip = None
+                # Reads the member headers only, skipping over the data
+                members = self._tar.getmembers()
+                self._members = {m.name: m for m in members if m.isfile()}
+        except ARCHIVE_ERRORS:
+            raise InvalidArchive("Body is not a readable zip or tar archive.")
+        # Where each member sits in the archive: reading members out of
+        # order makes a compressed tar decompress from the start every time
+        self._order = {name: index for index, name in enumerate(self._members)}
+
+    def names(self) -> list:
+        return list(self._members)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._members
+
+    def order(self, name: str) -> int:
+        return self._order.get(name, -1)
+
+    def size(self, name: str) -> int:
+        member = self._members[name]
+        return member.file_size if self._zip else member.size
+
+    def open(self, name: str):
+        member = self._members[name]
+        return self._zip.open(member) if self._zip else self._tar.extractfile(member)
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+
+def _normalize(name: str) -> str:
+    # "./a.png", "/a.png" and "a.png" are the same entry
+    return str(PurePosixPath(name.lstrip("/")))
+
+
+def _plan(archive: _Archive) -> list:
+    """
+    [(member name, {"name", "tier"}), ...] in import order: the manifest's,
+    or the archive's own order for every image when there is none.
+    """
+    names = {_normalize(n): n for n in archive.names()}
+    if MANIFEST_NAME in names:
+        entries = []
+        with archive.open(names[MANIFEST_NAME]) as manifest:
+            for line_no, line in enumerate(manifest, 1):
+                if not line.strip():
+                    continue
+                try:
+                    meta = json.loads(line)
+                    file_name = _normalize(meta["file"])
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    raise InvalidArchive(f"{MANIFEST_NAME} line {line_no} is not valid.")
+                entries.append((names.get(file_name, file_name), meta))
+        return entries
+    return [
+        (original, {})
+        for name, original in names.items()
+        if PurePosixPath(name).suffix.lower() in IMAGE_EXTENSIONS
+        and not any(part.startswith((".", "__MACOSX")) for part in PurePosixPath(name).parts)
+    ]
+
+
+def _open(f):
+    archive = _Archive(f)
+    try:
+        plan = _plan(archive)
+    except MEMBER_ERRORS:
+        archive.close()
+        raise InvalidArchive(f"{MANIFEST_NAME} could not be read from the archive.")
+    except BaseException:
+        archive.close()
+        raise
+    if len(plan) > IMPORT_MAX_ENTRIES:
+        archive.close()
+        raise InvalidArchive(f"Archive has more than {IMPORT_MAX_ENTRIES} entries.")
+    return archive, plan
+
+
+async def open_archive(f):
+    """
+    (archive, plan) for a spooled body, plan being [(member, manifest entry), ...].
+    Raises InvalidArchive before anything is imported.
+    """
+    return await run_in_threadpool(_open, f)
+
+
+def _store_member(archive: _Archive, name: str):
+    if name not in archive:
+        raise ValueError("File not found in the archive")
+    if archive.size(name) > IMPORT_MAX_ENTRY_BYTES:
+        raise ValueError(f"File is larger than {IMPORT_MAX_ENTRY_BYTES} bytes")
+    ext = PurePosixPath(name).suffix.lower()
+    with archive.open(name) as member:
+        return store_fileobj(member, IMAGE_DIR, ext, max_bytes=IMPORT_MAX_ENTRY_BYTES)
+
+
+#######################
+# Import
+#######################
+
+
+def _resolve_tier(meta: dict, tier_rows: list, default_tier_id):
+    """(tier_id, warning) for a manifest entry."""
+    tier = meta.get("tier", meta.get("tier_id"))
+    if tier is None:
+        return default_tier_id, None
+    for row in tier_rows:
+        if tier == row["id"] or (isinstance(tier, str) and tier.strip().lower() == row["name"].lower()):
+            return row["id"], None
+    return None, f"Unknown tier {tier!r}, imported unassigned"
+
+
+async def derive_with_retries(semaphore, index: int, digest: str, path):
+    """
+    (index, make_derivatives result or None, error or None) for a stored
+    original, waiting out a saturated image pool up to IMPORT_BUSY_RETRIES times.
+    """
+    async with semaphore:
+        for _ in range(IMPORT_BUSY_RETRIES):
+            try:
+                return index, await run_image_job(make_derivatives, path, digest), None
+            except ImageQueueFull:
+                await asyncio.sleep(IMPORT_BUSY_WAIT)
+            except Exception as e:
+                return index, None, f"Image processing failed: {e}"
+        return index, None, "Image processing is busy"
+
+
+async def allocate_ids(db, table: str, count: int) -> list:
+    """`count` fresh ids from the table's serial sequence, for inserts that need them up front."""
+    rows = await db.fetch_all(
+        f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) AS id FROM generate_series(1, :n)",
+        {"n": count},
+    )
+    return [r["id"] for r in rows]
+
+
+async def insert_items(db, tierlist_id: int, rows: list) -> list:
+    """
+    Multi-row INSERTs of item dicts (tier_id, position, name, image_url,
+    preview_url, variants); returns the new ids in the same order.
+    """
+    ids = await allocate_ids(db, "items", len(rows))
+    for start in range(0, len(rows), IMPORT_INSERT_BATCH):
+        batch = rows[start:start + IMPORT_INSERT_BATCH]
+        await db.execute(
+            "INSERT INTO items (id, tierlist_id, tier_id, position, name, image_url, preview_url, variants) "
+            "SELECT v.id, :tierlist_id, v.tier_id, v.position, v.name, v.image_url, v.preview_url, "
+            "CAST(v.variants AS JSON) "
+            "FROM unnest(CAST(:ids AS INTEGER[]), CAST(:tier_ids AS INTEGER[]), "
+            "CAST(:positions AS DOUBLE PRECISION[]), CAST(:names AS VARCHAR[]), "
+            "CAST(:image_urls AS VARCHAR[]), CAST(:preview_urls AS VARCHAR[]), CAST(:variants AS TEXT[])) "
+            "AS v(id, tier_id, position, name, image_url, preview_url, variants)",
+            {
+                "tierlist_id": tierlist_id,
+                "ids": ids[start:start + IMPORT_INSERT_BATCH],
+                "tier_ids": [r["tier_id"] for r in batch],
+                "positions": [r["position"] for r in batch],
+                "names": [r["name"] for r in batch],
+                "image_urls": [r["image_url"] for r in batch],
+                "preview_urls": [r["preview_url"] for r in batch],
+                "variants": [
+                    json.dumps(r["variants"]) if r["variants"] is not None else None for r in batch
+                ],
+            },
+        )
+    return ids
+
+
+async def _place_at_end(db, tierlist_id: int, rows: list):
+    """Sets each row's position: every tier (and the unassigned row) continues after its last item."""
+    ends = {
+        r["tier_id"]: r["maxpos"]
+        for r in await db.fetch_all(
+            "SELECT tier_id, max(position) AS maxpos FROM items "
+            "WHERE tierlist_id = :tierlist_id GROUP BY tier_id",
+            {"tierlist_id": tierlist_id},
+        )
+    }
+    for row in rows:
+        tier_id = row["tier_id"]
+        row["position"] = ends[tier_id] + POSITION_GAP if ends.get(tier_id) is not None else 0.0
+        ends[tier_id] = row["position"]
+
+
+def _line(payload: dict) -> bytes:
+    return (json.dumps(payload, default=str) + "\n").encode()
+
+
+async def run_import(db, f, archive, plan, tierlist_id: int, tier_rows: list, default_tier_id):
+    """
+    Imports the entries of open_archive()'s plan, yielding NDJSON lines:
+      {"kind": "progress", "total", "stored", "processed"}   (repeatedly)
+      {"kind": "entry", "index", "file", "status": "ok" | "error", "item_id" | "error", ["warning"]}
+      {"kind": "done", "imported", "failed", "version"}  or  {"kind": "error", "error"}
+    The items are committed together with one "items_imported" change.
+    Closes the archive and `f`.
+    """
+    tasks = []
+    try:
+        results = [
+            {"kind": "entry", "index": index, "file": name, "status": "error"}
+            for index, (name, _) in enumerate(plan)
+        ]
+        stored = {}  # index -> (digest, path, is_new)
+        semaphore = asyncio.Semaphore(max(1, IMPORT_PARALLELISM))
+        last_report = 0.0
+
+        def progress(processed: int):
+            return _line({"kind": "progress", "total": len(plan), "stored": len(stored), "processed": processed})
+
+        # Members are read one at a time (archives aren't thread-safe) and
+        # in archive order, whatever order the manifest lists them in; the
+        # thumbnails of the ones already stored are rendered meanwhile
+        by_name = {}
+        for index in sorted(range(len(plan)), key=lambda i: archive.order(plan[i][0])):
+            name = plan[index][0]
+            try:
+                if name not in by_name:
+                    by_name[name] = await run_in_threadpool(_store_member, archive, name)
+                stored[index] = by_name[name]
+            except (ValueError, *MEMBER_ERRORS) as e:
+                results[index]["error"] = str(e)
+                continue
+            digest, path, _ = stored[index]
+            tasks.append(asyncio.ensure_future(derive_with_retries(semaphore, index, digest, path)))
+            if time.monotonic() - last_report >= IMPORT_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield progress(sum(t.done() for t in tasks))
+
+        derived = {}
+        processed = 0
+        for next_done in asyncio.as_completed(tasks):
+            index, result, error = await next_done
+            processed += 1
+            if error:
+                # The stored original is left to the sweeper (see images.py)
+                results[index]["error"] = error
+            else:
+                derived[index] = result
+            if time.monotonic() - last_report >= IMPORT_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield progress(processed)
+        yield progress(processed)
+
+        rows, indexes = [], []
+        for index, (name, meta) in enumerate(plan):
+            if index not in derived:
+                continue
+            tier_id, warning = _resolve_tier(meta, tier_rows, default_tier_id)
+            if warning:
+                results[index]["warning"] = warning
+            item_name = meta.get("name") or PurePosixPath(name).stem
+            rows.append(
+                {
+                    "tier_id": tier_id,
+                    "name": str(item_name)[:100],
+                    **item_image_fields(stored[index][1].name, derived[index]),
+                }
+            )
+            indexes.append(index)
+
+        version = None
+        if rows:
+            try:
+                async with db.transaction():
+                    # Holds off other writers of this tierlist until commit,
+                    # so nobody takes the positions picked here
+                    await db.execute(
+                        "SELECT id FROM tierlists WHERE id = :id FOR UPDATE",
+                        {"id": tierlist_id},
+                    )
+                    await _place_at_end(db, tierlist_id, rows)
+                    item_ids = await insert_items(db, tierlist_id, rows)
+                    version = await record_change(
+                        db, tierlist_id, "items_imported", {"count": len(item_ids)}
+                    )
+            except Exception as e:
+                # e.g. a tier deleted meanwhile; the stored files get swept
+                yield _line({"kind": "error", "error": f"Saving the items failed: {e}"})
+                return
+            for index, item_id in zip(indexes, item_ids):
+                results[index]["status"] = "ok"
+                results[index]["item_id"] = item_id
+
+        for result in results:
+            yield _line(result)
+        yield _line(
+            {
+                "kind": "done",
+                "imported": len(rows),
+                "failed": len(plan) - len(rows),
+                "version": version,
+            }
+        )
+    finally:
+        for task in tasks:
+            task.cancel()
+        await run_in_threadpool(archive.close)
+        await run_in_threadpool(f.close)
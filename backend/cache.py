@@ -0,0 +1,231 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from database import database as primary
+from models import items, tiers
+from hot_queries import TIERLIST_BY_ID, TIERS_BY_TIERLIST, hot_fetch_one, hot_fetch_all
+
+#######################
+# Configuration
+#######################
+
+# Upper bound on how stale a cached entry can get if an invalidation is lost
+CACHE_TTL = float(os.getenv("CACHE_TTL", 30))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+# id -> tierlist_id never changes while the row exists, so these live longer
+OWNER_CACHE_SIZE = int(os.getenv("OWNER_CACHE_SIZE", 50000))
+OWNER_CACHE_TTL = float(os.getenv("OWNER_CACHE_TTL", 3600))
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", 2000))
+# Explicit invalidations for data without a change log entry (see publish_invalidation)
+CACHE_CHANNEL = "cache_invalidate"
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping; least recently used entries fall out first, and every entry expires after `ttl` seconds."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self._data[key]
+        self.stats["misses"] += 1
+        return default
+
+    def put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def pop(self, key):
+        if self._data.pop(key, _MISSING) is not _MISSING:
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self.stats["invalidations"] += len(self._data)
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def snapshot_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hit_ratio": self.stats["hits"] / lookups if lookups else None,
+        }
+
+
+caches = {}
+
+
+def make_cache(name: str, maxsize: int, ttl: float) -> LRUCache:
+    cache = caches[name] = LRUCache(name, maxsize, ttl)
+    return cache
+
+
+# tierlist_id -> {id, name, creator_id, version}
+tierlist_meta = make_cache("tierlist_meta", CACHE_MAX_ENTRIES, CACHE_TTL)
+# tierlist_id -> newest version announced over NOTIFY; a row read with an
+# older version (e.g. from a lagging replica) is returned but not cached
+version_floor = make_cache("version_floor", CACHE_MAX_ENTRIES, CACHE_TTL * 2)
+# (tierlist_id, version) -> [tier, ...]
+tiers_by_version = make_cache("tiers", CACHE_MAX_ENTRIES, CACHE_TTL)
+item_owner = make_cache("item_owner", OWNER_CACHE_SIZE, OWNER_CACHE_TTL)
+tier_owner = make_cache("tier_owner", OWNER_CACHE_SIZE, OWNER_CACHE_TTL)
+# Rendered read responses, keyed by (endpoint, tierlist_id, version, ...):
+# a new version is a new key, so these never need to be invalidated per write
+payloads = make_cache("payloads", PAYLOAD_CACHE_SIZE, CACHE_TTL)
+
+
+#######################
+# Lookups
+#######################
+
+
+async def get_tierlist_meta(db, tierlist_id: int):
+    """Tierlist row (id, name, creator_id, version) or None; misses are not cached."""
+    meta = tierlist_meta.get(tierlist_id)
+    if meta is not None:
+        return meta
+    meta = await hot_fetch_one(db, TIERLIST_BY_ID, tierlist_id)
+    if meta is not None and meta["version"] >= version_floor.get(tierlist_id, 0):
+        tierlist_meta.put(tierlist_id, meta)
+    return meta
+
+
+async def db_at_version(db, tierlist_id: int, version: int):
+    """
+    `db` if its copy of the tierlist is at least at `version`, else the
+    primary. Versions come from the shared meta cache, which any worker may
+    have filled from the primary, while `db` can be a replica that hasn't
+    replayed that write yet: its rows must not be cached (and served) under
+    the newer version. Only costs a query on a replica.
+    """
+    if db is primary:
+        return db
+    row = await hot_fetch_one(db, TIERLIST_BY_ID, tierlist_id)
+    if row is None or row["version"] < version:
+        return primary
+    return db
+
+
+async def get_tiers(db, tierlist_id: int, version: int) -> list:
+    key = (tierlist_id, version)
+    rows = tiers_by_version.get(key)
+    if rows is None:
+        db = await db_at_version(db, tierlist_id, version)
+        rows = await hot_fetch_all(db, TIERS_BY_TIERLIST, tierlist_id)
+        tiers_by_version.put(key, rows)
+    return rows
+
+
+async def get_item_owner(db, item_id: int):
+    """tierlist_id of an item, or None if it doesn't exist."""
+    tierlist_id = item_owner.get(item_id)
+    if tierlist_id is None:
+        tierlist_id = await db.fetch_val(select(items.c.tierlist_id).where(items.c.id == item_id))
+        if tierlist_id is not None:
+            item_owner.put(item_id, tierlist_id)
+    return tierlist_id
+
+
+async def get_tier_owner(db, tier_id: int):
+    """tierlist_id of a tier, or None if it doesn't exist."""
+    tierlist_id = tier_owner.get(tier_id)
+    if tierlist_id is None:
+        tierlist_id = await db.fetch_val(select(tiers.c.tierlist_id).where(tiers.c.id == tier_id))
+        if tierlist_id is not None:
+            tier_owner.put(tier_id, tierlist_id)
+    return tierlist_id
+
+
+async def cached_payload(db, key: tuple, build):
+    """
+    Returns the cached response for `key` = (endpoint, tierlist_id, version, ...),
+    or awaits build(db) with a connection that has that version (db_at_version).
+    """
+    payload = payloads.get(key)
+    if payload is None:
+        payload = await build(await db_at_version(db, key[1], key[2]))
+        payloads.put(key, payload)
+    return payload
+
+
+#######################
+# Invalidation
+#######################
+
+
+def note_version(tierlist_id: int, version: int):
+    """Forgets the tierlist's cached row and refuses to cache anything older than `version`."""
+    tierlist_meta.pop(tierlist_id)
+    if version is not None and version > version_floor.get(tierlist_id, 0):
+        version_floor.put(tierlist_id, version)
+
+
+def handle_event(message: dict):
+    """
+    Hub listener for the tierlist change feed (realtime.CHANNEL), so every
+    worker drops what a write on any worker made stale.
+    """
+    tierlist_id = message.get("tierlist_id")
+    if tierlist_id is None:
+        # The LISTEN connection was down: anything may have changed
+        for cache in caches.values():
+            cache.clear()
+        return
+    note_version(tierlist_id, message.get("version"))
+    data = message.get("data") or {}
+    if message.get("kind") == "tier_deleted":
+        tier_owner.pop(data.get("tier_id"))
+    elif message.get("kind") == "reverted":
+        for tier_id in data.get("deleted_tier_ids", []):
+            tier_owner.pop(tier_id)
+
+
+def handle_invalidation(message: dict):
+    """Hub listener for CACHE_CHANNEL: {"cache": name, "key": key or null for all}."""
+    cache = caches.get(message.get("cache"))
+    if cache is None:
+        return
+    key = message.get("key")
+    if key is None:
+        cache.clear()
+    else:
+        # JSON turned tuple keys into lists
+        cache.pop(tuple(key) if isinstance(key, list) else key)
+
+
+async def publish_invalidation(db, cache_name: str, key=None):
+    """Drops a cache entry (or the whole cache) on every worker, this one included."""
+    handle_invalidation({"cache": cache_name, "key": key})
+    await db.execute(
+        "SELECT pg_notify(:channel, :payload)",
+        {"channel": CACHE_CHANNEL, "payload": json.dumps({"cache": cache_name, "key": key})},
+    )
+
+
+def cache_stats() -> dict:
+    return {name: cache.snapshot_stats() for name, cache in caches.items()}
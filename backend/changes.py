@@ -0,0 +1,103 @@
+from fastapi import Request, Response
+from sqlalchemy import select, insert, delete
+
+from models import tierlists, tierlist_changes, vote_counts
+from realtime import notify
+from cache import note_version
+from snapshots import snapshot_due, capture_snapshot
+
+# Changes older than this many versions are pruned; clients that are further
+# behind get a 410 and refetch the snapshot instead
+CHANGE_LOG_RETENTION = 1000
+PRUNE_EVERY = 100
+# Changes that leave the layout (what a snapshot holds) as it was
+VOTE_KINDS = {"votes_changed"}
+
+
+async def record_change(db, tierlist_id: int, kind: str, data: dict = None):
+    """
+    Bumps the tierlist's version, appends the delta to the change log and
+    NOTIFYs it to the live subscribers (see realtime.py).
+    Call it inside the same transaction as the mutation itself.
+    Returns the new version (None if the tierlist is gone).
+    """
+    version = await db.execute(
+        tierlists.update()
+        .where(tierlists.c.id == tierlist_id)
+        .values(version=tierlists.c.version + 1)
+        .returning(tierlists.c.version)
+    )
+    if version is None:
+        return None
+    # This worker stops serving the old version right away; the others
+    # follow when the NOTIFY below arrives (cache.handle_event)
+    note_version(tierlist_id, version)
+    await db.execute(
+        insert(tierlist_changes).values(
+            tierlist_id=tierlist_id, version=version, kind=kind, data=data
+        )
+    )
+    # Live push to every worker's subscribers (delivered on commit)
+    await notify(
+        db, {"tierlist_id": tierlist_id, "version": version, "kind": kind, "data": data}
+    )
+    # Decided without reading any state, so the vote flush never pays for it
+    if kind not in VOTE_KINDS and await snapshot_due(db, tierlist_id, version):
+        await capture_snapshot(db, tierlist_id, version)
+    if version % PRUNE_EVERY == 0:
+        await db.execute(
+            delete(tierlist_changes).where(
+                (tierlist_changes.c.tierlist_id == tierlist_id)
+                & (tierlist_changes.c.version <= version - CHANGE_LOG_RETENTION)
+            )
+        )
+    return version
+
+
+async def vote_counts_for_items(db, item_ids) -> dict:
+    """{item_id: {tier_id: count}} for the given items, read from the vote_counts table."""
+    if not item_ids:
+        return {}
+    rows = await db.fetch_all(
+        select(vote_counts.c.item_id, vote_counts.c.tier_id, vote_counts.c.count).where(
+            vote_counts.c.item_id.in_(list(item_ids)) & (vote_counts.c.count > 0)
+        )
+    )
+    counts = {}
+    for r in rows:
+        counts.setdefault(r["item_id"], {})[r["tier_id"]] = r["count"]
+    return counts
+
+
+async def fetch_changes(db, tierlist_id: int, since: int) -> list:
+    rows = await db.fetch_all(
+        select(tierlist_changes.c.version, tierlist_changes.c.kind, tierlist_changes.c.data)
+        .where(
+            (tierlist_changes.c.tierlist_id == tierlist_id)
+            & (tierlist_changes.c.version > since)
+        )
+        .order_by(tierlist_changes.c.version)
+    )
+    return [dict(r) for r in rows]
+
+
+def version_etag(tierlist_id: int, version: int, *variant) -> str:
+    """ETag for a read payload that only depends on the tierlist version (+ variant params)."""
+    suffix = "".join(f"-{v}" for v in variant)
+    return f'"tl{tierlist_id}-v{version}{suffix}"'
+
+
+def conditional(request: Request, response: Response, etag: str):
+    """
+    Sets the validator headers on `response`; returns a ready 304 Response if
+    the client already has this version, else None.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    ):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
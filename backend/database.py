@@ -1,4 +1,7 @@
+import asyncio
 import os
+import time
+
 from databases import Database
 from sqlalchemy import MetaData
 
@@ -8,11 +11,117 @@ DATABASE_URL = os.getenv(
     "postgresql+asyncpg://tierlord:supersecrettofumagic@db:5432/tierlist"
 )
 
-# Derive a purely synchronous URL for SQLAlchemy's create_engine()
-# by stripping off "+asyncpg"
+# Plain libpq-style URL (no "+asyncpg") for the dedicated asyncpg connections
+# of the migration runner and the realtime LISTENer
 SYNC_DATABASE_URL = DATABASE_URL.replace("+asyncpg", "")
 
-# The `database` object (async) for our endpoints
-database = Database(DATABASE_URL)
+#######################
+# Pool configuration
+#######################
+
+# Per worker process: N uvicorn workers open up to N * DB_POOL_MAX_SIZE
+# connections, keep that below Postgres' max_connections
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# How long a request waits for a free connection before it gets a 503
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 5))
+# Idle connections above min_size are closed after this many seconds
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+# asyncpg's per-connection prepared statement LRU (asyncpg default: 100).
+# Set to 0 behind pgbouncer in transaction mode, which can't do prepared statements.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 1024))
+# Statements running longer than this are cancelled (seconds, 0 = never)
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 30))
+# Opening a new connection
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 10))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within DB_POOL_ACQUIRE_TIMEOUT."""
+
+
+class InstrumentedPool:
+    """
+    Wraps the asyncpg pool `databases` creates: acquire() gets a timeout
+    (instead of waiting forever once the pool is exhausted) and the time
+    spent waiting for a connection is recorded. Everything else is passed
+    through to the real pool.
+    """
+
+    def __init__(self, pool, acquire_timeout: float):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.stats = {
+            "acquired": 0,
+            "timeouts": 0,
+            "waiting": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    async def acquire(self, timeout: float = None):
+        started = time.perf_counter()
+        self.stats["waiting"] += 1
+        try:
+            conn = await self._pool.acquire(timeout=timeout or self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise PoolTimeout()
+        finally:
+            self.stats["waiting"] -= 1
+        waited = time.perf_counter() - started
+        self.stats["acquired"] += 1
+        self.stats["total_wait_seconds"] += waited
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        return conn
+
+    async def release(self, conn, *args, **kwargs):
+        await self._pool.release(conn, *args, **kwargs)
+
+    def snapshot_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["avg_wait_seconds"] = (
+            stats["total_wait_seconds"] / stats["acquired"] if stats["acquired"] else None
+        )
+        return stats
+
+
+class PooledDatabase(Database):
+    """Database whose pool is wrapped in an InstrumentedPool once connected."""
+
+    async def connect(self):
+        await super().connect()
+        backend = self._backend
+        if getattr(backend, "_pool", None) is not None and not isinstance(
+            backend._pool, InstrumentedPool
+        ):
+            backend._pool = InstrumentedPool(backend._pool, DB_POOL_ACQUIRE_TIMEOUT)
+
+    @property
+    def pool(self):
+        return getattr(self._backend, "_pool", None)
+
+
+# Keyword arguments that go straight to asyncpg.create_pool()
+POOL_OPTIONS = dict(
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    command_timeout=DB_COMMAND_TIMEOUT or None,
+    timeout=DB_CONNECT_TIMEOUT,
+)
+
+# The `database` object (async) for our endpoints: the primary, all writes go here
+database = PooledDatabase(DATABASE_URL, **POOL_OPTIONS)
+
+# Optional streaming replica for read-only endpoints (see routing.py); unset
+# means every read goes to the primary as well
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL", "")
+replica = PooledDatabase(REPLICA_DATABASE_URL, **POOL_OPTIONS) if REPLICA_DATABASE_URL else None
+
 # `metadata` holds our table definitions
 metadata = MetaData()
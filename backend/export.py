@@ -0,0 +1,227 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from starlette.concurrency import run_in_threadpool
+
+from images import IMAGE_DIR, save_atomic, run_image_job
+
+
+#######################
+# Configuration
+#######################
+
+# Rendered exports, one PNG per (tierlist, version, options); outside
+# static/ so they are only served through the export endpoint
+EXPORT_DIR = Path("exports")
+EXPORT_WIDTH = int(os.getenv("EXPORT_WIDTH", 1200))
+# Item thumbnails are scaled to this height (from the stored previews)
+EXPORT_THUMB_HEIGHT = int(os.getenv("EXPORT_THUMB_HEIGHT", 96))
+EXPORT_LABEL_WIDTH = 140
+EXPORT_PADDING = 4
+# Exports of versions nobody asked for in this long are swept
+EXPORT_MAX_AGE = int(os.getenv("EXPORT_MAX_AGE", 24 * 3600))
+# Superseded versions are dropped once they weren't served for this long;
+# a response that picked one just before the new version got rendered
+# still finds it on disk
+EXPORT_PRUNE_GRACE = int(os.getenv("EXPORT_PRUNE_GRACE", 300))
+
+BACKGROUND = (26, 26, 26)
+ROW_BACKGROUND = (40, 40, 40)
+UNASSIGNED_COLOUR = "#555555"
+FALLBACK_COLOUR = (128, 128, 128)
+
+# (tierlist_id, version, variant) -> Future of the file being rendered, so
+# concurrent exports of the same version on this worker render it once
+_rendering = {}
+
+
+def export_path(tierlist_id: int, version: int, variant: str) -> Path:
+    return EXPORT_DIR / f"tierlist-{tierlist_id}-v{version}-{variant}.png"
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _colour(value: str) -> tuple:
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except (ValueError, AttributeError):
+        return FALLBACK_COLOUR
+
+
+def _text_colour(rgb: tuple) -> tuple:
+    r, g, b = rgb
+    return (0, 0, 0) if 0.299 * r + 0.587 * g + 0.114 * b > 150 else (255, 255, 255)
+
+
+def _fit_text(draw, text: str, font, width: int) -> str:
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _load_thumb(item: dict, height: int, font) -> Image.Image:
+    # Previews are already small; the originals are never decoded here
+    url = item.get("preview_url") or item.get("image_url") or ""
+    path = IMAGE_DIR / url.rsplit("/", 1)[-1]
+    try:
+        with Image.open(path) as img:
+            img.seek(0)
+            img = img.convert("RGBA")
+            img.thumbnail((height * 4, height))
+            return img
+    except (OSError, ValueError):
+        # Missing/undecodable file: a grey tile with the item name
+        tile = Image.new("RGBA", (height, height), (70, 70, 70, 255))
+        draw = ImageDraw.Draw(tile)
+        name = _fit_text(draw, item.get("name") or "?", font, height - 8)
+        draw.text((height // 2, height // 2), name, fill=(220, 220, 220), font=font, anchor="mm")
+        return tile
+
+
+def _layout_row(thumbs: list, width: int) -> list:
+    """Splits thumbnails into lines of at most `width` pixels: [[(x, thumb), ...], ...]."""
+    lines, line, x = [], [], EXPORT_PADDING
+    for thumb in thumbs:
+        if line and x + thumb.width + EXPORT_PADDING > width:
+            lines.append(line)
+            line, x = [], EXPORT_PADDING
+        line.append((x, thumb))
+        x += thumb.width + EXPORT_PADDING
+    if line:
+        lines.append(line)
+    return lines or [[]]
+
+
+def render_tierlist_png(title: str, rows: list, path: Path) -> Path:
+    """
+    Draws the tierlist into `path`: a title bar, then one band per row with
+    a coloured label column and the item previews wrapped onto as many
+    lines as needed. `rows` is [(label, colour, [item, ...]), ...] in order.
+    Runs in the image pool (see render_export).
+    """
+    thumb_h = EXPORT_THUMB_HEIGHT
+    line_h = thumb_h + EXPORT_PADDING
+    grid_w = EXPORT_WIDTH - EXPORT_LABEL_WIDTH
+    label_font = _font(max(12, thumb_h // 4))
+    title_font = _font(max(16, thumb_h // 3))
+    tile_font = _font(12)
+
+    bands = []
+    for label, colour, row_items in rows:
+        thumbs = [_load_thumb(item, thumb_h, tile_font) for item in row_items]
+        bands.append((label, _colour(colour), _layout_row(thumbs, grid_w)))
+
+    title_h = thumb_h // 2 + 2 * EXPORT_PADDING
+    height = title_h + sum(len(lines) * line_h + EXPORT_PADDING for _, _, lines in bands)
+    canvas = Image.new("RGB", (EXPORT_WIDTH, height), BACKGROUND)
+    draw = ImageDraw.Draw(canvas)
+    draw.text(
+        (EXPORT_WIDTH // 2, title_h // 2),
+        _fit_text(draw, title, title_font, EXPORT_WIDTH - 2 * EXPORT_PADDING),
+        fill=(255, 255, 255),
+        font=title_font,
+        anchor="mm",
+    )
+
+    y = title_h
+    for label, rgb, lines in bands:
+        band_h = len(lines) * line_h + EXPORT_PADDING
+        draw.rectangle((0, y, EXPORT_LABEL_WIDTH - 1, y + band_h - 1), fill=rgb)
+        draw.rectangle((EXPORT_LABEL_WIDTH, y, EXPORT_WIDTH - 1, y + band_h - 1), fill=ROW_BACKGROUND)
+        draw.text(
+            (EXPORT_LABEL_WIDTH // 2, y + band_h // 2),
+            _fit_text(draw, label, label_font, EXPORT_LABEL_WIDTH - 2 * EXPORT_PADDING),
+            fill=_text_colour(rgb),
+            font=label_font,
+            anchor="mm",
+        )
+        for index, line in enumerate(lines):
+            top = y + EXPORT_PADDING + index * line_h
+            for x, thumb in line:
+                canvas.paste(thumb, (EXPORT_LABEL_WIDTH + x, top), thumb)
+        y += band_h
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    save_atomic(canvas, path, "PNG", optimize=True)
+    _prune_versions(path)
+    return path
+
+
+def _prune_versions(path: Path) -> None:
+    # Older versions of the same export are never asked for again once
+    # they're past the grace period; a newer one rendered meanwhile by
+    # another worker is left alone
+    stem, version, variant = path.stem.rsplit("-", 2)
+    cutoff = time.time() - EXPORT_PRUNE_GRACE
+    for other in path.parent.glob(f"{stem}-v*-{variant}.png"):
+        other_version = other.stem.rsplit("-", 2)[1]
+        if not (other_version[1:].isdigit() and int(other_version[1:]) < int(version[1:])):
+            continue
+        try:
+            if other.stat().st_mtime < cutoff:
+                other.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def render_export(tierlist_id: int, version: int, variant: str, load) -> Path:
+    """
+    Path of the rendered export for this version. If no worker rendered it
+    yet, awaits load() -> (title, rows) and renders it in the image pool;
+    load() has to read rows that are at `version` (see cache.db_at_version).
+    Raises images.ImageQueueFull when the pool is saturated.
+    """
+    path = export_path(tierlist_id, version, variant)
+    if await run_in_threadpool(_touch, path):
+        return path
+    key = (tierlist_id, version, variant)
+    pending = _rendering.get(key)
+    if pending is None:
+
+        async def render():
+            title, rows = await load()
+            return await run_image_job(render_tierlist_png, title, rows, path)
+
+        pending = _rendering[key] = asyncio.ensure_future(render())
+        pending.add_done_callback(lambda _: _rendering.pop(key, None))
+    return await asyncio.shield(pending)
+
+
+def _touch(path: Path) -> bool:
+    # A hit restarts the file's EXPORT_MAX_AGE
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _sweep_exports(max_age: int) -> list:
+    removed = []
+    cutoff = time.time() - max_age
+    for path in EXPORT_DIR.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed.append(path.name)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def sweep_exports(max_age: int = EXPORT_MAX_AGE) -> list:
+    """Deletes exports older than `max_age` seconds (e.g. of deleted tierlists)."""
+    if not EXPORT_DIR.exists():
+        return []
+    return await run_in_threadpool(_sweep_exports, max_age)
@@ -0,0 +1,61 @@
+# Forking copies a tierlist with a fixed number of set-based statements,
+# whatever its size. Items keep their image_url / preview_url / variants,
+# so the copy shares the stored files (they are content-addressed and
+# reference counted by the sweeper, see images.py) instead of re-uploading.
+
+# New tier ids are drawn from the sequence up front, which gives the
+# old -> new mapping the item copy needs
+ALLOCATE_TIER_IDS = (
+    "SELECT id AS old_id, nextval(pg_get_serial_sequence('tiers', 'id')) AS new_id "
+    "FROM tiers WHERE tierlist_id = :source_id ORDER BY position, id"
+)
+
+INSERT_TIERLIST = (
+    "INSERT INTO tierlists (name, creator_id) VALUES (:name, :creator_id) RETURNING id"
+)
+
+COPY_TIERS = (
+    "INSERT INTO tiers (id, tierlist_id, name, colour, position) "
+    "SELECT m.new_id, :target_id, t.name, t.colour, t.position "
+    "FROM unnest(CAST(:old_ids AS INTEGER[]), CAST(:new_ids AS INTEGER[])) AS m(old_id, new_id) "
+    "JOIN tiers t ON t.id = m.old_id "
+    "RETURNING id, tierlist_id, name, colour, position"
+)
+
+COPY_ITEMS = (
+    "INSERT INTO items (tierlist_id, tier_id, position, name, image_url, preview_url, variants) "
+    "SELECT :target_id, m.new_id, i.position, i.name, i.image_url, i.preview_url, i.variants "
+    "FROM items i "
+    "LEFT JOIN unnest(CAST(:old_ids AS INTEGER[]), CAST(:new_ids AS INTEGER[])) AS m(old_id, new_id) "
+    "ON m.old_id = i.tier_id "
+    "WHERE i.tierlist_id = :source_id "
+    "ORDER BY i.tier_id, i.position, i.id"
+)
+
+
+async def fork_tierlist(db, source_id: int, creator_id: str, name: str) -> dict:
+    """
+    Copies the tierlist's tiers and items (not its votes or history) into a
+    new tierlist owned by `creator_id`, in one transaction.
+    Returns {"tierlist_id", "tier_ids": {old: new}, "tiers": [...], "item_count"}.
+    """
+    # Every statement reads the same snapshot of the source, so the tier
+    # mapping and the item copy agree even while it's being edited; the
+    # source is only read, so this never fails on a serialization conflict
+    async with db.transaction(isolation="repeatable_read"):
+        mapping = await db.fetch_all(ALLOCATE_TIER_IDS, {"source_id": source_id})
+        old_ids = [r["old_id"] for r in mapping]
+        new_ids = [r["new_id"] for r in mapping]
+        target_id = await db.execute(INSERT_TIERLIST, {"name": name, "creator_id": creator_id})
+        mapped = {"target_id": target_id, "old_ids": old_ids, "new_ids": new_ids}
+        copied_tiers = await db.fetch_all(COPY_TIERS, mapped)
+        copied = await db.fetch_val(
+            f"WITH copied AS ({COPY_ITEMS} RETURNING 1) SELECT count(*) FROM copied",
+            {**mapped, "source_id": source_id},
+        )
+    return {
+        "tierlist_id": target_id,
+        "tier_ids": dict(zip(old_ids, new_ids)),
+        "tiers": sorted((dict(r) for r in copied_tiers), key=lambda t: (t["position"], t["id"])),
+        "item_count": copied,
+    }
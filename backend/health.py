@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+
+from images import image_stats
+from migrations import migration_status
+
+# Probes within this many seconds of each other share one check
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", 2))
+# A database that can't hand out a connection and answer SELECT 1 within
+# this long is reported as not ready
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", 2))
+
+
+def pool_stats(db) -> dict:
+    """Size / idle / in-use of the asyncpg pool behind a `databases.Database`."""
+    pool = db.pool
+    if pool is None:
+        return {"connected": False}
+    size, idle = pool.get_size(), pool.get_idle_size()
+    return {
+        "connected": True,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+        # acquire wait times / timeouts, see database.InstrumentedPool
+        **pool.snapshot_stats(),
+    }
+
+
+class HealthProbe:
+    """
+    Readiness report for orchestrator probes. The database is pinged through
+    the running pool (never a fresh connection), and the whole report is
+    cached for HEALTH_CACHE_SECONDS, with concurrent probes awaiting the same
+    check, so probing is close to free.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._sections = {}  # name -> callable returning a dict, e.g. vote stats
+        self._lock = asyncio.Lock()
+        self._report = None
+        self._checked_at = 0.0
+
+    def add_section(self, name: str, fn):
+        self._sections[name] = fn
+
+    async def _ping(self) -> dict:
+        pool = self.db.pool
+        if pool is None:
+            return {"ok": False, "error": "not connected"}
+        started = time.perf_counter()
+        try:
+            conn = await pool.acquire(timeout=HEALTH_DB_TIMEOUT)
+            try:
+                acquired = time.perf_counter()
+                await conn.fetchval("SELECT 1", timeout=HEALTH_DB_TIMEOUT)
+            finally:
+                await pool.release(conn)
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+        done = time.perf_counter()
+        return {
+            "ok": True,
+            "acquire_ms": round((acquired - started) * 1000, 2),
+            "query_ms": round((done - acquired) * 1000, 2),
+        }
+
+    async def _check(self) -> dict:
+        database = await self._ping()
+        migrations = migration_status()
+        report = {
+            "status": "OK" if database["ok"] and migrations["current"] else "unavailable",
+            "database": database,
+            "pool": pool_stats(self.db),
+            "migrations": migrations,
+            "images": image_stats(),
+        }
+        for name, fn in self._sections.items():
+            report[name] = fn()
+        return report
+
+    async def ready(self):
+        """(ready, report); the report is at most HEALTH_CACHE_SECONDS old."""
+        async with self._lock:
+            now = time.monotonic()
+            if self._report is None or now - self._checked_at >= HEALTH_CACHE_SECONDS:
+                self._report = await self._check()
+                self._checked_at = time.monotonic()
+            report = self._report
+        age = time.monotonic() - self._checked_at
+        return report["status"] == "OK", {**report, "age_seconds": round(age, 3)}
@@ -0,0 +1,74 @@
+import json
+
+# Queries on the request hot path, written as plain asyncpg SQL and run on the
+# raw connection, skipping SQLAlchemy compilation per call. Preparing is left
+# to asyncpg's own per-connection statement cache (DB_STATEMENT_CACHE_SIZE in
+# database.py): it lives exactly as long as the connection, so a statement is
+# never used on a connection it doesn't belong to, and a cache size of 0
+# (pgbouncer in transaction mode) sends the SQL unnamed.
+HOT_QUERIES = {}
+
+
+def hot_query(name: str, sql: str) -> str:
+    HOT_QUERIES[name] = sql
+    return name
+
+
+TIERLIST_BY_ID = hot_query(
+    "tierlist_by_id",
+    "SELECT id, name, creator_id, version FROM tierlists WHERE id = $1",
+)
+TIERS_BY_TIERLIST = hot_query(
+    "tiers_by_tierlist",
+    "SELECT id, tierlist_id, name, colour, position FROM tiers "
+    "WHERE tierlist_id = $1 ORDER BY position",
+)
+ITEMS_BY_TIERLIST = hot_query(
+    "items_by_tierlist",
+    "SELECT id, tierlist_id, tier_id, position, name, image_url, preview_url, variants "
+    "FROM items WHERE tierlist_id = $1 ORDER BY tier_id, position, id",
+)
+# Validated votes are written with one statement per batch. The joins drop
+# votes whose item/tier disappeared after validation (stale cache) instead of
+# failing the whole batch on a foreign key.
+UPSERT_VOTES = hot_query(
+    "upsert_votes",
+    "INSERT INTO votes (user_id, item_id, tier_id) "
+    "SELECT v.user_id, v.item_id, v.tier_id "
+    "FROM unnest(CAST($1 AS VARCHAR[]), CAST($2 AS INTEGER[]), CAST($3 AS INTEGER[])) "
+    "AS v(user_id, item_id, tier_id) "
+    "JOIN items ON items.id = v.item_id "
+    "JOIN tiers ON tiers.id = v.tier_id AND tiers.tierlist_id = items.tierlist_id "
+    "ON CONFLICT (user_id, item_id) DO UPDATE SET tier_id = EXCLUDED.tier_id",
+)
+
+# Raw asyncpg hands JSON columns back as text
+_JSON_COLUMNS = {"variants"}
+
+
+def _row(record) -> dict:
+    row = dict(record)
+    for column in _JSON_COLUMNS & row.keys():
+        if isinstance(row[column], str):
+            row[column] = json.loads(row[column])
+    return row
+
+
+async def _run(db, method: str, name: str, args):
+    # db.connection() is the caller's connection, so this joins an open transaction
+    async with db.connection() as connection:
+        raw = connection.raw_connection
+        return await getattr(raw, method)(HOT_QUERIES[name], *args)
+
+
+async def hot_fetch_all(db, name: str, *args) -> list:
+    return [_row(r) for r in await _run(db, "fetch", name, args)]
+
+
+async def hot_fetch_one(db, name: str, *args):
+    record = await _run(db, "fetchrow", name, args)
+    return _row(record) if record is not None else None
+
+
+async def hot_execute(db, name: str, *args):
+    await _run(db, "execute", name, args)
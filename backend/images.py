@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from models import items
+
+
+#######################
+# Configuration
+#######################
+
+IMAGE_DIR = Path("static/images")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Decode/thumbnail work runs in this bounded pool, never on the event loop
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 2))
+# Max jobs waiting + running before new uploads get a 503
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", 64))
+PREVIEW_HEIGHT = 256
+# Widths (px) of the srcset derivatives generated for every upload
+IMAGE_DERIVATIVE_WIDTHS = sorted(
+    int(w) for w in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "160,320,640,1280").split(",") if w.strip()
+)
+# "webp" always works; add "avif" if this Pillow build (or pillow-avif-plugin) can write it
+IMAGE_DERIVATIVE_FORMATS = [
+    f.strip().lower() for f in os.getenv("IMAGE_DERIVATIVE_FORMATS", "webp").split(",") if f.strip()
+]
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+# Unreferenced files are only swept once they are at least this old, so an
+# upload that is still on its way into the items table never gets deleted
+IMAGE_SWEEP_GRACE = int(os.getenv("IMAGE_SWEEP_GRACE", 3600))
+# pg_advisory_xact_lock key; one worker at a time scans the items table
+IMAGE_SWEEP_LOCK_ID = 7_240_002
+# Written after every sweep, so the other workers skip their turn
+SWEEP_STAMP = ".sweep-stamp"
+
+
+def _format_supported(fmt: str) -> bool:
+    if fmt == "avif":
+        try:
+            import pillow_avif  # noqa: F401  (AVIF plugin for Pillow < 11.2)
+        except ImportError:
+            pass
+    Image.init()
+    return fmt.upper() in Image.SAVE
+
+
+DERIVATIVE_FORMATS = [f for f in IMAGE_DERIVATIVE_FORMATS if _format_supported(f)]
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+# Counters are touched from the event loop and the pool threads
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,
+    "running": 0,
+    "processed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "total_seconds": 0.0,
+    "last_seconds": None,
+    "max_seconds": 0.0,
+}
+
+
+class ImageQueueFull(Exception):
+    """Raised when the image pool already has IMAGE_QUEUE_LIMIT jobs pending."""
+
+
+async def store_upload(upload, directory: Path, ext: str):
+    """
+    Streams an UploadFile into content-addressed storage: the bytes go to a
+    temp file in UPLOAD_CHUNK_SIZE chunks (blocking I/O in the threadpool)
+    while being hashed, then the file is renamed to "{sha256}{ext}". If that
+    file already exists the copy is dropped and the existing one reused.
+    Returns (digest, path, is_new).
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f".incoming-{uuid4().hex}"
+    digest = hashlib.sha256()
+    f = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    await run_in_threadpool(f.close)
+    return await run_in_threadpool(_commit_stored, tmp_path, directory, digest.hexdigest(), ext)
+
+
+def store_fileobj(f, directory: Path, ext: str, max_bytes: int = None):
+    """
+    store_upload for a blocking file object, e.g. an archive member: same
+    chunked copy + hash + content-addressed rename. Run it in a thread.
+    Raises ValueError once more than `max_bytes` were read.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f".incoming-{uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"File is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return _commit_stored(tmp_path, directory, digest.hexdigest(), ext)
+
+
+def _commit_stored(tmp_path: Path, directory: Path, digest: str, ext: str):
+    path = directory / f"{digest}{ext}"
+    if path.exists():
+        tmp_path.unlink(missing_ok=True)
+        # Fresh mtime so the sweeper's grace period starts over for a re-upload
+        os.utime(path)
+        return digest, path, False
+    os.replace(tmp_path, path)
+    return digest, path, True
+
+
+def _timed(fn, *args):
+    with _stats_lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+    started = time.perf_counter()
+    ok = False
+    try:
+        result = fn(*args)
+        ok = True
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["processed" if ok else "failed"] += 1
+            _stats["total_seconds"] += elapsed
+            _stats["last_seconds"] = elapsed
+            _stats["max_seconds"] = max(_stats["max_seconds"], elapsed)
+
+
+async def run_image_job(fn, *args):
+    """Runs a CPU-heavy image function in the bounded image pool."""
+    with _stats_lock:
+        if _stats["queued"] + _stats["running"] >= IMAGE_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise ImageQueueFull()
+        _stats["queued"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed, fn, *args)
+
+
+def _load_for_resize(original_path: Path) -> Image.Image:
+    with Image.open(original_path) as img:
+        img.seek(0)  # first frame of animations
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA") or (
+            img.mode == "P" and "transparency" in img.info
+        )
+        return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def save_atomic(img: Image.Image, path: Path, fmt: str, **params) -> None:
+    # Readers (and concurrent identical uploads) never see a half-written file
+    tmp_path = path.with_name(f".{path.name}.{uuid4().hex}")
+    try:
+        img.save(tmp_path, fmt, **params)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _derivative_config() -> dict:
+    return {
+        "preview_height": PREVIEW_HEIGHT,
+        "widths": IMAGE_DERIVATIVE_WIDTHS,
+        "formats": DERIVATIVE_FORMATS,
+        "quality": IMAGE_QUALITY,
+    }
+
+
+def _config_tag() -> str:
+    # Part of every derivative filename: changing sizes/quality yields new
+    # names, so files served as immutable never change under the same URL
+    config = json.dumps(_derivative_config(), sort_keys=True).encode()
+    return hashlib.sha1(config).hexdigest()[:8]
+
+
+def make_derivatives(original_path: Path, stem: str) -> dict:
+    """
+    Decodes the original once and writes, next to it,
+      {stem}_preview-{tag}.webp    (PREVIEW_HEIGHT high, for the item cards)
+      {stem}_{width}w-{tag}.{fmt}  (one per IMAGE_DERIVATIVE_WIDTHS x format)
+    where {tag} identifies the derivative settings (see _config_tag).
+    Widths above the original are skipped (never upscale); if the original is
+    smaller than every configured width it gets one derivative at its own width.
+    Returns {"preview": <filename>, "variants": [{file, width, height, format}, ...]}.
+
+    `stem` is the content hash, so the result is also written to
+    {stem}_manifest.json and an identical upload later on skips all of this.
+    """
+    directory = original_path.parent
+    manifest_path = directory / f"{stem}_manifest.json"
+    try:
+        manifest = json.loads(manifest_path.read_text())
+        files = [manifest["preview"]] + [v["file"] for v in manifest["variants"]]
+        if manifest["config"] == _derivative_config() and all(
+            (directory / name).exists() for name in files
+        ):
+            for name in files + [manifest_path.name]:
+                os.utime(directory / name)
+            return {"preview": manifest["preview"], "variants": manifest["variants"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    base = _load_for_resize(original_path)
+
+    preview = base.copy()
+    preview.thumbnail((9999, PREVIEW_HEIGHT))
+    tag = _config_tag()
+    preview_name = f"{stem}_preview-{tag}.webp"
+    save_atomic(preview, directory / preview_name, "WEBP", quality=IMAGE_QUALITY)
+
+    widths = [w for w in IMAGE_DERIVATIVE_WIDTHS if w < base.width] or [base.width]
+    variants = []
+    # Resize largest -> smallest, each step from the previous one (cheaper)
+    current = base
+    for width in sorted(widths, reverse=True):
+        height = max(1, round(base.height * width / base.width))
+        if current.size != (width, height):
+            current = current.resize((width, height), Image.LANCZOS)
+        for fmt in DERIVATIVE_FORMATS:
+            name = f"{stem}_{width}w-{tag}.{fmt}"
+            save_atomic(current, directory / name, fmt.upper(), quality=IMAGE_QUALITY)
+            variants.append({"file": name, "width": width, "height": height, "format": fmt})
+    variants.sort(key=lambda v: (v["format"], v["width"]))
+
+    result = {"preview": preview_name, "variants": variants}
+    tmp_manifest = manifest_path.with_name(f".{manifest_path.name}.{uuid4().hex}")
+    tmp_manifest.write_text(json.dumps({**result, "config": _derivative_config()}))
+    os.replace(tmp_manifest, manifest_path)
+    return result
+
+
+def item_image_fields(original_name: str, derived: dict) -> dict:
+    """items columns (image_url, preview_url, variants) for a stored original + make_derivatives result."""
+    return {
+        "image_url": f"/static/images/{original_name}",
+        "preview_url": f"/static/images/{derived['preview']}",
+        "variants": [
+            {
+                "url": f"/static/images/{v['file']}",
+                "width": v["width"],
+                "height": v["height"],
+                "format": v["format"],
+            }
+            for v in derived["variants"]
+        ],
+    }
+
+
+def _storage_key(filename: str) -> str:
+    # "<hash>.png", "<hash>_preview-<tag>.webp", "<hash>_640w-<tag>.avif" -> "<hash>"
+    return filename.split("_", 1)[0].split(".", 1)[0]
+
+
+async def image_refcounts(db) -> dict:
+    """Number of items pointing at each stored image (keyed by storage key)."""
+    counts = {}
+    async for row in db.iterate(select(items.c.image_url, items.c.preview_url)):
+        keys = {
+            _storage_key(url.rsplit("/", 1)[-1])
+            for url in (row["image_url"], row["preview_url"])
+            if url
+        }
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _sweep_files(directory: Path, referenced: set, grace: int) -> list:
+    removed = []
+    cutoff = time.time() - grace
+    for path in directory.iterdir():
+        if not path.is_file() or path.name == SWEEP_STAMP:
+            continue
+        # Leftover temp files from crashed uploads are swept too
+        key = path.name if path.name.startswith(".") else _storage_key(path.name)
+        if key in referenced:
+            continue
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+            path.unlink()
+            removed.append(path.name)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _swept_since(directory: Path, seconds: float) -> bool:
+    try:
+        return (directory / SWEEP_STAMP).stat().st_mtime > time.time() - seconds
+    except FileNotFoundError:
+        return False
+
+
+def _stamp(directory: Path) -> None:
+    (directory / SWEEP_STAMP).touch()
+
+
+async def sweep_unreferenced_images(db, grace: int = IMAGE_SWEEP_GRACE, interval: float = 0) -> list:
+    """
+    Deletes originals + derivatives in IMAGE_DIR that no item references any
+    more (refcount 0) and that are older than `grace` seconds. Only one
+    worker sweeps at a time, and none when another one swept within the
+    last `interval` seconds. Returns the removed filenames.
+    """
+    if not IMAGE_DIR.exists():
+        return []
+    # The transaction pins one connection for the transaction-scoped lock
+    async with db.transaction():
+        locked = await db.fetch_val(
+            "SELECT pg_try_advisory_xact_lock(:key)", {"key": IMAGE_SWEEP_LOCK_ID}
+        )
+        if not locked or await run_in_threadpool(_swept_since, IMAGE_DIR, interval):
+            return []
+        referenced = {key for key, count in (await image_refcounts(db)).items() if count > 0}
+        removed = await run_in_threadpool(_sweep_files, IMAGE_DIR, referenced, grace)
+        await run_in_threadpool(_stamp, IMAGE_DIR)
+    return removed
+
+
+def image_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    finished = stats["processed"] + stats["failed"]
+    return {
+        "workers": IMAGE_WORKERS,
+        "queue_limit": IMAGE_QUEUE_LIMIT,
+        "queue_depth": stats["queued"],
+        "running": stats["running"],
+        "processed": stats["processed"],
+        "failed": stats["failed"],
+        "rejected": stats["rejected"],
+        "avg_seconds": stats["total_seconds"] / finished if finished else None,
+        "last_seconds": stats["last_seconds"],
+        "max_seconds": stats["max_seconds"],
+    }
+
+
+def shutdown_pool() -> None:
+    _executor.shutdown(wait=False)
@@ -0,0 +1,96 @@
+import re
+
+import asyncpg
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from database import SYNC_DATABASE_URL, metadata
+
+# A plain CREATE INDEX blocks all writes to the table for the whole build, so
+# indexes are built with CREATE INDEX CONCURRENTLY: one index at a time,
+# outside any transaction, writes keep flowing (see migrations.py).
+
+# Databases from before the unique vote constraint may hold duplicates, which
+# have to go before it can be built
+DEDUP_VOTES = (
+    "DELETE FROM votes a USING votes b WHERE a.user_id = b.user_id "
+    "AND a.item_id = b.item_id AND a.id < b.id"
+)
+UNIQUE_VOTES_INDEX = (
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_votes_user_item "
+    "ON votes (user_id, item_id)"
+)
+# Extensions the declared indexes depend on (pg_trgm is a trusted extension
+# since Postgres 13, so the database owner may create it)
+REQUIRED_EXTENSIONS = ("pg_trgm",)
+_CREATE = re.compile(r"^CREATE (UNIQUE )?INDEX ")
+
+
+def concurrent_index_ddl(index) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+    return _CREATE.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX CONCURRENTLY ", ddl, count=1)
+
+
+def schema_indexes() -> list:
+    """(name, ddl) for every named index declared in models.py."""
+    return [
+        (index.name, concurrent_index_ddl(index))
+        for table in metadata.sorted_tables
+        for index in sorted(table.indexes, key=lambda i: i.name)
+        # the ix_<table>_id ones from index=True came with the tables themselves
+        if index.name and index.name != f"ix_{table.name}_id"
+    ]
+
+
+async def _drop_invalid(conn, name: str) -> bool:
+    # An interrupted CONCURRENTLY build leaves an INVALID index behind, which
+    # IF NOT EXISTS would happily skip forever
+    invalid = await conn.fetchval(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = $1 AND NOT i.indisvalid",
+        name,
+    )
+    if invalid:
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+    return bool(invalid)
+
+
+async def build_concurrently(conn, statements, log=print) -> list:
+    """
+    Builds each missing (or invalid) index of `statements`, a list of
+    (name, ddl), on an asyncpg connection that is NOT inside a transaction,
+    without taking write-blocking locks. Safe to re-run. Returns the names of
+    the indexes it built.
+    """
+    built = []
+    for name, ddl in statements:
+        existed = await conn.fetchval("SELECT 1 FROM pg_class WHERE relname = $1", name)
+        if await _drop_invalid(conn, name):
+            log(f"{name}: dropped invalid leftover")
+            existed = None
+        if existed:
+            continue
+        if name == "uq_votes_user_item":
+            deleted = await conn.execute(DEDUP_VOTES)
+            log(f"{name}: removed duplicate votes ({deleted})")
+        log(f"{name}: building")
+        await conn.execute(ddl)
+        built.append(name)
+    return built
+
+
+async def build_indexes(conn, log=print) -> list:
+    """build_concurrently() for every index declared in models.py."""
+    for extension in REQUIRED_EXTENSIONS:
+        await conn.execute(f"CREATE EXTENSION IF NOT EXISTS {extension}")
+    statements = [("uq_votes_user_item", UNIQUE_VOTES_INDEX)] + schema_indexes()
+    return await build_concurrently(conn, statements, log)
+
+
+async def create_indexes_concurrently(dsn: str = SYNC_DATABASE_URL, log=print) -> list:
+    """build_indexes() on a connection of its own."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        return await build_indexes(conn, log)
+    finally:
+        await conn.close()
@@ -0,0 +1,90 @@
+import base64
+import hashlib
+import json
+
+from sqlalchemy import select, func
+
+from models import tierlists, items, vote_counts
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise InvalidCursor(cursor)
+    return last_id
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def fetch_tierlist_page(
+    db,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    creator_id: str = None,
+    q: str = None,
+    include_counts: bool = False,
+) -> dict:
+    """
+    One page of tierlists, newest first, as
+      { "tierlists": [ { "id", "name", "creator_id", "version",
+                         "item_count", "vote_count" (with include_counts) } ],
+        "next_cursor": <opaque string, or null on the last page> }
+    Keyset pagination on id (WHERE id < last seen id), so every page costs
+    the same index range scan no matter how deep it is or how big the
+    catalogue grows. `creator_id` uses ix_tierlists_creator_id, `q` (case
+    insensitive substring) the trigram index. The counts are correlated
+    subqueries in the same statement: items via the tierlist index, votes
+    summed from the vote_counts counters.
+    """
+    columns = [tierlists.c.id, tierlists.c.name, tierlists.c.creator_id, tierlists.c.version]
+    if include_counts:
+        columns.append(
+            select(func.count())
+            .select_from(items)
+            .where(items.c.tierlist_id == tierlists.c.id)
+            .scalar_subquery()
+            .label("item_count")
+        )
+        columns.append(
+            select(func.coalesce(func.sum(vote_counts.c.count), 0))
+            .select_from(vote_counts.join(items, items.c.id == vote_counts.c.item_id))
+            .where(items.c.tierlist_id == tierlists.c.id)
+            .scalar_subquery()
+            .label("vote_count")
+        )
+    query = select(*columns)
+    if cursor:
+        query = query.where(tierlists.c.id < decode_cursor(cursor))
+    if creator_id:
+        query = query.where(tierlists.c.creator_id == creator_id)
+    if q:
+        query = query.where(tierlists.c.name.ilike(f"%{_escape_like(q)}%", escape="\\"))
+    # One extra row tells whether there is a next page
+    rows = await db.fetch_all(query.order_by(tierlists.c.id.desc()).limit(limit + 1))
+
+    page = [dict(r) for r in rows[:limit]]
+    next_cursor = encode_cursor(page[-1]["id"]) if len(rows) > limit else None
+    return {"tierlists": page, "next_cursor": next_cursor}
+
+
+def page_etag(page: dict) -> str:
+    # Versions are part of the rows, so any change on the page changes the tag
+    digest = hashlib.sha1(json.dumps(page, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"tls-{digest[:20]}"'
@@ -1,7 +1,6 @@
+import asyncio
 import os
-import time
 from pathlib import Path
-from uuid import uuid4
 
 from fastapi import (
     FastAPI,
@@ -12,14 +11,19 @@ from fastapi import (
     Body,
     Depends,
     Request,
+    Query,
     Path as FPath,
 )
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy import (
-    create_engine,
     select,
     insert,
     delete,
@@ -28,10 +32,87 @@ from sqlalchemy import (
     func,
 )
 from authlib.integrations.starlette_client import OAuth
-from PIL import Image
 
-from database import database, metadata, SYNC_DATABASE_URL
+from database import database, PoolTimeout
+from routing import router as replica_router, read_database, StickyPrimaryMiddleware
+from hot_queries import ITEMS_BY_TIERLIST, TIERS_BY_TIERLIST, hot_fetch_all
+from cache import (
+    CACHE_CHANNEL,
+    get_tierlist_meta,
+    get_tiers,
+    get_item_owner,
+    get_tier_owner,
+    cached_payload,
+    db_at_version,
+    tier_owner,
+    handle_event as invalidate_cached,
+    handle_invalidation,
+    cache_stats,
+)
 from models import tierlists, tiers, items, votes
+from tally import fetch_vote_tallies, fetch_vote_counts, vote_stats
+from serving import CachedStaticFiles, serve_file
+from changes import (
+    record_change,
+    fetch_changes,
+    version_etag,
+    conditional,
+)
+from realtime import hub, sse_event, KEEPALIVE_SECONDS
+from vote_ingest import VoteIngestor, VOTE_DURABILITY
+from images import (
+    IMAGE_DIR,
+    ImageQueueFull,
+    store_upload,
+    sweep_unreferenced_images,
+    run_image_job,
+    make_derivatives,
+    item_image_fields,
+    image_stats,
+    shutdown_pool,
+)
+from export import UNASSIGNED_COLOUR, render_export, sweep_exports
+from ordering import (
+    position_between,
+    initial_positions,
+    rebalance_items,
+)
+from listing import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    InvalidCursor,
+    fetch_tierlist_page,
+    page_etag,
+)
+from forking import fork_tierlist
+from bulk_import import (
+    ArchiveTooLarge,
+    InvalidArchive,
+    IMPORT_MAX_BYTES,
+    spool_body,
+    open_archive,
+    run_import,
+)
+from transfer import (
+    VOTE_SCOPES,
+    TRANSFER_ALLOW_ALL_VOTES,
+    InvalidTransfer,
+    TransferTooLarge,
+    export_tierlist,
+    import_tierlist,
+)
+from snapshots import (
+    SnapshotNotFound,
+    capture_snapshot,
+    list_snapshots,
+    load_snapshot,
+    load_state,
+    state_payload,
+    diff_states,
+    revert_to_snapshot,
+)
+from migrations import run_migrations
+from health import HealthProbe
 
 
 #######################
@@ -43,7 +124,6 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql+asyncpg://tierlord:supersecrettofumagic@db:5432/tierlist",
 )
-SYNC_DATABASE_URL = DATABASE_URL.replace("+asyncpg", "")
 
 # **Use AUTHENTIK_CLIENT_ID / AUTHENTIK_CLIENT_SECRET** instead of CLIENT_ID/CLIENT_SECRET
 AUTHENTIK_BASE_URL = os.getenv("AUTHENTIK_BASE_URL", "")
@@ -73,6 +153,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added before SessionMiddleware so it runs inside it: sessions that just
+# wrote read from the primary for a while, see routing.py
+app.add_middleware(StickyPrimaryMiddleware)
+
 app.add_middleware(
     SessionMiddleware,
     secret_key=os.getenv("SESSION_SECRET_KEY", "super-secret-session-key"),
@@ -80,12 +164,35 @@ app.add_middleware(
     https_only=False,
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# ETag / immutable caching / Range / precompressed variants, see serving.py
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # Ensure uploads directory exists
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+vote_ingestor = VoteIngestor(database)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # Every pooled connection stayed busy for DB_POOL_ACQUIRE_TIMEOUT
+    return JSONResponse(
+        {"detail": "Server is busy, try again shortly."},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+health_probe = HealthProbe(database)
+health_probe.add_section("votes", vote_ingestor.snapshot_stats)
+health_probe.add_section("realtime", hub.stats)
+health_probe.add_section("replica", replica_router.snapshot_stats)
+health_probe.add_section("cache", cache_stats)
+
+# How often unreferenced images are swept (seconds, 0 = never); every
+# worker wakes up this often, the first one to get there does the sweep
+IMAGE_SWEEP_INTERVAL = int(os.getenv("IMAGE_SWEEP_INTERVAL", 3600))
+
 #########################
 # Lifespan Events
 #########################
@@ -93,41 +200,44 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 @app.on_event("startup")
 async def startup():
-    # Wait for Postgres, then create tables and connect
-    max_retries = 10
-    retry_count = 0
+    # Bring the schema up to date (one worker migrates, the others wait), then connect
+    await run_migrations()
+    await database.connect()
+    await replica_router.start()
+    # Writes on any worker drop the affected cache entries on every worker
+    hub.add_listener(invalidate_cached)
+    hub.add_listener(handle_invalidation, CACHE_CHANNEL)
+    await hub.start()
+    await vote_ingestor.start()
+    if IMAGE_SWEEP_INTERVAL > 0:
+        app.state.image_sweeper = asyncio.create_task(image_sweep_loop())
+
+
+async def image_sweep_loop():
     while True:
+        await asyncio.sleep(IMAGE_SWEEP_INTERVAL)
         try:
-            engine = create_engine(SYNC_DATABASE_URL)
-            metadata.create_all(engine)
-            with engine.connect() as conn:
-                res = conn.execute(
-                    text(
-                        "SELECT 1 FROM information_schema.columns "
-                        "WHERE table_name='items' AND column_name='position'"
-                    )
-                ).first()
-                if res is None:
-                    conn.execute(
-                        text(
-                            "ALTER TABLE items ADD COLUMN position INTEGER NOT NULL DEFAULT 0"
-                        )
-                    )
-            break
+            # A little under the interval, so wake-ups that drift apart don't skip a round
+            removed = await sweep_unreferenced_images(database, interval=IMAGE_SWEEP_INTERVAL * 0.9)
+            if removed:
+                print(f"Image sweeper removed {len(removed)} unreferenced files")
+            expired = await sweep_exports()
+            if expired:
+                print(f"Image sweeper removed {len(expired)} expired exports")
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise RuntimeError(
-                    f"Unable to connect to the database after {max_retries} retries. Last error: {e}"
-                )
-            print(f"Postgres not ready yet (attempt {retry_count}/{max_retries}): {e}")
-            time.sleep(2)
-    await database.connect()
+            print(f"Image sweeper failed: {e}")
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    sweeper = getattr(app.state, "image_sweeper", None)
+    if sweeper:
+        sweeper.cancel()
+    await vote_ingestor.stop()
+    await hub.stop()
+    await replica_router.stop()
     await database.disconnect()
+    shutdown_pool()
 
 
 ##########################
@@ -228,33 +338,53 @@ async def root():
 @app.get("/health")
 async def health_check():
     try:
-        engine = create_engine(SYNC_DATABASE_URL)
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT 1"))
-            one = result.scalar()
+        one = await database.fetch_val(text("SELECT 1"))
         return {"status": "OK", "db_response": one}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB health check failed: {e}")
 
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the worker's event loop answers. Touches nothing else."""
+    return {"status": "OK"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """
+    Readiness: database reachable through the pool and schema migrated.
+    Also reports pool usage, image queue depth and vote / realtime stats.
+    Cached for a couple of seconds; 503 while not ready.
+    """
+    ready, report = await health_probe.ready()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit / miss / eviction counts and sizes of this worker's read caches."""
+    return cache_stats()
+
+
+@app.get("/images/stats")
+async def get_image_stats():
+    """Queue depth and processing times of the image worker pool."""
+    return image_stats()
+
+
 @app.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File is not an image!")
     ext = file.filename.split(".")[-1]
-    unique_name = f"{uuid4().hex}.{ext}"
-    file_path = UPLOAD_DIR / unique_name
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
-    return {"filename": unique_name, "url": f"/uploads/{unique_name}"}
+    _, file_path, _ = await store_upload(file, UPLOAD_DIR, f".{ext}")
+    return {"filename": file_path.name, "url": f"/uploads/{file_path.name}"}
 
 
 @app.get("/uploads/{filename}")
-async def get_uploaded_image(filename: str):
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Image not found.")
-    return FileResponse(file_path)
+async def get_uploaded_image(request: Request, filename: str):
+    return serve_file(request, UPLOAD_DIR / filename)
 
 
 ################################
@@ -278,7 +408,7 @@ async def create_tierlist(
         )
     query_tl = insert(tierlists).values(name=name, creator_id=current_user["id"])
     new_tierlist_id = await database.execute(query_tl)
-    for position, tier_def in enumerate(tier_defs):
+    for position, tier_def in zip(initial_positions(len(tier_defs)), tier_defs):
         tier_name = tier_def.get("name")
         tier_colour = tier_def.get("colour")
         if not tier_name or not tier_colour:
@@ -303,37 +433,457 @@ async def create_tierlist(
     }
 
 
+@app.post("/tierlists/import")
+async def import_tierlist_stream(
+    request: Request,
+    name: str = Query(None, max_length=100, description="Name of the new tierlist (default: the exported one)"),
+    votes: str = Query("mine", description="Exported votes to import: none, mine or all"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Creates a tierlist owned by the current user from the NDJSON body of
+    GET /tierlists/{id}/export.ndjson, read and inserted in batches as it
+    streams in. Returns { "tierlist_id", "name", "counts" }.
+    By default only the current user's own votes are imported; "all" puts
+    votes in other users' names and needs TRANSFER_ALLOW_ALL_VOTES.
+    """
+    if votes not in VOTE_SCOPES:
+        raise HTTPException(status_code=400, detail=f"'votes' must be one of {', '.join(VOTE_SCOPES)}.")
+    if votes == "all" and not TRANSFER_ALLOW_ALL_VOTES:
+        raise HTTPException(
+            status_code=403, detail="Importing other users' votes is disabled on this instance."
+        )
+    try:
+        return await import_tierlist(database, request.stream(), current_user["id"], name, votes)
+    except TransferTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidTransfer as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/tierlists/{tierlist_id}/export.ndjson")
+async def export_tierlist_stream(
+    tierlist_id: int = FPath(..., description="ID of the tierlist to export"),
+    images: bool = Query(False, description="Include the original image files (base64)"),
+    current_user: dict = Depends(get_current_user),
+    db=Depends(read_database),
+):
+    """
+    Tierlist, tiers, items, votes (and optionally images) as NDJSON, streamed
+    from server-side cursors; see transfer.py for the record format.
+    """
+    await require_creator(tierlist_id, current_user, "Only the creator can export.")
+    return StreamingResponse(
+        export_tierlist(db, tierlist_id, include_images=images),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="tierlist_{tierlist_id}.ndjson"'},
+    )
+
+
+@app.post("/tierlists/{tierlist_id}/fork")
+async def fork_tierlist_endpoint(
+    tierlist_id: int = FPath(..., description="ID of the tierlist to copy"),
+    payload: dict = Body({}),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Copies the tierlist's tiers and items (sharing their image files) into a
+    new tierlist owned by the current user. Votes and history aren't copied.
+    Optional "name", default "<name> (copy)".
+    """
+    source = await get_tierlist_meta(database, tierlist_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    name = payload.get("name") or f"{source['name']} (copy)"
+    if not isinstance(name, str):
+        raise HTTPException(status_code=400, detail="Tierlist 'name' must be a string.")
+    name = name[:100]
+    forked = await fork_tierlist(database, tierlist_id, current_user["id"], name)
+    return {
+        "tierlist_id": forked["tierlist_id"],
+        "name": name,
+        "forked_from": tierlist_id,
+        "tiers": forked["tiers"],
+        "item_count": forked["item_count"],
+    }
+
+
 @app.get("/tierlists")
-async def list_tierlists():
-    rows = await database.fetch_all(select(tierlists))
-    return [
-        {"id": row["id"], "name": row["name"], "creator_id": row["creator_id"]}
-        for row in rows
-    ]
+async def list_tierlists(
+    request: Request,
+    response: Response,
+    cursor: str = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    creator_id: str = Query(None, description="Only lists by this creator"),
+    mine: bool = Query(False, description="Only the current user's lists"),
+    q: str = Query(None, max_length=100, description="Case-insensitive name search"),
+    include_counts: bool = Query(False, description="Add item_count / vote_count"),
+    db=Depends(read_database),
+):
+    """
+    Newest first, one page at a time:
+      { "tierlists": [ { "id", "name", "creator_id", "version", ... } ],
+        "next_cursor": "<pass back as ?cursor=>" or null }
+    """
+    if mine:
+        creator_id = get_current_user(request)["id"]
+    try:
+        page = await fetch_tierlist_page(
+            db,
+            limit=limit,
+            cursor=cursor,
+            creator_id=creator_id,
+            q=q.strip() if q else None,
+            include_counts=include_counts,
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    not_modified = conditional(request, response, page_etag(page))
+    if not_modified:
+        return not_modified
+    return page
 
 
 @app.get("/tierlists/{tierlist_id}")
 async def get_tierlist(
-    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch")
+    request: Request,
+    response: Response,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch"),
+    db=Depends(read_database),
 ):
-    tl = await database.fetch_one(
-        select(tierlists).where(tierlists.c.id == tierlist_id)
-    )
+    tl = await get_tierlist_meta(db, tierlist_id)
     if not tl:
         raise HTTPException(status_code=404, detail="Tierlist not found.")
-    tier_rows = await database.fetch_all(
-        select(tiers)
-        .where(tiers.c.tierlist_id == tierlist_id)
-        .order_by(tiers.c.position)
-    )
+    not_modified = conditional(request, response, version_etag(tierlist_id, tl["version"]))
+    if not_modified:
+        return not_modified
+    tier_rows = await get_tiers(db, tierlist_id, tl["version"])
     return {
         "id": tl["id"],
         "name": tl["name"],
         "creator_id": tl["creator_id"],
-        "tiers": [dict(r) for r in tier_rows],
+        "version": tl["version"],
+        "tiers": tier_rows,
+    }
+
+
+SNAPSHOT_FIELDS = {"tiers", "items", "votes", "me"}
+
+
+@app.get("/tierlists/{tierlist_id}/snapshot")
+async def get_tierlist_snapshot(
+    request: Request,
+    response: Response,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch"),
+    fields: str = Query(
+        ",".join(sorted(SNAPSHOT_FIELDS)),
+        description="Comma separated subset of: tiers, items, votes, me",
+    ),
+    stats: bool = Query(False, description="Include per-item vote stats"),
+    db=Depends(read_database),
+):
+    """
+    Everything the tierlist page needs in one round trip, from at most four
+    queries no matter how big the list is (tierlist, tiers, items, vote counts):
+      {
+        "tierlist": { "id", "name", "creator_id", "version" },
+        "tiers": [ <tier>, ... ],                               # ordered
+        "items": { "<tier_id>" | "unassigned": [ <item>, ... ] },  # ordered per tier
+        "votes": { "<item_id>": { "<tier_id>": <count> } },   # + "stats" with ?stats=true
+        "me": { "id", "username", "email" } or null
+      }
+    """
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - SNAPSHOT_FIELDS
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown snapshot fields: {sorted(unknown)}"
+        )
+
+    tl = await get_tierlist_meta(db, tierlist_id)
+    if not tl:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    user = request.session.get("user") if "me" in wanted else None
+    etag = version_etag(
+        tierlist_id,
+        tl["version"],
+        ".".join(sorted(wanted)),
+        int(stats),
+        user["id"] if user else "",
+    )
+    not_modified = conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    async def build(db):
+        snapshot = {
+            "tierlist": {
+                "id": tl["id"],
+                "name": tl["name"],
+                "creator_id": tl["creator_id"],
+                "version": tl["version"],
+            }
+        }
+
+        tier_rows = []
+        if "tiers" in wanted or stats:
+            tier_rows = await get_tiers(db, tierlist_id, tl["version"])
+        if "tiers" in wanted:
+            snapshot["tiers"] = tier_rows
+
+        if "items" in wanted:
+            item_rows = await hot_fetch_all(db, ITEMS_BY_TIERLIST, tierlist_id)
+            grouped = {}
+            for r in item_rows:
+                key = str(r["tier_id"]) if r["tier_id"] is not None else "unassigned"
+                grouped.setdefault(key, []).append(r)
+            snapshot["items"] = grouped
+
+        if "votes" in wanted:
+            counts = await fetch_vote_counts(db, tierlist_id)
+            if stats:
+                rank = {r["id"]: idx for idx, r in enumerate(tier_rows)}
+                snapshot["votes"] = {
+                    item_id: {"votes": c, "stats": vote_stats(c, rank)}
+                    for item_id, c in counts.items()
+                }
+            else:
+                snapshot["votes"] = counts
+        return snapshot
+
+    # Everything but "me" is the same for every user at a given version
+    shared = ".".join(sorted(wanted - {"me"}))
+    snapshot = await cached_payload(
+        db, ("snapshot", tierlist_id, tl["version"], shared, stats), build
+    )
+
+    if "me" in wanted:
+        snapshot = {
+            **snapshot,
+            "me": (
+                {"id": user["id"], "username": user["username"], "email": user["email"]}
+                if user
+                else None
+            ),
+        }
+
+    return snapshot
+
+
+@app.get("/tierlists/{tierlist_id}/changes")
+async def get_tierlist_changes(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    since: int = Query(..., ge=0, description="Version the client already has"),
+):
+    """
+    Deltas after version `since`, oldest first:
+      { "version": <current>, "changes": [ { "version", "kind", "data" }, ... ] }
+    410 if the log no longer reaches back that far (refetch the snapshot then).
+    """
+    tl = await database.fetch_one(
+        select(tierlists.c.version).where(tierlists.c.id == tierlist_id)
+    )
+    if not tl:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    if since >= tl["version"]:
+        return {"version": tl["version"], "changes": []}
+    changes = await fetch_changes(database, tierlist_id, since)
+    if not changes or changes[0]["version"] != since + 1:
+        raise HTTPException(
+            status_code=410, detail="Change log no longer covers that version, refetch."
+        )
+    return {"version": tl["version"], "changes": changes}
+
+
+@app.get("/tierlists/{tierlist_id}/events")
+async def stream_tierlist_events(
+    request: Request,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to follow"),
+    since: int = Query(None, ge=0, description="Version the client already has"),
+):
+    """
+    Server-sent events with the tierlist's deltas as they happen:
+      data: { "tierlist_id", "version", "kind", "data" }
+    kinds are the change log kinds (item_added, items_moved, tier_updated,
+    votes_changed, ...) plus "resync" when the client should refetch the
+    snapshot. With `since` (or Last-Event-ID on reconnect) missed changes are
+    replayed first. Fan-out across workers goes through Postgres LISTEN/NOTIFY.
+    """
+    tl = await database.fetch_one(
+        select(tierlists.c.version).where(tierlists.c.id == tierlist_id)
+    )
+    if not tl:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    # EventSource reconnects with Last-Event-ID, which is newer than the URL's `since`
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = max(since or 0, int(last_event_id))
+
+    # Subscribe before replaying so nothing falls between the two
+    queue = hub.subscribe(tierlist_id)
+
+    async def stream():
+        try:
+            last_version = tl["version"]
+            if since is not None and since < tl["version"]:
+                changes = await fetch_changes(database, tierlist_id, since)
+                if not changes or changes[0]["version"] != since + 1:
+                    yield sse_event(
+                        {"tierlist_id": tierlist_id, "version": tl["version"], "kind": "resync"}
+                    )
+                else:
+                    for change in changes:
+                        yield sse_event({"tierlist_id": tierlist_id, **change})
+                    last_version = max(last_version, changes[-1]["version"])
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                version = message.get("version")
+                if version is not None:
+                    if version <= last_version and message["kind"] != "resync":
+                        continue  # already replayed
+                    last_version = max(last_version, version)
+                yield sse_event(message)
+        finally:
+            hub.unsubscribe(tierlist_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Version history ---
+
+
+async def require_creator(tierlist_id: int, current_user: dict, detail: str) -> dict:
+    tl = await get_tierlist_meta(database, tierlist_id)
+    if not tl:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    if tl["creator_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail=detail)
+    return tl
+
+
+@app.get("/tierlists/{tierlist_id}/snapshots")
+async def get_tierlist_snapshots(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: int = Query(None, description="next_before of the previous page"),
+    db=Depends(read_database),
+):
+    """
+    Saved versions, newest first:
+      { "snapshots": [ { "id", "version", "kind", "label", "created_at" } ],
+        "next_before": <pass back as ?before=> or null }
+    """
+    if not await get_tierlist_meta(db, tierlist_id):
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    rows = await list_snapshots(db, tierlist_id, limit, before)
+    return {
+        "snapshots": rows,
+        "next_before": rows[-1]["id"] if len(rows) == limit else None,
+    }
+
+
+@app.post("/tierlists/{tierlist_id}/snapshots")
+async def create_tierlist_snapshot(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    payload: dict = Body({}),
+    current_user: dict = Depends(get_current_user),
+):
+    """Saves the current layout as a version, with an optional "label"."""
+    await require_creator(tierlist_id, current_user, "Only the creator can save versions.")
+    label = payload.get("label")
+    if label is not None and (not isinstance(label, str) or len(label) > 100):
+        raise HTTPException(status_code=400, detail="'label' must be a string of at most 100 characters.")
+    async with database.transaction():
+        version = await database.fetch_val(
+            select(tierlists.c.version).where(tierlists.c.id == tierlist_id).with_for_update()
+        )
+        snapshot_id = await capture_snapshot(
+            database, tierlist_id, version, label=label, force=True
+        )
+    return {"id": snapshot_id, "version": version, "label": label}
+
+
+@app.get("/tierlists/{tierlist_id}/snapshots/{snapshot_id}")
+async def get_tierlist_snapshot_version(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    snapshot_id: int = FPath(..., description="ID of the snapshot"),
+    db=Depends(read_database),
+):
+    """The saved layout: { "id", "version", "label", "created_at", "tiers": [...], "items": [...] }"""
+    try:
+        row, state = await load_snapshot(db, tierlist_id, snapshot_id)
+    except SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    return {
+        "id": row["id"],
+        "version": row["version"],
+        "label": row["label"],
+        "created_at": row["created_at"],
+        **state_payload(state),
     }
 
 
+@app.get("/tierlists/{tierlist_id}/snapshots/{snapshot_id}/diff")
+async def diff_tierlist_snapshot(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    snapshot_id: int = FPath(..., description="ID of the snapshot"),
+    against: int = Query(None, description="Snapshot to compare with (default: the current layout)"),
+    db=Depends(read_database),
+):
+    """
+    What changed from the snapshot to `against` (or to now):
+      { "tiers": { "added", "removed", "changed" },
+        "items": { "added", "removed", "moved": [ { "id", "from", "to" } ] } }
+    """
+    try:
+        _, old = await load_snapshot(db, tierlist_id, snapshot_id)
+        if against is not None:
+            _, new = await load_snapshot(db, tierlist_id, against)
+        else:
+            new = await load_state(db, tierlist_id)
+    except SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    return diff_states(old, new)
+
+
+@app.post("/tierlists/{tierlist_id}/snapshots/{snapshot_id}/revert")
+async def revert_tierlist_snapshot(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    snapshot_id: int = FPath(..., description="ID of the snapshot to restore"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Restores the snapshot's tiers and item placements in one transaction;
+    live subscribers get a single "reverted" event and reload. Votes for
+    tiers created after the snapshot are deleted with those tiers; the
+    response says how many ("votes_dropped", plus a "warning").
+    """
+    await require_creator(tierlist_id, current_user, "Only the creator can revert.")
+    try:
+        async with database.transaction():
+            result = await revert_to_snapshot(database, tierlist_id, snapshot_id)
+            version = await record_change(database, tierlist_id, "reverted", result)
+    except SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    for tier_id in result["deleted_tier_ids"]:
+        tier_owner.pop(tier_id)
+    response = {"version": version, **result}
+    if result["votes_dropped"]:
+        response["warning"] = (
+            f"{result['votes_dropped']} votes for tiers created after this snapshot were deleted."
+        )
+    return response
+
+
 # --- Tier management ---
 
 
@@ -343,28 +893,26 @@ async def create_tier(
     payload: dict = Body(...),
     current_user: dict = Depends(get_current_user),
 ):
-    if not await database.fetch_one(
-        select(tierlists.c.id).where(tierlists.c.id == tierlist_id)
-    ):
+    if not await get_tierlist_meta(database, tierlist_id):
         raise HTTPException(status_code=404, detail="Tierlist not found.")
     name = payload.get("name")
     colour = payload.get("colour")
     if not name or not colour:
         raise HTTPException(status_code=400, detail="'name' and 'colour' required.")
     max_row = await database.fetch_one(
-        select(text("COALESCE(MAX(position), -1) AS maxpos")).where(
+        select(func.max(tiers.c.position).label("maxpos")).where(
             tiers.c.tierlist_id == tierlist_id
         )
     )
-    next_pos = (
-        max_row["maxpos"] if max_row and max_row["maxpos"] is not None else -1
-    ) + 1
-    new_id = await database.execute(
-        insert(tiers).values(
-            tierlist_id=tierlist_id, name=name, colour=colour, position=next_pos
+    next_pos = position_between(max_row["maxpos"] if max_row else None, None)
+    async with database.transaction():
+        new_id = await database.execute(
+            insert(tiers).values(
+                tierlist_id=tierlist_id, name=name, colour=colour, position=next_pos
+            )
         )
-    )
-    row = await database.fetch_one(select(tiers).where(tiers.c.id == new_id))
+        row = await database.fetch_one(select(tiers).where(tiers.c.id == new_id))
+        await record_change(database, tierlist_id, "tier_created", dict(row))
     return dict(row)
 
 
@@ -382,11 +930,14 @@ async def update_tier(
         updates["name"] = payload["name"]
     if "colour" in payload:
         updates["colour"] = payload["colour"]
-    if updates:
-        await database.execute(
-            tiers.update().where(tiers.c.id == tier_id).values(**updates)
-        )
-    updated = await database.fetch_one(select(tiers).where(tiers.c.id == tier_id))
+    async with database.transaction():
+        if updates:
+            await database.execute(
+                tiers.update().where(tiers.c.id == tier_id).values(**updates)
+            )
+        updated = await database.fetch_one(select(tiers).where(tiers.c.id == tier_id))
+        if updates:
+            await record_change(database, tier["tierlist_id"], "tier_updated", dict(updated))
     return dict(updated)
 
 
@@ -398,20 +949,13 @@ async def delete_tier(
     tier = await database.fetch_one(select(tiers).where(tiers.c.id == tier_id))
     if not tier:
         raise HTTPException(status_code=404, detail="Tier not found.")
-    tierlist_id = tier["tierlist_id"]
-    position = tier["position"]
-    await database.execute(tiers.delete().where(tiers.c.id == tier_id))
-    # Reorder remaining tiers
-    remaining = await database.fetch_all(
-        select(tiers)
-        .where(tiers.c.tierlist_id == tierlist_id)
-        .order_by(tiers.c.position)
-    )
-    for idx, t in enumerate(remaining):
-        if t["position"] != idx:
-            await database.execute(
-                tiers.update().where(tiers.c.id == t["id"]).values(position=idx)
-            )
+    # Positions are sparse, so the remaining tiers keep their order without renumbering
+    async with database.transaction():
+        await database.execute(tiers.delete().where(tiers.c.id == tier_id))
+        await record_change(
+            database, tier["tierlist_id"], "tier_deleted", {"tier_id": tier_id}
+        )
+    tier_owner.pop(tier_id)
     return {"status": "deleted"}
 
 
@@ -424,49 +968,38 @@ async def add_item(
     current_user: dict = Depends(get_current_user),
 ):
     # 1. Check tierlist exists
-    if not await database.fetch_one(
-        select(tierlists.c.id).where(tierlists.c.id == tierlist_id)
-    ):
+    if not await get_tierlist_meta(database, tierlist_id):
         raise HTTPException(status_code=404, detail="Tierlist not found.")
 
     # 2. Tier check (if tier_id given)
     if tier_id is not None:
-        if not await database.fetch_one(
-            select(tiers.c.id).where(
-                (tiers.c.id == tier_id) & (tiers.c.tierlist_id == tierlist_id)
-            )
-        ):
+        if await get_tier_owner(database, tier_id) != tierlist_id:
             raise HTTPException(
                 status_code=400, detail="tier_id is invalid for this tierlist."
             )
 
-    # 3. Save original image to disk
+    # 3. Stream original image to disk
+    # Stored by content hash: re-uploading the same image reuses the existing files
     ext = os.path.splitext(image.filename)[1].lower()
-    img_id = uuid4().hex
-    original_name = f"{img_id}{ext}"
-    preview_name = f"{img_id}_preview{ext}"
-
-    save_dir = "static/images"
-    os.makedirs(save_dir, exist_ok=True)
-    original_path = os.path.join(save_dir, original_name)
-    preview_path = os.path.join(save_dir, preview_name)
-
-    # Save original
-    content = await image.read()
-    with open(original_path, "wb") as f:
-        f.write(content)
+    digest, original_path, _ = await store_upload(image, IMAGE_DIR, ext)
+    original_name = original_path.name
 
-    # Generate & save preview
+    # Generate preview + srcset derivatives in the image pool (keeps the event loop
+    # free); for a known hash this just reads back the stored manifest. A
+    # failed upload leaves the original to the sweeper: an identical upload
+    # may have started using the same file in the meantime
     try:
-        with Image.open(original_path) as img:
-            # Shrink for preview (max height 256, width auto)
-            img.thumbnail((9999, 256))
-            img.save(preview_path)
+        derived = await run_image_job(make_derivatives, original_path, digest)
+    except ImageQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, try again shortly.",
+            headers={"Retry-After": "2"},
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image processing failed: {e}")
 
-    image_url = f"/static/images/{original_name}"
-    preview_url = f"/static/images/{preview_name}"
+    image_fields = item_image_fields(original_name, derived)
 
     # Determine position within the tier (or unassigned)
     max_pos_row = await database.fetch_one(
@@ -479,37 +1012,131 @@ async def add_item(
             )
         )
     )
-    next_position = (max_pos_row[0] or -1) + 1
+    next_position = position_between(max_pos_row[0], None)
 
     # 4. Insert to DB (add preview_url as a new column if you want)
-    new_item_id = await database.execute(
-        insert(items).values(
-            tierlist_id=tierlist_id,
-            tier_id=tier_id,
-            position=next_position,
-            name=name,
-            image_url=image_url,  # <-- full image
-            preview_url=preview_url,  # <-- you need to add this column!
+    async with database.transaction():
+        new_item_id = await database.execute(
+            insert(items).values(
+                tierlist_id=tierlist_id,
+                tier_id=tier_id,
+                position=next_position,
+                name=name,
+                **image_fields,  # full image, preview and srcset derivatives
+            )
         )
-    )
-    row = await database.fetch_one(select(items).where(items.c.id == new_item_id))
+        row = await database.fetch_one(select(items).where(items.c.id == new_item_id))
+        await record_change(database, tierlist_id, "item_added", dict(row))
     return dict(row)
 
 
+@app.post("/tierlists/{tierlist_id}/import")
+async def import_items(
+    request: Request,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to add the items to"),
+    tier_id: int = Query(None, description="Tier for entries the manifest doesn't place"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Bulk item import. The request body is a zip or tar archive (gzip/bz2/xz
+    compression is fine) of images, optionally with a manifest.ndjson of
+    {"file", "name", "tier"} lines, see bulk_import.py. The response is an
+    NDJSON stream: "progress" lines while thumbnails are generated, then one
+    "entry" line per archive entry and a final "done" line.
+    """
+    await require_creator(tierlist_id, current_user, "Only the creator can import items.")
+    tier_rows = await hot_fetch_all(database, TIERS_BY_TIERLIST, tierlist_id)
+    if tier_id is not None and tier_id not in {t["id"] for t in tier_rows}:
+        raise HTTPException(status_code=400, detail="tier_id is invalid for this tierlist.")
+    try:
+        f = await spool_body(request.stream())
+    except ArchiveTooLarge:
+        raise HTTPException(
+            status_code=413, detail=f"Archive is larger than {IMPORT_MAX_BYTES} bytes."
+        )
+    try:
+        archive, plan = await open_archive(f)
+    except InvalidArchive as e:
+        f.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        f.close()
+        raise
+    return StreamingResponse(
+        run_import(database, f, archive, plan, tierlist_id, tier_rows, tier_id),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.get("/tierlists/{tierlist_id}/items")
 async def get_items(
-    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch items for")
+    request: Request,
+    response: Response,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch items for"),
+    db=Depends(read_database),
 ):
-    if not await database.fetch_one(
-        select(tierlists.c.id).where(tierlists.c.id == tierlist_id)
-    ):
+    tl = await get_tierlist_meta(db, tierlist_id)
+    if not tl:
         raise HTTPException(status_code=404, detail="Tierlist not found.")
-    rows = await database.fetch_all(
-        select(items)
-        .where(items.c.tierlist_id == tierlist_id)
-        .order_by(items.c.tier_id, items.c.position)
+    not_modified = conditional(
+        request, response, version_etag(tierlist_id, tl["version"], "items")
+    )
+    if not_modified:
+        return not_modified
+    return await cached_payload(
+        db,
+        ("items", tierlist_id, tl["version"]),
+        lambda db: hot_fetch_all(db, ITEMS_BY_TIERLIST, tierlist_id),
+    )
+
+
+@app.get("/tierlists/{tierlist_id}/export.png")
+async def export_tierlist_png(
+    request: Request,
+    response: Response,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to export"),
+    unassigned: bool = Query(False, description="Add a row for unassigned items"),
+    db=Depends(read_database),
+):
+    """
+    The tierlist as one PNG (tier bands + item previews), rendered in the
+    image pool and kept on disk per version: repeat exports are a file send.
+    """
+    tl = await get_tierlist_meta(db, tierlist_id)
+    if not tl:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    variant = "all" if unassigned else "tiers"
+    etag = version_etag(tierlist_id, tl["version"], "png", variant)
+    not_modified = conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    async def load():
+        # The file is kept as this version: read rows that are at it
+        rows_db = await db_at_version(db, tierlist_id, tl["version"])
+        tier_rows = await get_tiers(rows_db, tierlist_id, tl["version"])
+        grouped = {}
+        for item in await hot_fetch_all(rows_db, ITEMS_BY_TIERLIST, tierlist_id):
+            grouped.setdefault(item["tier_id"], []).append(item)
+        rows = [(t["name"], t["colour"], grouped.get(t["id"], [])) for t in tier_rows]
+        if unassigned:
+            rows.append(("Unassigned", UNASSIGNED_COLOUR, grouped.get(None, [])))
+        return tl["name"], rows
+
+    try:
+        path = await render_export(tierlist_id, tl["version"], variant, load)
+    except ImageQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, try again shortly.",
+            headers={"Retry-After": "2"},
+        )
+    return FileResponse(
+        path,
+        media_type="image/png",
+        filename=f"tierlist_{tierlist_id}.png",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
     )
-    return [dict(r) for r in rows]
 
 
 @app.patch("/items/{item_id}")
@@ -518,19 +1145,13 @@ async def update_item(
     payload: dict = Body(...),
     current_user: dict = Depends(get_current_user),
 ):
-    row = await database.fetch_one(
-        select(items.c.tierlist_id).where(items.c.id == item_id)
-    )
+    tierlist_id = await get_item_owner(database, item_id)
 
-    if not row:
+    if tierlist_id is None:
         raise HTTPException(status_code=404, detail="Item not found.")
 
-    tierlist_id = row["tierlist_id"]
-
     # Ensure the current user is the creator of this tierlist
-    creator_row = await database.fetch_one(
-        select(tierlists.c.creator_id).where(tierlists.c.id == tierlist_id)
-    )
+    creator_row = await get_tierlist_meta(database, tierlist_id)
     if not creator_row:
         raise HTTPException(status_code=404, detail="Tierlist not found.")
     if creator_row["creator_id"] != current_user["id"]:
@@ -542,11 +1163,7 @@ async def update_item(
     update_data = {}
 
     if new_tier_id is not None:
-        if not await database.fetch_one(
-            select(tiers.c.id).where(
-                (tiers.c.id == new_tier_id) & (tiers.c.tierlist_id == tierlist_id)
-            )
-        ):
+        if await get_tier_owner(database, new_tier_id) != tierlist_id:
             raise HTTPException(
                 status_code=400, detail="tier_id is invalid for this item."
             )
@@ -555,18 +1172,226 @@ async def update_item(
     if new_position is not None:
         update_data["position"] = new_position
 
-    if update_data:
-        await database.execute(
-            items.update().where(items.c.id == item_id).values(**update_data)
+    async with database.transaction():
+        if update_data:
+            await database.execute(
+                items.update().where(items.c.id == item_id).values(**update_data)
+            )
+        updated = await database.fetch_one(select(items).where(items.c.id == item_id))
+        if update_data:
+            await record_change(database, tierlist_id, "item_updated", dict(updated))
+    return dict(updated)
+
+
+@app.post("/tierlists/{tierlist_id}/items/reorder")
+async def reorder_items(
+    tierlist_id: int = FPath(..., description="ID of the tierlist whose items are moved"),
+    payload: dict = Body(...),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Payload: { "moves": [ <move>, ... ] } where a move is either
+      { "item_id": <int>, "tier_id": <int or null>, "position": <number> }
+    or, letting the server pick a sparse position between the new neighbours,
+      { "item_id": <int>, "tier_id": <int or null>,
+        "after_id": <int or null>, "before_id": <int or null> }
+    Applies the whole batch in one transaction and only writes the rows whose
+    tier/position actually changed. Returns the new ordering.
+    """
+    moves = payload.get("moves")
+    if not isinstance(moves, list):
+        raise HTTPException(status_code=400, detail="Payload must include a 'moves' list.")
+
+    def is_id(value, nullable=False):
+        return (value is None and nullable) or (
+            isinstance(value, int) and not isinstance(value, bool)
         )
 
-    updated = await database.fetch_one(select(items).where(items.c.id == item_id))
-    return dict(updated)
+    lookup_ids = set()
+    for move in moves:
+        if (
+            not isinstance(move, dict)
+            or not is_id(move.get("item_id"))
+            or not is_id(move.get("tier_id"), nullable=True)
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="Each move needs an int 'item_id' and an int or null 'tier_id'.",
+            )
+        if "position" in move:
+            if not isinstance(move["position"], (int, float)) or isinstance(
+                move["position"], bool
+            ):
+                raise HTTPException(status_code=400, detail="'position' must be a number.")
+        elif not is_id(move.get("after_id"), True) or not is_id(move.get("before_id"), True):
+            raise HTTPException(
+                status_code=400,
+                detail="Each move needs a 'position' or int/null 'after_id' and 'before_id'.",
+            )
+        lookup_ids.update(
+            i
+            for i in (move["item_id"], move.get("after_id"), move.get("before_id"))
+            if i is not None
+        )
+
+    # One permission check for the whole batch
+    creator_row = await get_tierlist_meta(database, tierlist_id)
+    if not creator_row:
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    if creator_row["creator_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Only the creator can move items.")
+
+    async def load_placements(ids):
+        if not ids:
+            return {}
+        rows = await database.fetch_all(
+            select(items.c.id, items.c.tier_id, items.c.position).where(
+                (items.c.tierlist_id == tierlist_id) & items.c.id.in_(list(ids))
+            )
+        )
+        return {r["id"]: (r["tier_id"], r["position"]) for r in rows}
+
+    async with database.transaction():
+        current = await load_placements(lookup_ids)
+        unknown = lookup_ids - set(current)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Items not in this tierlist: {sorted(unknown)}",
+            )
+
+        target_tiers = {m["tier_id"] for m in moves if m["tier_id"] is not None}
+        if target_tiers:
+            rows = await database.fetch_all(
+                select(tiers.c.id).where(
+                    (tiers.c.tierlist_id == tierlist_id) & tiers.c.id.in_(list(target_tiers))
+                )
+            )
+            invalid = target_tiers - {r["id"] for r in rows}
+            if invalid:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"tier_id is invalid for this tierlist: {sorted(invalid)}",
+                )
+
+        # `placed` is the state after the moves so far, `current` mirrors the DB
+        # and `original` is what it was before this batch
+        placed = dict(current)
+        original = dict(current)
+        moved = set()
+        rebalanced = set()
+
+        async def write_placements():
+            # Single UPDATE ... FROM unnest(...) instead of one statement per row
+            pending = [
+                (item_id, *placed[item_id])
+                for item_id in moved
+                if placed[item_id] != current[item_id]
+            ]
+            if not pending:
+                return
+            ids, tier_ids, positions = (list(col) for col in zip(*pending))
+            # A str, not text(): `databases` only binds the values dict to str queries
+            await database.execute(
+                "UPDATE items SET tier_id = v.tier_id, position = v.position "
+                "FROM unnest(CAST(:ids AS INTEGER[]), CAST(:tier_ids AS INTEGER[]), "
+                "CAST(:positions AS DOUBLE PRECISION[])) AS v(id, tier_id, position) "
+                "WHERE items.id = v.id",
+                {
+                    "ids": ids,
+                    "tier_ids": tier_ids,
+                    "positions": [float(p) for p in positions],
+                },
+            )
+            current.update((i, (t, p)) for i, t, p in pending)
+
+        def neighbours(move, tier_id):
+            positions = []
+            for key in ("after_id", "before_id"):
+                neighbour_id = move.get(key)
+                if neighbour_id is None:
+                    positions.append(None)
+                    continue
+                if placed[neighbour_id][0] != tier_id:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Item {neighbour_id} is not in the target tier.",
+                    )
+                positions.append(placed[neighbour_id][1])
+            after, before = positions
+            if after is not None and before is not None and not after < before:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Item {move['after_id']} is not before item {move['before_id']}.",
+                )
+            return after, before
+
+        for move in moves:
+            item_id, tier_id = move["item_id"], move["tier_id"]
+            if "position" in move:
+                position = move["position"]
+            else:
+                if item_id in (move.get("after_id"), move.get("before_id")):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Item {item_id} can't be placed next to itself.",
+                    )
+                position = position_between(*neighbours(move, tier_id))
+                if position is None:
+                    # Gap used up: write the moves so far, so the re-spacing
+                    # keeps their order, re-space this tier once, then try again
+                    await write_placements()
+                    await rebalance_items(database, tierlist_id, tier_id)
+                    fresh = await load_placements(lookup_ids)
+                    rebalanced.add(tier_id)
+                    placed.update(fresh)
+                    current.update(fresh)
+                    position = position_between(*neighbours(move, tier_id))
+            placed[item_id] = (tier_id, position)
+            moved.add(item_id)
+
+        await write_placements()
+        changed = [
+            (item_id, *placed[item_id])
+            for item_id in moved
+            if placed[item_id] != original[item_id]
+        ]
+        for tier_id in rebalanced:
+            # The rest of a re-spaced tier moved too, as far as listeners
+            # holding the old positions are concerned
+            respaced = await database.fetch_all(
+                select(items.c.id, items.c.tier_id, items.c.position).where(
+                    (items.c.tierlist_id == tierlist_id)
+                    & items.c.tier_id.isnot_distinct_from(tier_id)
+                    & items.c.id.notin_(list(moved))
+                )
+            )
+            changed += [(r["id"], r["tier_id"], r["position"]) for r in respaced]
+        if changed:
+            await record_change(
+                database,
+                tierlist_id,
+                "items_moved",
+                {
+                    "items": [
+                        {"id": i, "tier_id": t, "position": float(p)}
+                        for i, t, p in changed
+                    ]
+                },
+            )
+
+        ordering = await database.fetch_all(
+            select(items.c.id, items.c.tier_id, items.c.position)
+            .where(items.c.tierlist_id == tierlist_id)
+            .order_by(items.c.tier_id, items.c.position, items.c.id)
+        )
+    return {"updated": len(changed), "items": [dict(r) for r in ordering]}
 
 
 # ─── CAST OR UPDATE A VOTE ───
 @app.post("/items/{item_id}/vote")
 async def cast_vote(
+    response: Response,
     item_id: int = FPath(..., description="ID of the item to vote on"),
     payload: dict = Body(...),
     current_user: dict = Depends(get_current_user),
@@ -574,54 +1399,115 @@ async def cast_vote(
     """
     Payload: { "tier_id": <int> }
     Records or updates the current_user's vote for the given item.
+    Goes through the vote ingestor (vote_ingest.py): validated against cached
+    item/tier owners, coalesced per (user, item) and upserted in batches.
+    With VOTE_DURABILITY=async the answer is 202 "queued".
     """
     tier_id = payload.get("tier_id")
     if tier_id is None:
         raise HTTPException(status_code=400, detail="Payload must include 'tier_id'.")
 
-    # 1️⃣ Ensure item exists
-    row_item = await database.fetch_one(
-        select(items.c.tierlist_id).where(items.c.id == item_id)
-    )
-    if not row_item:
-        raise HTTPException(status_code=404, detail="Item not found.")
+    uid = current_user["id"]
+    await vote_ingestor.submit(uid, item_id, tier_id)
+    if VOTE_DURABILITY == "async":
+        response.status_code = 202
+        return {"status": "queued", "item_id": item_id, "tier_id": tier_id, "user_id": uid}
+    return {"status": "ok", "item_id": item_id, "tier_id": tier_id, "user_id": uid}
+
+
+# ─── BATCH VOTES / MY VOTES ───
+@app.post("/tierlists/{tierlist_id}/votes/batch")
+async def cast_votes_batch(
+    tierlist_id: int = FPath(..., description="ID of the tierlist to vote on"),
+    payload: dict = Body(...),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Payload: { "votes": [ { "item_id": <int>, "tier_id": <int> }, ... ] }
+    Records or updates all of current_user's votes in one transaction
+    (validated with two queries, written with one upsert). Later entries for
+    the same item win.
+    """
+    entries = payload.get("votes")
+    if not isinstance(entries, list) or not entries:
+        raise HTTPException(status_code=400, detail="Payload must include a non-empty 'votes' list.")
+    def is_id(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    choices = {}
+    for entry in entries:
+        if (
+            not isinstance(entry, dict)
+            or not is_id(entry.get("item_id"))
+            or not is_id(entry.get("tier_id"))
+        ):
+            raise HTTPException(
+                status_code=400, detail="Each vote needs an int 'item_id' and 'tier_id'."
+            )
+        choices[entry["item_id"]] = entry["tier_id"]
 
-    # 2️⃣ Ensure the given tier_id belongs to the same tierlist as the item
-    tierlist_of_item = row_item["tierlist_id"]
-    row_tier = await database.fetch_one(
+    if not await get_tierlist_meta(database, tierlist_id):
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    item_rows = await database.fetch_all(
+        select(items.c.id).where(
+            (items.c.tierlist_id == tierlist_id) & items.c.id.in_(list(choices))
+        )
+    )
+    unknown = set(choices) - {r["id"] for r in item_rows}
+    if unknown:
+        raise HTTPException(
+            status_code=404, detail=f"Items not in this tierlist: {sorted(unknown)}"
+        )
+    wanted_tiers = set(choices.values())
+    tier_rows = await database.fetch_all(
         select(tiers.c.id).where(
-            (tiers.c.id == tier_id) & (tiers.c.tierlist_id == tierlist_of_item)
+            (tiers.c.tierlist_id == tierlist_id) & tiers.c.id.in_(list(wanted_tiers))
         )
     )
-    if not row_tier:
-        raise HTTPException(status_code=400, detail="Invalid 'tier_id' for this item.")
+    invalid = wanted_tiers - {r["id"] for r in tier_rows}
+    if invalid:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid 'tier_id' for this tierlist: {sorted(invalid)}"
+        )
 
-    # 3️⃣ Upsert: does a vote already exist for this (user_id, item_id)?
     uid = current_user["id"]
-    existing = await database.fetch_one(
-        select(votes.c.id).where(
-            (votes.c.user_id == uid) & (votes.c.item_id == item_id)
-        )
-    )
+    await vote_ingestor.write_batch(uid, tierlist_id, choices)
+    return {"status": "ok", "user_id": uid, "votes": choices}
 
-    if existing:
-        # Update the existing vote
-        await database.execute(
-            votes.update().where(votes.c.id == existing["id"]).values(tier_id=tier_id)
-        )
-    else:
-        # Insert a new vote
-        await database.execute(
-            insert(votes).values(user_id=uid, item_id=item_id, tier_id=tier_id)
-        )
 
-    return {"status": "ok", "item_id": item_id, "tier_id": tier_id, "user_id": uid}
+@app.get("/tierlists/{tierlist_id}/votes/me")
+async def get_my_votes(
+    tierlist_id: int = FPath(..., description="ID of the tierlist"),
+    current_user: dict = Depends(get_current_user),
+    db=Depends(read_database),
+):
+    """
+    Returns { "<item_id>": <tier_id>, ... } for every item current_user has
+    voted on in this tierlist (including votes still waiting to be flushed).
+    """
+    if not await get_tierlist_meta(db, tierlist_id):
+        raise HTTPException(status_code=404, detail="Tierlist not found.")
+    uid = current_user["id"]
+    # Taken before the read, so a batch committing meanwhile isn't missed
+    uncommitted = vote_ingestor.pending_for_user(uid, tierlist_id)
+    rows = await db.fetch_all(
+        select(votes.c.item_id, votes.c.tier_id)
+        .select_from(votes.join(items, items.c.id == votes.c.item_id))
+        .where((votes.c.user_id == uid) & (items.c.tierlist_id == tierlist_id))
+    )
+    mine = {r["item_id"]: r["tier_id"] for r in rows}
+    mine.update(uncommitted)
+    return mine
 
 
 # ─── GET VOTES FOR A TIERLIST ───
 @app.get("/tierlists/{tierlist_id}/votes")
 async def get_tierlist_votes(
-    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch votes for")
+    request: Request,
+    response: Response,
+    tierlist_id: int = FPath(..., description="ID of the tierlist to fetch votes for"),
+    stats: bool = Query(False, description="Include total / modal tier / mean tier per item"),
+    db=Depends(read_database),
 ):
     """
     Returns a tally of votes per item for a given tierlist.
@@ -633,39 +1519,27 @@ async def get_tierlist_votes(
         "votes": {
            "<tier_id>": <count>,
            ...
+        },
+        "stats": {                      # only with ?stats=true
+           "total": <int>,
+           "modal_tier_id": <int or null>,
+           "mean_position": <float or null>
         }
       }
     """
-    # 1️⃣ Ensure tierlist exists
-    tl = await database.fetch_one(
-        select(tierlists.c.id).where(tierlists.c.id == tierlist_id)
-    )
+    # 1️⃣ Ensure tierlist exists (its version doubles as the ETag)
+    tl = await get_tierlist_meta(db, tierlist_id)
     if not tl:
         raise HTTPException(status_code=404, detail="Tierlist not found.")
-
-    # 2️⃣ Fetch all items in that tierlist
-    item_rows = await database.fetch_all(
-        select(items).where(items.c.tierlist_id == tierlist_id)
+    not_modified = conditional(
+        request, response, version_etag(tierlist_id, tl["version"], "votes", int(stats))
+    )
+    if not_modified:
+        return not_modified
+
+    # 2️⃣ Count votes per (item, tier) for the whole tierlist in one query
+    return await cached_payload(
+        db,
+        ("votes", tierlist_id, tl["version"], stats),
+        lambda db: fetch_vote_tallies(db, tierlist_id, with_stats=stats),
     )
-
-    results = []
-    for item in item_rows:
-        item_id = item["id"]
-        # 3️⃣ Count votes per tier_id for this item
-        vote_counts = await database.fetch_all(
-            select(votes.c.tier_id, text("COUNT(*) AS count"))
-            .where(votes.c.item_id == item_id)
-            .group_by(votes.c.tier_id)
-        )
-        # Build a dict { tier_id: count }
-        counts_dict = {row["tier_id"]: row["count"] for row in vote_counts}
-        results.append(
-            {
-                "item_id": item_id,
-                "name": item["name"],
-                "image_url": item["image_url"],
-                "votes": counts_dict,
-            }
-        )
-
-    return results
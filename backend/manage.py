@@ -0,0 +1,87 @@
+"""
+Maintenance commands, run next to main.py (same DATABASE_URL):
+
+    python manage.py migrate
+    python manage.py create-indexes
+    python manage.py rebuild-vote-counts
+    python manage.py verify-vote-counts
+
+`migrate` applies pending schema migrations (migrations.py), same as every
+worker does on startup; run it before a deploy to keep boots fast.
+create-indexes builds missing indexes CONCURRENTLY, without blocking writes.
+"""
+import argparse
+import asyncio
+import sys
+
+from database import database
+from indexes import create_indexes_concurrently
+from migrations import run_migrations, LATEST_VERSION
+from cache import publish_invalidation
+from vote_counts import rebuild_vote_counts, verify_vote_counts
+
+
+async def cmd_migrate(args) -> int:
+    applied = await run_migrations()
+    print(f"applied {applied}" if applied else "schema already current")
+    print(f"schema version {LATEST_VERSION}")
+    return 0
+
+
+async def cmd_create_indexes(args) -> int:
+    built = await create_indexes_concurrently()
+    print(f"{len(built)} indexes built" if built else "all indexes present")
+    return 0
+
+
+async def cmd_rebuild_vote_counts(args) -> int:
+    rows = await rebuild_vote_counts(database)
+    # Cached vote tallies are keyed by tierlist version, which a rebuild doesn't bump
+    await publish_invalidation(database, "payloads")
+    print(f"vote_counts rebuilt: {rows} rows")
+    return 0
+
+
+async def cmd_verify_vote_counts(args) -> int:
+    mismatches = await verify_vote_counts(database)
+    for m in mismatches[: args.limit]:
+        print(
+            f"item {m['item_id']} tier {m['tier_id']}: "
+            f"votes={m['actual']} vote_counts={m['counted']}"
+        )
+    if mismatches:
+        print(f"{len(mismatches)} counters out of sync (run rebuild-vote-counts)")
+        return 1
+    print("vote_counts OK")
+    return 0
+
+
+COMMANDS = {
+    "migrate": cmd_migrate,
+    "create-indexes": cmd_create_indexes,
+    "rebuild-vote-counts": cmd_rebuild_vote_counts,
+    "verify-vote-counts": cmd_verify_vote_counts,
+}
+
+
+async def run(args) -> int:
+    await database.connect()
+    try:
+        return await COMMANDS[args.command](args)
+    finally:
+        await database.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tierlist backend maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="apply pending schema migrations")
+    sub.add_parser("create-indexes", help="build missing indexes without locking writes")
+    sub.add_parser("rebuild-vote-counts", help="recompute vote_counts from votes")
+    verify = sub.add_parser("verify-vote-counts", help="compare vote_counts with votes")
+    verify.add_argument("--limit", type=int, default=50, help="mismatches to print")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import asyncio
+import os
+import time
+
+import asyncpg
+
+from database import SYNC_DATABASE_URL
+from indexes import UNIQUE_VOTES_INDEX, build_concurrently
+from ordering import POSITION_GAP
+from vote_counts import TRIGGER_DDL, LOCK_VOTES, CLEAR_COUNTS, BACKFILL_COUNTS
+
+#######################
+# Configuration
+#######################
+
+# How long a booting worker waits for Postgres to accept connections
+MIGRATION_CONNECT_TIMEOUT = float(os.getenv("MIGRATION_CONNECT_TIMEOUT", 60))
+# pg_advisory_lock key; only the worker holding it applies migrations
+MIGRATION_LOCK_ID = 7_240_001
+LOCK_POLL_SECONDS = 0.5
+
+# Filled in by run_migrations(), reported by the health endpoints
+state = {"version": None, "latest": None, "applied": [], "seconds": None}
+
+
+#######################
+# Migrations
+#######################
+#
+# Each one is (version, name, async fn(conn), transactional). Transactional
+# ones run in a transaction together with their schema_migrations row; the
+# others (CREATE INDEX CONCURRENTLY can't run in a transaction) are recorded
+# after they finished and have to be safe to re-run.
+#
+# Databases created before this runner existed already have most of this
+# schema, so every step is written to be a no-op when its change is there.
+#
+# The DDL is spelled out as it stood when each step was added and must not be
+# derived from models.py: a migration has to do the same thing on every
+# database, whatever models.py looks like by the time it runs. Schema changes
+# go into a new step.
+
+# v1: the tables as of the migration runner (indexes come with v4)
+BASELINE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS tierlists ("
+    "id SERIAL NOT NULL, "
+    "name VARCHAR(100) NOT NULL, "
+    "creator_id VARCHAR(64) NOT NULL, "
+    "version BIGINT DEFAULT '0' NOT NULL, "
+    "PRIMARY KEY (id))",
+    "CREATE TABLE IF NOT EXISTS tierlist_changes ("
+    "id BIGSERIAL NOT NULL, "
+    "tierlist_id INTEGER NOT NULL, "
+    "version BIGINT NOT NULL, "
+    "kind VARCHAR(40) NOT NULL, "
+    "data JSON, "
+    "created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY(tierlist_id) REFERENCES tierlists (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS tiers ("
+    "id SERIAL NOT NULL, "
+    "tierlist_id INTEGER, "
+    "name VARCHAR(100) NOT NULL, "
+    "colour VARCHAR(20) NOT NULL, "
+    "position FLOAT NOT NULL, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY(tierlist_id) REFERENCES tierlists (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS items ("
+    "id SERIAL NOT NULL, "
+    "tierlist_id INTEGER, "
+    "tier_id INTEGER, "
+    "position FLOAT NOT NULL, "
+    "name VARCHAR(100) NOT NULL, "
+    "image_url VARCHAR(200), "
+    "preview_url VARCHAR(200), "
+    "variants JSON, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY(tierlist_id) REFERENCES tierlists (id) ON DELETE CASCADE, "
+    "FOREIGN KEY(tier_id) REFERENCES tiers (id) ON DELETE SET NULL)",
+    "CREATE TABLE IF NOT EXISTS vote_counts ("
+    "item_id INTEGER NOT NULL, "
+    "tier_id INTEGER NOT NULL, "
+    "count INTEGER DEFAULT '0' NOT NULL, "
+    "PRIMARY KEY (item_id, tier_id), "
+    "FOREIGN KEY(item_id) REFERENCES items (id) ON DELETE CASCADE, "
+    "FOREIGN KEY(tier_id) REFERENCES tiers (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS votes ("
+    "id SERIAL NOT NULL, "
+    "user_id VARCHAR(100) NOT NULL, "
+    "item_id INTEGER, "
+    "tier_id INTEGER, "
+    "PRIMARY KEY (id), "
+    "CONSTRAINT uq_votes_user_item UNIQUE (user_id, item_id), "
+    "FOREIGN KEY(item_id) REFERENCES items (id) ON DELETE CASCADE, "
+    "FOREIGN KEY(tier_id) REFERENCES tiers (id) ON DELETE CASCADE)",
+)
+
+# v4
+BASELINE_INDEXES = [
+    ("uq_votes_user_item", UNIQUE_VOTES_INDEX),
+    ("ix_tierlists_creator_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tierlists_creator_id ON tierlists (creator_id, id)"),
+    ("ix_tierlist_changes_tierlist_version",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tierlist_changes_tierlist_version "
+     "ON tierlist_changes (tierlist_id, version)"),
+    ("ix_tiers_tierlist_position",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tiers_tierlist_position ON tiers (tierlist_id, position)"),
+    ("ix_items_tier_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_tier_id ON items (tier_id)"),
+    ("ix_items_tierlist_tier_position",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_tierlist_tier_position "
+     "ON items (tierlist_id, tier_id, position, id)"),
+    ("ix_vote_counts_tier_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vote_counts_tier_id ON vote_counts (tier_id)"),
+    ("ix_votes_item_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_votes_item_id ON votes (item_id)"),
+    ("ix_votes_tier_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_votes_tier_id ON votes (tier_id)"),
+]
+
+# v6 (pg_trgm is a trusted extension since Postgres 13)
+NAME_SEARCH_INDEXES = [
+    ("ix_tierlists_name_trgm",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tierlists_name_trgm "
+     "ON tierlists USING gin (name gin_trgm_ops)"),
+]
+
+# v7
+SNAPSHOTS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS tierlist_snapshots ("
+    "id BIGSERIAL NOT NULL, "
+    "tierlist_id INTEGER NOT NULL, "
+    "version BIGINT NOT NULL, "
+    "kind VARCHAR(10) NOT NULL, "
+    "base_id BIGINT, "
+    "label VARCHAR(100), "
+    "data JSON NOT NULL, "
+    "created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY(tierlist_id) REFERENCES tierlists (id) ON DELETE CASCADE, "
+    "FOREIGN KEY(base_id) REFERENCES tierlist_snapshots (id) ON DELETE CASCADE)"
+)
+
+# v8
+SNAPSHOTS_INDEXES = [
+    ("ix_tierlist_snapshots_tierlist_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tierlist_snapshots_tierlist_id "
+     "ON tierlist_snapshots (tierlist_id, id)"),
+    ("ix_tierlist_snapshots_base_id",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tierlist_snapshots_base_id "
+     "ON tierlist_snapshots (base_id)"),
+]
+
+
+def _log(line: str):
+    print(f"Migration: {line}")
+
+
+async def _baseline(conn):
+    for statement in BASELINE_TABLES:
+        await conn.execute(statement)
+
+
+async def _late_columns(conn):
+    await conn.execute(
+        "ALTER TABLE items ADD COLUMN IF NOT EXISTS position DOUBLE PRECISION NOT NULL DEFAULT 0"
+    )
+    await conn.execute("ALTER TABLE items ADD COLUMN IF NOT EXISTS variants JSON")
+    await conn.execute(
+        "ALTER TABLE tierlists ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0"
+    )
+
+
+async def _sparse_positions(conn):
+    # Dense integer positions -> sparse float positions (ordering.py)
+    for table in ("items", "tiers"):
+        data_type = await conn.fetchval(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = $1 AND column_name = 'position'",
+            table,
+        )
+        if data_type == "integer":
+            await conn.execute(
+                f"ALTER TABLE {table} ALTER COLUMN position "
+                f"TYPE DOUBLE PRECISION USING position * {POSITION_GAP}"
+            )
+
+
+async def _baseline_indexes(conn):
+    await build_concurrently(conn, BASELINE_INDEXES, _log)
+
+
+async def _vote_count_triggers(conn):
+    # Needs the unique vote index (duplicate votes are gone by then)
+    for statement in TRIGGER_DDL:
+        await conn.execute(statement)
+    await conn.execute(LOCK_VOTES)
+    await conn.execute(CLEAR_COUNTS)
+    await conn.execute(BACKFILL_COUNTS)
+
+
+async def _name_search_index(conn):
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    await build_concurrently(conn, NAME_SEARCH_INDEXES, _log)
+
+
+async def _snapshots_table(conn):
+    await conn.execute(SNAPSHOTS_TABLE)
+
+
+async def _snapshots_indexes(conn):
+    await build_concurrently(conn, SNAPSHOTS_INDEXES, _log)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _baseline, True),
+    (2, "items.position, items.variants, tierlists.version", _late_columns, True),
+    (3, "sparse float positions", _sparse_positions, True),
+    (4, "indexes and unique (user_id, item_id) votes", _baseline_indexes, False),
+    (5, "vote_counts triggers", _vote_count_triggers, True),
+    (6, "pg_trgm tierlist name search index", _name_search_index, False),
+    (7, "tierlist_snapshots table", _snapshots_table, True),
+    (8, "tierlist_snapshots indexes", _snapshots_indexes, False),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+#######################
+# Runner
+#######################
+
+
+async def _connect(dsn: str, timeout: float):
+    # Non-blocking readiness wait: the event loop keeps running meanwhile
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.1
+    while True:
+        try:
+            return await asyncpg.connect(dsn, timeout=5)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+            if loop.time() >= deadline:
+                raise RuntimeError(
+                    f"Unable to connect to the database within {timeout:.0f}s. Last error: {e}"
+                )
+            print(f"Postgres not ready yet, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+async def _current_version(conn) -> int:
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return 0
+    return await conn.fetchval("SELECT COALESCE(max(version), 0) FROM schema_migrations")
+
+
+async def _record(conn, version: int, name: str):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2) "
+        "ON CONFLICT (version) DO NOTHING",
+        version,
+        name,
+    )
+
+
+async def _acquire_lock(conn):
+    # Poll instead of blocking in pg_advisory_lock(): a session waiting on
+    # the lock would hold up the lock owner's CREATE INDEX CONCURRENTLY,
+    # which waits for every running statement to finish
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+        await asyncio.sleep(LOCK_POLL_SECONDS)
+
+
+async def run_migrations(dsn: str = SYNC_DATABASE_URL, timeout: float = MIGRATION_CONNECT_TIMEOUT) -> list:
+    """
+    Brings the schema up to LATEST_VERSION. One worker migrates under an
+    advisory lock while the others wait; a worker that finds the schema
+    current returns after a single query. Returns the applied versions.
+    """
+    started = time.perf_counter()
+    state["latest"] = LATEST_VERSION
+    conn = await _connect(dsn, timeout)
+    applied = []
+    try:
+        current = await _current_version(conn)
+        if current < LATEST_VERSION:
+            await _acquire_lock(conn)
+            try:
+                await conn.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                    "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+                )
+                # Another worker may have done the work while we waited
+                current = await _current_version(conn)
+                for version, name, fn, transactional in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    print(f"Migration {version}: {name}")
+                    if transactional:
+                        async with conn.transaction():
+                            await fn(conn)
+                            await _record(conn, version, name)
+                    else:
+                        await fn(conn)
+                        await _record(conn, version, name)
+                    applied.append(version)
+                    current = version
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+        state["version"] = current
+    finally:
+        await conn.close()
+    state["applied"] = applied
+    state["seconds"] = time.perf_counter() - started
+    return applied
+
+
+def migration_status() -> dict:
+    return {**state, "current": state["version"] == state["latest"]}
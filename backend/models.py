@@ -1,4 +1,18 @@
-from sqlalchemy import Table, Column, Integer, String, ForeignKey
+from sqlalchemy import (
+    Table,
+    Column,
+    Integer,
+    BigInteger,
+    Float,
+    String,
+    ForeignKey,
+    JSON,
+    DateTime,
+    func,
+    UniqueConstraint,
+    PrimaryKeyConstraint,
+    Index,
+)
 from database import metadata  # absolute import of the MetaData object
 
 
@@ -9,6 +23,17 @@ tierlists = Table(
     Column("id", Integer, primary_key=True, index=True),
     Column("name", String(100), nullable=False),
     Column("creator_id", String(64), nullable=False),  # linked to Authentik user ID later
+    # Bumped by every tier / item / vote change, see changes.py
+    Column("version", BigInteger, nullable=False, server_default="0"),
+    # Dashboards: "lists by this creator", newest first
+    Index("ix_tierlists_creator_id", "creator_id", "id"),
+    # Dashboard name search (ILIKE '%...%'), needs the pg_trgm extension
+    Index(
+        "ix_tierlists_name_trgm",
+        "name",
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    ),
 )
 
 # 2) Tier table: one row per tier, linked to a tierlist
@@ -19,7 +44,8 @@ tiers = Table(
     Column("tierlist_id", Integer, ForeignKey("tierlists.id", ondelete="CASCADE")),
     Column("name", String(100), nullable=False),   # e.g., "S-Tier", "A-Tier"
     Column("colour", String(20), nullable=False),  # e.g., "#FFCC00"
-    Column("position", Integer, nullable=False),   # numeric order: 0, 1, 2, ...
+    Column("position", Float, nullable=False),     # sparse order: 0, 1024, 2048, ... (see ordering.py)
+    Index("ix_tiers_tierlist_position", "tierlist_id", "position"),
 )
 
 # 3) Item table: one row per item—each can be assigned to a tier
@@ -29,11 +55,17 @@ items = Table(
     Column("id", Integer, primary_key=True, index=True),
     Column("tierlist_id", Integer, ForeignKey("tierlists.id", ondelete="CASCADE")),
     Column("tier_id", Integer, ForeignKey("tiers.id", ondelete="SET NULL"), nullable=True),
-    Column("position", Integer, nullable=False, default=0),
+    Column("position", Float, nullable=False, default=0),
     Column("name", String(100), nullable=False),
     Column("image_url", String(200), nullable=True),
     Column("preview_url", String(200), nullable=True),
-
+    # srcset derivatives: [{"url", "width", "height", "format"}, ...]
+    Column("variants", JSON, nullable=True),
+    # Board loads: WHERE tierlist_id = ? ORDER BY tier_id, position, id
+    # (also serves every plain "items of this tierlist" lookup)
+    Index("ix_items_tierlist_tier_position", "tierlist_id", "tier_id", "position", "id"),
+    # ON DELETE SET NULL from tiers
+    Index("ix_items_tier_id", "tier_id"),
 )
 
 # ─── Votes table: one row per (user, item) ───
@@ -44,6 +76,54 @@ votes = Table(
     Column("user_id", String(100), nullable=False),    # store Authentik’s “sub” or “uid” as string
     Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE")),
     Column("tier_id", Integer, ForeignKey("tiers.id", ondelete="CASCADE")),
-    # We’ll enforce “one vote per user per item” in code, not via a DB constraint for simplicity.
+    # One vote per user per item; vote_ingest.py upserts against this
+    # (its leading column also serves the "my votes" lookups by user_id)
+    UniqueConstraint("user_id", "item_id", name="uq_votes_user_item"),
+    # ON DELETE CASCADE from items / tiers, and vote_counts rebuilds
+    Index("ix_votes_item_id", "item_id"),
+    Index("ix_votes_tier_id", "tier_id"),
+)
+
+
+# ─── Vote counters: (item, tier) -> count, maintained by triggers on votes ───
+# (see vote_counts.py; rebuild/verify with `python manage.py ...-vote-counts`)
+vote_counts = Table(
+    "vote_counts",
+    metadata,
+    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False),
+    Column("tier_id", Integer, ForeignKey("tiers.id", ondelete="CASCADE"), nullable=False),
+    Column("count", Integer, nullable=False, server_default="0"),
+    PrimaryKeyConstraint("item_id", "tier_id"),
+    Index("ix_vote_counts_tier_id", "tier_id"),
 )
 
+# ─── Change log: one row per tierlist version, for "changes since N" ───
+tierlist_changes = Table(
+    "tierlist_changes",
+    metadata,
+    Column("id", BigInteger, primary_key=True),
+    Column("tierlist_id", Integer, ForeignKey("tierlists.id", ondelete="CASCADE"), nullable=False),
+    Column("version", BigInteger, nullable=False),
+    Column("kind", String(40), nullable=False),         # e.g. "item_added", "items_moved"
+    Column("data", JSON, nullable=True),                # small delta payload
+    Column("created_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+    Index("ix_tierlist_changes_tierlist_version", "tierlist_id", "version"),
+)
+
+# ─── Version history: layout snapshots, mostly deltas against a checkpoint ───
+# (see snapshots.py)
+tierlist_snapshots = Table(
+    "tierlist_snapshots",
+    metadata,
+    Column("id", BigInteger, primary_key=True),
+    Column("tierlist_id", Integer, ForeignKey("tierlists.id", ondelete="CASCADE"), nullable=False),
+    Column("version", BigInteger, nullable=False),      # tierlist version it captures
+    Column("kind", String(10), nullable=False),         # "full" checkpoint or "delta"
+    # The checkpoint a delta applies to
+    Column("base_id", BigInteger, ForeignKey("tierlist_snapshots.id", ondelete="CASCADE"), nullable=True),
+    Column("label", String(100), nullable=True),
+    Column("data", JSON, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+    Index("ix_tierlist_snapshots_tierlist_id", "tierlist_id", "id"),
+    Index("ix_tierlist_snapshots_base_id", "base_id"),
+)
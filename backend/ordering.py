@@ -0,0 +1,43 @@
+# Sparse ordering: positions are floats spaced POSITION_GAP apart, so inserting
+# or moving something only ever writes that one row (we pick a value between
+# its new neighbours). Once two neighbours get closer than MIN_GAP the
+# items of the affected tier are re-spaced in a single UPDATE, which is rare.
+POSITION_GAP = 1024.0
+MIN_GAP = 1e-6
+
+
+def position_between(before, after):
+    """
+    Returns a position strictly between `before` and `after` (either may be
+    None for "start"/"end"), or None when the gap is used up and the
+    caller has to rebalance first.
+    """
+    if before is None and after is None:
+        return 0.0
+    if before is None:
+        return after - POSITION_GAP
+    if after is None:
+        return before + POSITION_GAP
+    if after - before < MIN_GAP:
+        return None
+    mid = (before + after) / 2
+    if not before < mid < after:
+        return None
+    return mid
+
+
+def initial_positions(count: int) -> list:
+    return [idx * POSITION_GAP for idx in range(count)]
+
+
+async def rebalance_items(db, tierlist_id: int, tier_id) -> None:
+    """Re-spaces the items of one tier (or the unassigned row) in one statement."""
+    await db.execute(
+        "UPDATE items SET position = r.rn * CAST(:gap AS DOUBLE PRECISION) FROM ("
+        "  SELECT id, row_number() OVER (ORDER BY position, id) - 1 AS rn"
+        "  FROM items WHERE tierlist_id = :tierlist_id"
+        "  AND tier_id IS NOT DISTINCT FROM :tier_id"
+        ") AS r WHERE items.id = r.id",
+        {"gap": POSITION_GAP, "tierlist_id": tierlist_id, "tier_id": tier_id},
+    )
+
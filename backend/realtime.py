@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import asyncpg
+
+from database import SYNC_DATABASE_URL
+
+# One Postgres channel for all tierlists; every uvicorn worker LISTENs on it
+# with a dedicated connection and fans messages out to its own subscribers.
+CHANNEL = "tierlist_events"
+# NOTIFY payloads are capped at 8000 bytes; bigger deltas become a "resync"
+NOTIFY_PAYLOAD_LIMIT = 7900
+SUBSCRIBER_QUEUE_SIZE = 256
+RECONNECT_SECONDS = 2
+# SSE comment line sent when nothing happened, keeps proxies from closing the stream
+KEEPALIVE_SECONDS = 15
+
+
+class TierlistHub:
+    def __init__(self):
+        self._subscribers = {}  # tierlist_id -> set of asyncio.Queue
+        self._listeners = {}  # channel -> callables getting every message (e.g. cache invalidation)
+        self._conn = None
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def _supervise(self):
+        # Keep one LISTEN connection alive; reconnect if Postgres drops it
+        while True:
+            if not self.connected:
+                try:
+                    self._conn = await asyncpg.connect(SYNC_DATABASE_URL)
+                    await self._conn.add_listener(CHANNEL, self._on_notify)
+                    for channel in self._listeners.keys() - {CHANNEL}:
+                        await self._conn.add_listener(channel, self._on_channel_notify)
+                except Exception as e:
+                    print(f"Realtime LISTEN connection failed: {e}")
+                    self._conn = None
+                else:
+                    # Anything may have happened while we were deaf
+                    for listeners in self._listeners.values():
+                        for listener in listeners:
+                            listener({"kind": "resync"})
+                    self._broadcast_resync()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        for listener in self._listeners.get(CHANNEL, ()):
+            listener(message)
+        for queue in list(self._subscribers.get(message.get("tierlist_id"), ())):
+            self._deliver(queue, message)
+
+    def _on_channel_notify(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        for listener in self._listeners.get(channel, ()):
+            listener(message)
+
+    def _deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop the backlog and tell it to refetch instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"tierlist_id": message.get("tierlist_id"), "kind": "resync"})
+
+    def _broadcast_resync(self):
+        for tierlist_id, queues in self._subscribers.items():
+            for queue in list(queues):
+                self._deliver(queue, {"tierlist_id": tierlist_id, "kind": "resync"})
+
+    def add_listener(self, callback, channel: str = CHANNEL):
+        """Calls callback(message) for every NOTIFY on `channel`; register before start()."""
+        self._listeners.setdefault(channel, []).append(callback)
+
+    def subscribe(self, tierlist_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(tierlist_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, tierlist_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(tierlist_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[tierlist_id]
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "tierlists": len(self._subscribers),
+            "subscribers": sum(len(q) for q in self._subscribers.values()),
+        }
+
+
+hub = TierlistHub()
+
+
+async def notify(db, message: dict):
+    """
+    pg_notify()s a message to every worker. Inside a transaction Postgres only
+    delivers it on commit, so rolled back changes are never pushed.
+    """
+    payload = json.dumps(message, default=str)
+    if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+        payload = json.dumps(
+            {
+                "tierlist_id": message.get("tierlist_id"),
+                "version": message.get("version"),
+                "kind": "resync",
+            }
+        )
+    await db.execute(
+        "SELECT pg_notify(:channel, :payload)",
+        {"channel": CHANNEL, "payload": payload},
+    )
+
+
+def sse_event(message: dict) -> str:
+    lines = []
+    if message.get("version") is not None:
+        lines.append(f"id: {message['version']}")
+    lines.append(f"data: {json.dumps(message, default=str)}")
+    return "\n".join(lines) + "\n\n"
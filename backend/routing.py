@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+
+from fastapi import Request
+from sqlalchemy import text
+
+from database import database, replica
+
+#######################
+# Configuration
+#######################
+
+# Reads go back to the primary while the replica is further behind than this
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 2))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 1))
+# After a write, that session's reads stay on the primary for this long, so
+# users always see their own changes
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 10))
+STICKY_SESSION_KEY = "db_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Zero while the replica has replayed everything it received; otherwise the
+# age of the last replayed transaction. A server that is not a standby at all
+# (e.g. a second local Postgres standing in for one) reports no lag.
+REPLICA_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END "
+    "AS lag"
+)
+
+
+class ReplicaRouter:
+    """
+    Decides per request whether reads may use the replica: only if one is
+    configured, connected, and its measured lag is below REPLICA_MAX_LAG, and
+    the session didn't write in the last REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, primary, replica):
+        self.primary = primary
+        self.replica = replica
+        self.lag = None
+        self.healthy = False
+        self._task = None
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "sticky_reads": 0, "lag_failures": 0}
+
+    async def start(self):
+        if self.replica is not None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.replica is not None and self.replica.is_connected:
+            await self.replica.disconnect()
+
+    async def _monitor(self):
+        while True:
+            try:
+                if not self.replica.is_connected:
+                    await self.replica.connect()
+                self.lag = float(await self.replica.fetch_val(REPLICA_LAG))
+                self.healthy = self.lag <= REPLICA_MAX_LAG
+            except Exception as e:
+                if self.healthy:
+                    print(f"Replica unavailable, reading from the primary: {e}")
+                self.stats["lag_failures"] += 1
+                self.healthy = False
+            await asyncio.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+    def for_request(self, request: Request):
+        if request.session.get(STICKY_SESSION_KEY, 0) > time.time():
+            self.stats["sticky_reads"] += 1
+            return self.primary
+        if self.replica is None or not self.healthy:
+            self.stats["primary_reads"] += 1
+            return self.primary
+        self.stats["replica_reads"] += 1
+        return self.replica
+
+    def snapshot_stats(self) -> dict:
+        return {
+            **self.stats,
+            "configured": self.replica is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "max_lag_seconds": REPLICA_MAX_LAG,
+        }
+
+
+router = ReplicaRouter(database, replica)
+
+
+def read_database(request: Request):
+    """Dependency for read-only handlers: the replica when it's safe, else the primary."""
+    return router.for_request(request)
+
+
+class StickyPrimaryMiddleware:
+    """
+    Marks the session after every successful write so the user's following
+    reads go to the primary (read-your-writes). Must run inside
+    SessionMiddleware: it edits scope["session"] before the cookie is written.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or router.replica is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                scope["session"][STICKY_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
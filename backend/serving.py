@@ -0,0 +1,172 @@
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+# Files named after their sha256 (see images.store_upload) never change
+CONTENT_NAMED = re.compile(r"^[0-9a-f]{64}([_.])")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, no-cache"
+RANGE_CHUNK_SIZE = 256 * 1024
+# Precompressed siblings we look for ("logo.svg" -> "logo.svg.br"), best first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(path: Path, stat_result: os.stat_result) -> str:
+    if CONTENT_NAMED.match(path.name):
+        # Strong validator straight from the name, no hashing of the file needed
+        return f'"{path.name}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def _parse_range(header: str, size: int):
+    """
+    Returns (start, end) inclusive for a single "bytes=" range, "invalid" if
+    it can't be satisfied, or None to ignore it (multi-range, garbage).
+    """
+    match = _RANGE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+def _file_chunks(path: Path, start: int, end: int):
+    async def body():
+        f = await run_in_threadpool(open, path, "rb")
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await run_in_threadpool(f.read, min(RANGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+    return body()
+
+
+def cached_file_response(
+    request_headers: Headers,
+    path: Path,
+    stat_result: os.stat_result = None,
+    status_code: int = 200,
+) -> Response:
+    """
+    FileResponse with proper HTTP caching:
+      - strong ETag (the file name for content-addressed files) + If-None-Match -> 304
+      - Cache-Control immutable for content-named files, revalidate otherwise
+      - single byte Range requests -> 206 / 416 (If-Range aware)
+      - .br / .gz siblings served with Content-Encoding when the client accepts them
+    Full responses go through FileResponse, which uses sendfile when the server supports it.
+    """
+    if stat_result is None:
+        stat_result = path.stat()
+    etag = _etag(path, stat_result)
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE if CONTENT_NAMED.match(path.name) else REVALIDATE_CACHE,
+    }
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    # Byte ranges refer to the uncompressed file, so precompressed siblings are
+    # only considered for plain full-body requests
+    range_header = request_headers.get("range") if status_code == 200 else None
+    encoding, serve_path = None, path
+    if not range_header:
+        accepted = request_headers.get("accept-encoding", "")
+        for candidate, suffix in PRECOMPRESSED:
+            compressed = path.with_name(path.name + suffix)
+            if candidate in accepted and compressed.is_file():
+                encoding, serve_path = candidate, compressed
+                # Every representation needs its own strong validator
+                etag = f'{etag[:-1]}-{candidate}"'
+                headers["Content-Encoding"] = candidate
+                break
+        if any(path.with_name(path.name + suffix).is_file() for _, suffix in PRECOMPRESSED):
+            headers["Vary"] = "Accept-Encoding"
+    headers["ETag"] = etag
+    if encoding is None:
+        headers["Accept-Ranges"] = "bytes"
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if_range = request_headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        size = stat_result.st_size
+        byte_range = _parse_range(range_header, size)
+        if byte_range == "invalid":
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _file_chunks(path, start, end),
+                status_code=206,
+                headers=headers,
+                media_type=media_type,
+            )
+
+    return FileResponse(
+        serve_path,
+        status_code=status_code,
+        stat_result=stat_result if encoding is None else None,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+def serve_file(request, path: Path) -> Response:
+    """cached_file_response for a route handler; 404s on anything but a regular file."""
+    try:
+        stat_result = path.stat()
+    except OSError:
+        stat_result = None
+    if stat_result is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found.")
+    return cached_file_response(request.headers, path, stat_result)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles whose responses go through cached_file_response."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        path = Path(full_path)
+        if path.name.endswith("_manifest.json") or path.name.startswith("."):
+            # Derivative manifests and in-flight temp files are internal
+            return Response("Not Found", status_code=404)
+        return cached_file_response(Headers(scope=scope), path, stat_result, status_code)
@@ -0,0 +1,356 @@
+import json
+import os
+
+from sqlalchemy import select, insert, func
+
+from models import tiers, items, tierlist_snapshots
+from ordering import POSITION_GAP
+
+# Version history: the board's layout (tier definitions + item placements)
+# is snapshotted every SNAPSHOT_EVERY versions and on demand. Most rows are
+# deltas against the newest full checkpoint, so any snapshot is rebuilt from
+# at most two rows:
+#   full:  {"tiers": [[id, name, colour, position], ...],
+#           "items": [[id, tier_id, position], ...]}
+#   delta: {"tiers": [<changed/added tier rows>], "items": [<changed/added item rows>],
+#           "removed_tiers": [id, ...], "removed_items": [id, ...]}
+# Item names/images are not part of it: items deleted since a snapshot
+# can't come back, items added since are moved to "unassigned" on revert.
+
+#######################
+# Configuration
+#######################
+
+SNAPSHOT_EVERY = int(os.getenv("SNAPSHOT_EVERY", 50))
+# A new checkpoint after this many deltas, or once a delta gets bigger than
+# half a checkpoint
+SNAPSHOT_CHECKPOINT_EVERY = int(os.getenv("SNAPSHOT_CHECKPOINT_EVERY", 20))
+# Snapshots kept per tierlist (checkpoints still needed by a delta stay)
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", 200))
+
+
+class SnapshotNotFound(LookupError):
+    pass
+
+
+#######################
+# State encoding
+#######################
+#
+# In memory a state is {"tiers": {id: [name, colour, position]},
+#                       "items": {id: [tier_id, position]}}
+
+
+async def load_state(db, tierlist_id: int) -> dict:
+    """The tierlist's current layout, read in two queries."""
+    tier_rows = await db.fetch_all(
+        select(tiers.c.id, tiers.c.name, tiers.c.colour, tiers.c.position).where(
+            tiers.c.tierlist_id == tierlist_id
+        )
+    )
+    item_rows = await db.fetch_all(
+        select(items.c.id, items.c.tier_id, items.c.position).where(
+            items.c.tierlist_id == tierlist_id
+        )
+    )
+    return {
+        "tiers": {r["id"]: [r["name"], r["colour"], r["position"]] for r in tier_rows},
+        "items": {r["id"]: [r["tier_id"], r["position"]] for r in item_rows},
+    }
+
+
+def _encode_full(state: dict) -> dict:
+    return {
+        section: [[key, *value] for key, value in sorted(state[section].items())]
+        for section in ("tiers", "items")
+    }
+
+
+def _decode_full(data: dict) -> dict:
+    return {section: {row[0]: list(row[1:]) for row in data[section]} for section in ("tiers", "items")}
+
+
+def _delta(base: dict, state: dict) -> dict:
+    delta = {}
+    for section in ("tiers", "items"):
+        old, new = base[section], state[section]
+        delta[section] = [[key, *value] for key, value in sorted(new.items()) if old.get(key) != value]
+        delta[f"removed_{section}"] = sorted(key for key in old if key not in new)
+    return delta
+
+
+def _apply(base: dict, delta: dict) -> dict:
+    state = {}
+    for section in ("tiers", "items"):
+        rows = dict(base[section])
+        for key in delta[f"removed_{section}"]:
+            rows.pop(key, None)
+        rows.update((row[0], list(row[1:])) for row in delta[section])
+        state[section] = rows
+    return state
+
+
+def _size(data: dict) -> int:
+    return sum(len(value) for value in data.values())
+
+
+def _data(value):
+    # JSON columns come back as text from some drivers
+    return json.loads(value) if isinstance(value, str) else value
+
+
+#######################
+# Capture
+#######################
+
+
+async def _fetch_snapshot(db, tierlist_id: int, snapshot_id: int):
+    return await db.fetch_one(
+        select(tierlist_snapshots).where(
+            (tierlist_snapshots.c.id == snapshot_id)
+            & (tierlist_snapshots.c.tierlist_id == tierlist_id)
+        )
+    )
+
+
+async def _rebuild(db, row) -> dict:
+    if row["kind"] == "full":
+        return _decode_full(_data(row["data"]))
+    checkpoint = await _fetch_snapshot(db, row["tierlist_id"], row["base_id"])
+    return _apply(_decode_full(_data(checkpoint["data"])), _data(row["data"]))
+
+
+async def snapshot_due(db, tierlist_id: int, version: int) -> bool:
+    """True once `version` is SNAPSHOT_EVERY versions past the newest snapshot (one index lookup)."""
+    latest = await db.fetch_val(
+        select(tierlist_snapshots.c.version)
+        .where(tierlist_snapshots.c.tierlist_id == tierlist_id)
+        .order_by(tierlist_snapshots.c.id.desc())
+        .limit(1)
+    )
+    return version - (latest or 0) >= SNAPSHOT_EVERY
+
+
+async def capture_snapshot(db, tierlist_id: int, version: int, label: str = None, force: bool = False):
+    """
+    Stores the current layout as a snapshot of `version`, as a delta when the
+    newest checkpoint allows it. Unless `force`d, nothing is stored when the
+    layout didn't change since the previous snapshot (e.g. only votes came in).
+    Call it inside the transaction that produced `version`.
+    Returns the new snapshot's id, or None.
+    """
+    state = await load_state(db, tierlist_id)
+    latest = await db.fetch_one(
+        select(tierlist_snapshots)
+        .where(tierlist_snapshots.c.tierlist_id == tierlist_id)
+        .order_by(tierlist_snapshots.c.id.desc())
+        .limit(1)
+    )
+    values = {"kind": "full", "base_id": None, "data": _encode_full(state)}
+    if latest is not None:
+        checkpoint = latest if latest["kind"] == "full" else await _fetch_snapshot(
+            db, tierlist_id, latest["base_id"]
+        )
+        base = _decode_full(_data(checkpoint["data"]))
+        previous = base if latest is checkpoint else _apply(base, _data(latest["data"]))
+        if previous == state and not force:
+            return None
+        deltas = await db.fetch_val(
+            select(func.count()).where(
+                (tierlist_snapshots.c.tierlist_id == tierlist_id)
+                & (tierlist_snapshots.c.base_id == checkpoint["id"])
+            )
+        )
+        delta = _delta(base, state)
+        if deltas < SNAPSHOT_CHECKPOINT_EVERY and _size(delta) * 2 <= _size(values["data"]):
+            values = {"kind": "delta", "base_id": checkpoint["id"], "data": delta}
+
+    snapshot_id = await db.execute(
+        insert(tierlist_snapshots)
+        .values(tierlist_id=tierlist_id, version=version, label=label, **values)
+        .returning(tierlist_snapshots.c.id)
+    )
+    await _prune(db, tierlist_id)
+    return snapshot_id
+
+
+async def _prune(db, tierlist_id: int):
+    await db.execute(
+        "DELETE FROM tierlist_snapshots s WHERE s.tierlist_id = :tierlist_id"
+        " AND s.id < ("
+        "   SELECT id FROM tierlist_snapshots WHERE tierlist_id = :tierlist_id"
+        "   ORDER BY id DESC OFFSET :keep LIMIT 1"
+        " )"
+        " AND NOT EXISTS (SELECT 1 FROM tierlist_snapshots d WHERE d.base_id = s.id)",
+        {"tierlist_id": tierlist_id, "keep": SNAPSHOT_RETENTION - 1},
+    )
+
+
+#######################
+# Reading
+#######################
+
+
+async def list_snapshots(db, tierlist_id: int, limit: int, before: int = None) -> list:
+    """Newest first; pass the last id as `before` for the next page."""
+    query = select(
+        tierlist_snapshots.c.id,
+        tierlist_snapshots.c.version,
+        tierlist_snapshots.c.kind,
+        tierlist_snapshots.c.label,
+        tierlist_snapshots.c.created_at,
+    ).where(tierlist_snapshots.c.tierlist_id == tierlist_id)
+    if before is not None:
+        query = query.where(tierlist_snapshots.c.id < before)
+    rows = await db.fetch_all(query.order_by(tierlist_snapshots.c.id.desc()).limit(limit))
+    return [dict(r) for r in rows]
+
+
+async def load_snapshot(db, tierlist_id: int, snapshot_id: int):
+    """(snapshot row, state). Raises SnapshotNotFound."""
+    row = await _fetch_snapshot(db, tierlist_id, snapshot_id)
+    if row is None:
+        raise SnapshotNotFound(snapshot_id)
+    return row, await _rebuild(db, row)
+
+
+def state_payload(state: dict) -> dict:
+    """A state in the shape of the tierlist API (tiers / item placements, ordered)."""
+    tier_list = [
+        {"id": tier_id, "name": name, "colour": colour, "position": position}
+        for tier_id, (name, colour, position) in state["tiers"].items()
+    ]
+    item_list = [
+        {"id": item_id, "tier_id": tier_id, "position": position}
+        for item_id, (tier_id, position) in state["items"].items()
+    ]
+    tier_list.sort(key=lambda t: (t["position"], t["id"]))
+    item_list.sort(key=lambda i: (i["tier_id"] is not None, i["tier_id"] or 0, i["position"], i["id"]))
+    return {"tiers": tier_list, "items": item_list}
+
+
+def diff_states(old: dict, new: dict) -> dict:
+    """What changed from `old` to `new`: tiers added/removed/changed, items moved/added/removed."""
+    old_tiers, new_tiers = old["tiers"], new["tiers"]
+    old_items, new_items = old["items"], new["items"]
+
+    def tier(tier_id, row):
+        return {"id": tier_id, "name": row[0], "colour": row[1], "position": row[2]}
+
+    def placement(row):
+        return {"tier_id": row[0], "position": row[1]}
+
+    return {
+        "tiers": {
+            "added": [tier(k, v) for k, v in sorted(new_tiers.items()) if k not in old_tiers],
+            "removed": [tier(k, v) for k, v in sorted(old_tiers.items()) if k not in new_tiers],
+            "changed": [
+                {"id": k, "from": tier(k, old_tiers[k]), "to": tier(k, v)}
+                for k, v in sorted(new_tiers.items())
+                if k in old_tiers and old_tiers[k] != v
+            ],
+        },
+        "items": {
+            "added": sorted(k for k in new_items if k not in old_items),
+            "removed": sorted(k for k in old_items if k not in new_items),
+            "moved": [
+                {"id": k, "from": placement(old_items[k]), "to": placement(v)}
+                for k, v in sorted(new_items.items())
+                if k in old_items and old_items[k] != v
+            ],
+        },
+    }
+
+
+#######################
+# Revert
+#######################
+
+
+async def revert_to_snapshot(db, tierlist_id: int, snapshot_id: int) -> dict:
+    """
+    Rewrites the tierlist's tiers and item placements to the snapshot's in
+    a handful of set-based statements. The layout being replaced is
+    snapshotted first, so a revert can itself be reverted. Tiers created
+    after the snapshot are deleted together with the votes cast for them
+    (snapshots hold no votes, so reverting the revert brings the tiers back
+    empty); the count is reported as "votes_dropped".
+    Run it in a transaction, followed by record_change(); returns the
+    change payload. Raises SnapshotNotFound.
+    """
+    # Serializes against other reverts and against concurrent captures
+    version = await db.fetch_val(
+        "SELECT version FROM tierlists WHERE id = :id FOR UPDATE", {"id": tierlist_id}
+    )
+    row, state = await load_snapshot(db, tierlist_id, snapshot_id)
+    await capture_snapshot(db, tierlist_id, version, label=f"Before revert to v{row['version']}")
+
+    tier_ids = sorted(state["tiers"])
+    votes_dropped = await db.fetch_val(
+        "SELECT count(*) FROM votes v JOIN tiers t ON t.id = v.tier_id"
+        " WHERE t.tierlist_id = :tierlist_id AND NOT (t.id = ANY(CAST(:ids AS INTEGER[])))",
+        {"tierlist_id": tierlist_id, "ids": tier_ids},
+    )
+    deleted = await db.fetch_all(
+        "DELETE FROM tiers WHERE tierlist_id = :tierlist_id"
+        " AND NOT (id = ANY(CAST(:ids AS INTEGER[]))) RETURNING id",
+        {"tierlist_id": tierlist_id, "ids": tier_ids},
+    )
+    # Tiers deleted since the snapshot come back under their old ids
+    await db.execute(
+        "INSERT INTO tiers (id, tierlist_id, name, colour, position)"
+        " SELECT t.id, :tierlist_id, t.name, t.colour, t.position"
+        " FROM unnest(CAST(:ids AS INTEGER[]), CAST(:names AS VARCHAR[]),"
+        "             CAST(:colours AS VARCHAR[]), CAST(:positions AS DOUBLE PRECISION[]))"
+        " AS t(id, name, colour, position)"
+        " ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, colour = EXCLUDED.colour,"
+        " position = EXCLUDED.position WHERE tiers.tierlist_id = EXCLUDED.tierlist_id",
+        {
+            "tierlist_id": tierlist_id,
+            "ids": tier_ids,
+            "names": [state["tiers"][t][0] for t in tier_ids],
+            "colours": [state["tiers"][t][1] for t in tier_ids],
+            "positions": [state["tiers"][t][2] for t in tier_ids],
+        },
+    )
+
+    item_ids = sorted(state["items"])
+    restored = await db.fetch_all(
+        "UPDATE items SET tier_id = v.tier_id, position = v.position"
+        " FROM unnest(CAST(:ids AS INTEGER[]), CAST(:tier_ids AS INTEGER[]),"
+        "             CAST(:positions AS DOUBLE PRECISION[])) AS v(id, tier_id, position)"
+        " WHERE items.id = v.id AND items.tierlist_id = :tierlist_id"
+        " AND (items.tier_id IS DISTINCT FROM v.tier_id OR items.position <> v.position)"
+        " RETURNING items.id",
+        {
+            "tierlist_id": tierlist_id,
+            "ids": item_ids,
+            "tier_ids": [state["items"][i][0] for i in item_ids],
+            "positions": [state["items"][i][1] for i in item_ids],
+        },
+    )
+    # Items added after the snapshot go to the end of the unassigned row
+    unassigned = [p for tier_id, p in state["items"].values() if tier_id is None]
+    unplaced = await db.fetch_all(
+        "UPDATE items SET tier_id = NULL,"
+        " position = CAST(:start AS DOUBLE PRECISION) + r.rn * CAST(:gap AS DOUBLE PRECISION)"
+        " FROM ("
+        "   SELECT id, row_number() OVER (ORDER BY position, id) AS rn"
+        "   FROM items WHERE tierlist_id = :tierlist_id"
+        "   AND NOT (id = ANY(CAST(:ids AS INTEGER[])))"
+        " ) AS r WHERE items.id = r.id RETURNING items.id",
+        {
+            "tierlist_id": tierlist_id,
+            "ids": item_ids,
+            "start": max(unassigned, default=-POSITION_GAP),
+            "gap": POSITION_GAP,
+        },
+    )
+    return {
+        "snapshot_id": row["id"],
+        "snapshot_version": row["version"],
+        "deleted_tier_ids": [r["id"] for r in deleted],
+        "votes_dropped": votes_dropped,
+        "items_restored": len(restored),
+        "items_unassigned": sorted(r["id"] for r in unplaced),
+    }
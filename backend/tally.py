@@ -0,0 +1,88 @@
+from sqlalchemy import select
+
+from models import tiers, items, vote_counts
+
+
+async def fetch_vote_tallies(db, tierlist_id: int, with_stats: bool = False) -> list:
+    """
+    Tallies every item x tier vote count of a tierlist in ONE query over the
+    trigger-maintained vote_counts table (see vote_counts.py), so the cost is
+    O(items x tiers) no matter how many votes were cast.
+
+    With `with_stats` each entry also gets a "stats" block:
+      total          -> number of votes on the item
+      modal_tier_id  -> tier with the most votes (ties go to the higher tier)
+      mean_position  -> average tier rank of the votes (0 = top tier)
+    """
+    # LEFT JOIN so items without any vote still show up (with an empty tally)
+    q = (
+        select(
+            items.c.id,
+            items.c.name,
+            items.c.image_url,
+            vote_counts.c.tier_id,
+            vote_counts.c.count,
+        )
+        .select_from(
+            items.outerjoin(
+                vote_counts,
+                (vote_counts.c.item_id == items.c.id) & (vote_counts.c.count > 0),
+            )
+        )
+        .where(items.c.tierlist_id == tierlist_id)
+        .order_by(items.c.id)
+    )
+    rows = await db.fetch_all(q)
+
+    results = {}
+    for row in rows:
+        entry = results.get(row["id"])
+        if entry is None:
+            entry = results[row["id"]] = {
+                "item_id": row["id"],
+                "name": row["name"],
+                "image_url": row["image_url"],
+                "votes": {},
+            }
+        if row["tier_id"] is not None:
+            entry["votes"][row["tier_id"]] = row["count"]
+
+    if with_stats:
+        tier_rows = await db.fetch_all(
+            select(tiers.c.id)
+            .where(tiers.c.tierlist_id == tierlist_id)
+            .order_by(tiers.c.position)
+        )
+        rank = {r["id"]: idx for idx, r in enumerate(tier_rows)}
+        for entry in results.values():
+            entry["stats"] = vote_stats(entry["votes"], rank)
+
+    return list(results.values())
+
+
+async def fetch_vote_counts(db, tierlist_id: int) -> dict:
+    """
+    {item_id: {tier_id: count}} for every voted item of a tierlist, read from
+    vote_counts. For callers that already have the items (e.g. the snapshot).
+    """
+    rows = await db.fetch_all(
+        select(vote_counts.c.item_id, vote_counts.c.tier_id, vote_counts.c.count)
+        .select_from(vote_counts.join(items, items.c.id == vote_counts.c.item_id))
+        .where((items.c.tierlist_id == tierlist_id) & (vote_counts.c.count > 0))
+    )
+    counts = {}
+    for row in rows:
+        counts.setdefault(row["item_id"], {})[row["tier_id"]] = row["count"]
+    return counts
+
+
+def vote_stats(counts: dict, rank: dict) -> dict:
+    """Derives total / modal tier / mean tier rank from a {tier_id: count} dict."""
+    total = sum(counts.values())
+    if not total:
+        return {"total": 0, "modal_tier_id": None, "mean_position": None}
+    modal = min(counts, key=lambda t: (-counts[t], rank.get(t, len(rank))))
+    ranked = [(rank[t], c) for t, c in counts.items() if t in rank]
+    ranked_total = sum(c for _, c in ranked)
+    mean = sum(r * c for r, c in ranked) / ranked_total if ranked_total else None
+    return {"total": total, "modal_tier_id": modal, "mean_position": mean}
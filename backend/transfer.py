@@ -0,0 +1,490 @@
+import asyncio
+import base64
+import json
+import math
+import os
+import re
+import tempfile
+from pathlib import PurePosixPath
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from models import tierlists, tiers, items, votes
+from bulk_import import (
+    IMPORT_MAX_ENTRY_BYTES,
+    IMPORT_PARALLELISM,
+    allocate_ids,
+    insert_items,
+    derive_with_retries,
+)
+from images import IMAGE_DIR, store_fileobj, item_image_fields
+
+# Whole-tierlist backup / transfer between instances as NDJSON, one record
+# per line, in this order (import relies on it):
+#   {"type": "tierlist", "format": 1, "id", "name", "creator_id", "version"}
+#   {"type": "tier", "id", "name", "colour", "position"}                  ...
+#   {"type": "image", "file", "data": <base64 chunk>, "last": bool}        ... (?images=true)
+#   {"type": "item", "id", "tier_id", "position", "name", "image_url", "preview_url", "variants"} ...
+#   {"type": "vote", "user_id", "item_id", "tier_id"}                      ...
+#   {"type": "end", "counts": {...}}
+# Export reads every table through server-side cursors inside one
+# REPEATABLE READ transaction; import inserts in batches as lines arrive.
+# Neither side ever holds the whole tierlist or a whole image in memory.
+
+#######################
+# Configuration
+#######################
+
+TRANSFER_FORMAT = 1
+# Raw bytes per "image" line (base64 makes it 4/3 of that)
+TRANSFER_IMAGE_CHUNK = 192 * 1024
+# Response body writes are grouped up to about this many bytes
+TRANSFER_FLUSH_BYTES = 64 * 1024
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", 1000))
+TRANSFER_MAX_LINE = 1024 * 1024
+# Limits on an import body, and on each image in it (decoded)
+TRANSFER_MAX_BYTES = int(os.getenv("TRANSFER_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+TRANSFER_MAX_IMAGE_BYTES = IMPORT_MAX_ENTRY_BYTES
+# Which exported votes an import recreates: "none", "mine" (the importing
+# user's own) or "all". "all" writes votes in other users' names, so it is
+# only allowed on instances that opt in (e.g. to move data between them).
+VOTE_SCOPES = ("none", "mine", "all")
+TRANSFER_ALLOW_ALL_VOTES = os.getenv("TRANSFER_ALLOW_ALL_VOTES", "").lower() in ("1", "true", "yes")
+
+# Image URLs an import without image data may keep: files of this instance's
+# content-addressed store (see images.py for the names)
+IMAGE_URL_PREFIX = "/static/images/"
+ORIGINAL_NAME = re.compile(r"(?P<digest>[0-9a-f]{64})(\.[a-z0-9]+)?")
+DERIVATIVE_NAME = r"{digest}_(preview|\d+w)-[0-9a-f]{{8}}\.[a-z0-9]+"
+
+
+class InvalidTransfer(ValueError):
+    pass
+
+
+class TransferTooLarge(InvalidTransfer):
+    pass
+
+
+# Expected type of every field import reads, per record type; a missing or
+# null field is always fine (float means any finite number)
+RECORD_FIELDS = {
+    "tier": {"id": int, "name": str, "colour": str, "position": float},
+    "image": {"file": str, "data": str, "last": bool},
+    "item": {
+        "id": int,
+        "tier_id": int,
+        "position": float,
+        "name": str,
+        "image_url": str,
+        "preview_url": str,
+        "variants": list,
+    },
+    "vote": {"user_id": str, "item_id": int, "tier_id": int},
+}
+TYPE_NAMES = {int: "an integer", float: "a number", str: "a string", bool: "a boolean", list: "a list"}
+
+
+def _line(record: dict) -> bytes:
+    return (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode()
+
+
+#######################
+# Export
+#######################
+
+
+def _read_chunk(f, size):
+    return f.read(size)
+
+
+async def _image_lines(filename: str):
+    path = IMAGE_DIR / filename
+    try:
+        f = await run_in_threadpool(open, path, "rb")
+    except OSError:
+        return
+    try:
+        chunk = await run_in_threadpool(_read_chunk, f, TRANSFER_IMAGE_CHUNK)
+        while True:
+            following = await run_in_threadpool(_read_chunk, f, TRANSFER_IMAGE_CHUNK)
+            yield _line(
+                {
+                    "type": "image",
+                    "file": filename,
+                    "data": base64.b64encode(chunk).decode(),
+                    "last": not following,
+                }
+            )
+            if not following:
+                break
+            chunk = following
+    finally:
+        await run_in_threadpool(f.close)
+
+
+async def export_tierlist(db, tierlist_id: int, include_images: bool = False):
+    """Async iterator of NDJSON bytes for the tierlist (see the format above)."""
+    buffer = bytearray()
+    counts = {"tiers": 0, "images": 0, "items": 0, "votes": 0}
+    # One consistent view of all tables for the whole (possibly long) stream
+    async with db.transaction(isolation="repeatable_read", readonly=True):
+        tl = await db.fetch_one(
+            select(tierlists.c.id, tierlists.c.name, tierlists.c.creator_id, tierlists.c.version)
+            .where(tierlists.c.id == tierlist_id)
+        )
+        if tl is None:
+            return
+        buffer += _line({"type": "tierlist", "format": TRANSFER_FORMAT, **dict(tl)})
+
+        async for r in db.iterate(
+            select(tiers.c.id, tiers.c.name, tiers.c.colour, tiers.c.position)
+            .where(tiers.c.tierlist_id == tierlist_id)
+            .order_by(tiers.c.position, tiers.c.id)
+        ):
+            buffer += _line({"type": "tier", **dict(r)})
+            counts["tiers"] += 1
+
+        if include_images:
+            async for r in db.iterate(
+                select(items.c.image_url)
+                .where((items.c.tierlist_id == tierlist_id) & items.c.image_url.isnot(None))
+                .distinct()
+            ):
+                async for line in _image_lines(r["image_url"].rsplit("/", 1)[-1]):
+                    buffer += line
+                    if len(buffer) >= TRANSFER_FLUSH_BYTES:
+                        yield bytes(buffer)
+                        buffer.clear()
+                counts["images"] += 1
+
+        async for r in db.iterate(
+            select(
+                items.c.id,
+                items.c.tier_id,
+                items.c.position,
+                items.c.name,
+                items.c.image_url,
+                items.c.preview_url,
+                items.c.variants,
+            )
+            .where(items.c.tierlist_id == tierlist_id)
+            .order_by(items.c.id)
+        ):
+            buffer += _line({"type": "item", **dict(r)})
+            counts["items"] += 1
+            if len(buffer) >= TRANSFER_FLUSH_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+
+        async for r in db.iterate(
+            select(votes.c.user_id, votes.c.item_id, votes.c.tier_id)
+            .select_from(votes.join(items, items.c.id == votes.c.item_id))
+            .where(items.c.tierlist_id == tierlist_id)
+        ):
+            buffer += _line({"type": "vote", **dict(r)})
+            counts["votes"] += 1
+            if len(buffer) >= TRANSFER_FLUSH_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+
+    buffer += _line({"type": "end", "counts": counts})
+    yield bytes(buffer)
+
+
+#######################
+# Import
+#######################
+
+
+async def _lines(chunks):
+    """Splits a byte stream into parsed NDJSON records."""
+    pending = b""
+    line_no = 0
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > TRANSFER_MAX_BYTES:
+            raise TransferTooLarge(f"Import is larger than {TRANSFER_MAX_BYTES} bytes.")
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        if len(pending) > TRANSFER_MAX_LINE:
+            raise InvalidTransfer(f"Line {line_no + len(complete) + 1} is too long.")
+        for raw in complete:
+            line_no += 1
+            if raw.strip():
+                yield _parse(raw, line_no)
+    if pending.strip():
+        yield _parse(pending, line_no + 1)
+
+
+def _parse(raw: bytes, line_no: int) -> dict:
+    try:
+        record = json.loads(raw)
+    except ValueError:
+        raise InvalidTransfer(f"Line {line_no} is not valid JSON.")
+    if not isinstance(record, dict) or not isinstance(record.get("type"), str):
+        raise InvalidTransfer(f"Line {line_no} has no record type.")
+    for field, expected in RECORD_FIELDS.get(record["type"], {}).items():
+        value = record.get(field)
+        if value is not None and not _is_type(value, expected):
+            raise InvalidTransfer(
+                f"Line {line_no}: {record['type']} '{field}' must be {TYPE_NAMES[expected]}."
+            )
+    return record
+
+
+def _is_type(value, expected) -> bool:
+    if isinstance(value, bool):
+        return expected is bool
+    if expected is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, expected)
+
+
+class _Importer:
+    """Per-import state: old -> new id maps, pending batches, stored images."""
+
+    def __init__(self, db, tierlist_id: int, user_id: str, vote_scope: str):
+        self.db = db
+        self.tierlist_id = tierlist_id
+        self.user_id = user_id
+        self.vote_scope = vote_scope
+        self.tier_ids = {}
+        self.item_ids = {}
+        self.items = []
+        self.votes = {}  # (user_id, item_id) -> tier_id, one per pair like uq_votes_user_item
+        self.counts = {"tiers": 0, "images": 0, "items": 0, "votes": 0}
+        # old original filename -> temp file being written / derivative task
+        self._incoming = {}
+        self._derived = {}
+        self._images = {}  # old filename -> items image columns
+        self._sizes = {}  # old filename -> bytes received so far
+        self._semaphore = asyncio.Semaphore(max(1, IMPORT_PARALLELISM))
+        self._existing = {}  # IMAGE_DIR filename -> whether it's there
+
+    async def add_tiers(self, records: list):
+        if not records:
+            return
+        new_ids = await allocate_ids(self.db, "tiers", len(records))
+        await self.db.execute(
+            "INSERT INTO tiers (id, tierlist_id, name, colour, position) "
+            "SELECT t.id, :tierlist_id, t.name, t.colour, t.position "
+            "FROM unnest(CAST(:ids AS INTEGER[]), CAST(:names AS VARCHAR[]), "
+            "CAST(:colours AS VARCHAR[]), CAST(:positions AS DOUBLE PRECISION[])) "
+            "AS t(id, name, colour, position)",
+            {
+                "tierlist_id": self.tierlist_id,
+                "ids": new_ids,
+                "names": [str(r.get("name") or "Tier")[:100] for r in records],
+                "colours": [str(r.get("colour") or "#cccccc")[:20] for r in records],
+                "positions": [float(r.get("position") or 0) for r in records],
+            },
+        )
+        self.tier_ids.update((r.get("id"), new_id) for r, new_id in zip(records, new_ids))
+        self.counts["tiers"] += len(records)
+
+    async def add_image_chunk(self, record: dict):
+        filename = PurePosixPath(str(record.get("file") or "")).name
+        if not filename or filename.startswith("."):
+            raise InvalidTransfer("Image record without a valid file name.")
+        try:
+            data = base64.b64decode(record.get("data") or "", validate=True)
+        except ValueError:
+            raise InvalidTransfer(f"Image {filename} has invalid base64 data.")
+        self._sizes[filename] = self._sizes.get(filename, 0) + len(data)
+        if self._sizes[filename] > TRANSFER_MAX_IMAGE_BYTES:
+            raise TransferTooLarge(f"Image {filename} is larger than {TRANSFER_MAX_IMAGE_BYTES} bytes.")
+        f = self._incoming.get(filename)
+        if f is None:
+            f = self._incoming[filename] = await run_in_threadpool(tempfile.TemporaryFile)
+        await run_in_threadpool(f.write, data)
+        if record.get("last"):
+            del self._incoming[filename]
+            self._derived[filename] = asyncio.ensure_future(self._store_image(f, filename))
+
+    async def _store_image(self, f, filename: str):
+        try:
+            await run_in_threadpool(f.seek, 0)
+            ext = PurePosixPath(filename).suffix.lower()
+            digest, path, _ = await run_in_threadpool(
+                store_fileobj, f, IMAGE_DIR, ext, TRANSFER_MAX_IMAGE_BYTES
+            )
+        finally:
+            await run_in_threadpool(f.close)
+        _, derived, error = await derive_with_retries(self._semaphore, 0, digest, path)
+        if error:
+            # The original is left to the sweeper, like a failed upload
+            return None
+        return item_image_fields(path.name, derived)
+
+    async def collect_images(self):
+        # Images come before the items that use them; their derivatives
+        # were rendered in parallel while the rest of the images streamed in
+        for filename, task in list(self._derived.items()):
+            fields = await task
+            if fields is not None:
+                self._images[filename] = fields
+                self.counts["images"] += 1
+        self._derived.clear()
+
+    async def _stored_file(self, url, pattern: str):
+        """The file name if `url` is an IMAGE_DIR file matching `pattern` that exists, else None."""
+        if not isinstance(url, str) or not url.startswith(IMAGE_URL_PREFIX):
+            return None
+        filename = url[len(IMAGE_URL_PREFIX):]
+        if not re.fullmatch(pattern, filename):
+            return None
+        exists = self._existing.get(filename)
+        if exists is None:
+            exists = self._existing[filename] = await run_in_threadpool((IMAGE_DIR / filename).is_file)
+        return filename if exists else None
+
+    async def _image_fields(self, record: dict) -> dict:
+        original = str(record.get("image_url") or "").rsplit("/", 1)[-1]
+        fields = self._images.get(original)
+        if fields is not None:
+            return fields
+        # Exported without images: the URLs still work when both instances
+        # share the image store (the files are content-addressed). Anything
+        # that isn't a stored file of ours is dropped, never passed through.
+        fields = {"image_url": None, "preview_url": None, "variants": None}
+        original = await self._stored_file(record.get("image_url"), ORIGINAL_NAME.pattern)
+        if original is None:
+            return fields
+        fields["image_url"] = IMAGE_URL_PREFIX + original
+        derivative = DERIVATIVE_NAME.format(digest=ORIGINAL_NAME.fullmatch(original)["digest"])
+        if await self._stored_file(record.get("preview_url"), derivative):
+            fields["preview_url"] = record["preview_url"]
+        variants = []
+        for v in record.get("variants") or []:
+            if (
+                isinstance(v, dict)
+                and isinstance(v.get("width"), int)
+                and isinstance(v.get("height"), int)
+                and isinstance(v.get("format"), str)
+                and await self._stored_file(v.get("url"), derivative)
+            ):
+                variants.append(
+                    {"url": v["url"], "width": v["width"], "height": v["height"], "format": v["format"]}
+                )
+        fields["variants"] = variants or None
+        return fields
+
+    async def add_item(self, record: dict):
+        if self._derived:
+            await self.collect_images()
+        self.items.append(record)
+        if len(self.items) >= TRANSFER_BATCH_SIZE:
+            await self.flush_items()
+
+    async def flush_items(self):
+        if not self.items:
+            return
+        records, self.items = self.items, []
+        rows = [
+            {
+                # Items of tiers that weren't in the stream end up unassigned
+                "tier_id": self.tier_ids.get(r.get("tier_id")),
+                "position": float(r.get("position") or 0),
+                "name": str(r.get("name") or "")[:100],
+                **await self._image_fields(r),
+            }
+            for r in records
+        ]
+        new_ids = await insert_items(self.db, self.tierlist_id, rows)
+        self.item_ids.update((r.get("id"), new_id) for r, new_id in zip(records, new_ids))
+        self.counts["items"] += len(records)
+
+    async def add_vote(self, record: dict):
+        user_id = record.get("user_id")
+        if self.vote_scope == "none" or not user_id:
+            return
+        if self.vote_scope == "mine" and user_id != self.user_id:
+            return
+        item_id = self.item_ids.get(record.get("item_id"))
+        tier_id = self.tier_ids.get(record.get("tier_id"))
+        if item_id is None or tier_id is None:
+            return
+        self.votes[(user_id[:100], item_id)] = tier_id
+        if len(self.votes) >= TRANSFER_BATCH_SIZE:
+            await self.flush_votes()
+
+    async def flush_votes(self):
+        if not self.votes:
+            return
+        batch, self.votes = self.votes, {}
+        # vote_counts follows through its triggers, one statement per batch
+        await self.db.execute(
+            "INSERT INTO votes (user_id, item_id, tier_id) "
+            "SELECT * FROM unnest(CAST(:user_ids AS VARCHAR[]), CAST(:item_ids AS INTEGER[]), "
+            "CAST(:tier_ids AS INTEGER[])) "
+            "ON CONFLICT (user_id, item_id) DO UPDATE SET tier_id = EXCLUDED.tier_id",
+            {
+                "user_ids": [user_id for user_id, _ in batch],
+                "item_ids": [item_id for _, item_id in batch],
+                "tier_ids": list(batch.values()),
+            },
+        )
+        self.counts["votes"] += len(batch)
+
+    async def close(self):
+        for f in self._incoming.values():
+            await run_in_threadpool(f.close)
+        for task in self._derived.values():
+            task.cancel()
+
+
+async def import_tierlist(db, chunks, creator_id: str, name: str = None, vote_scope: str = "mine") -> dict:
+    """
+    Creates a new tierlist owned by `creator_id` from an NDJSON stream (an
+    async iterator of byte chunks, e.g. request.stream()), in one
+    transaction. Ids are remapped; votes of unknown items/tiers, and those
+    outside `vote_scope` (see VOTE_SCOPES), are dropped.
+    Returns {"tierlist_id", "name", "counts"}. Raises InvalidTransfer.
+    """
+    records = _lines(chunks)
+    try:
+        header = await records.__anext__()
+    except StopAsyncIteration:
+        raise InvalidTransfer("Empty stream.")
+    if header.get("type") != "tierlist" or header.get("format") != TRANSFER_FORMAT:
+        raise InvalidTransfer(f"Expected a format {TRANSFER_FORMAT} tierlist header first.")
+    name = str(name or header.get("name") or "Imported tierlist")[:100]
+
+    async with db.transaction():
+        tierlist_id = await db.execute(
+            tierlists.insert().values(name=name, creator_id=creator_id).returning(tierlists.c.id)
+        )
+        importer = _Importer(db, tierlist_id, creator_id, vote_scope)
+        try:
+            pending_tiers = []
+            ended = False
+            async for record in records:
+                kind = record["type"]
+                if kind != "tier" and pending_tiers:
+                    await importer.add_tiers(pending_tiers)
+                    pending_tiers = []
+                if kind == "tier":
+                    pending_tiers.append(record)
+                elif kind == "image":
+                    await importer.add_image_chunk(record)
+                elif kind == "item":
+                    await importer.add_item(record)
+                elif kind == "vote":
+                    if importer.items:
+                        await importer.flush_items()
+                    await importer.add_vote(record)
+                elif kind == "end":
+                    ended = True
+                    break
+            if not ended:
+                raise InvalidTransfer("Stream ended before the end record.")
+            await importer.add_tiers(pending_tiers)
+            await importer.collect_images()
+            await importer.flush_items()
+            await importer.flush_votes()
+        finally:
+            await importer.close()
+    return {"tierlist_id": tierlist_id, "name": name, "counts": importer.counts}
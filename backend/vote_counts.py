@@ -0,0 +1,88 @@
+from sqlalchemy import text
+
+# vote_counts (models.py) is kept in sync with votes by statement-level
+# triggers that aggregate the transition tables, so a batched upsert of N
+# votes costs one grouped UPDATE/INSERT instead of N. FK cascades from item or
+# tier deletion go through the same DELETE trigger.
+TRIGGER_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION votes_maintain_counts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE vote_counts vc SET count = vc.count - d.n
+            FROM (
+                SELECT item_id, tier_id, count(*) AS n FROM old_rows
+                WHERE tier_id IS NOT NULL GROUP BY item_id, tier_id
+            ) d
+            WHERE vc.item_id = d.item_id AND vc.tier_id = d.tier_id;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            INSERT INTO vote_counts (item_id, tier_id, count)
+            SELECT item_id, tier_id, count(*) FROM new_rows
+            WHERE tier_id IS NOT NULL GROUP BY item_id, tier_id
+            ON CONFLICT (item_id, tier_id)
+            DO UPDATE SET count = vote_counts.count + EXCLUDED.count;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS votes_counts_insert ON votes",
+    "DROP TRIGGER IF EXISTS votes_counts_update ON votes",
+    "DROP TRIGGER IF EXISTS votes_counts_delete ON votes",
+    """
+    CREATE TRIGGER votes_counts_insert AFTER INSERT ON votes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION votes_maintain_counts()
+    """,
+    """
+    CREATE TRIGGER votes_counts_update AFTER UPDATE ON votes
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION votes_maintain_counts()
+    """,
+    """
+    CREATE TRIGGER votes_counts_delete AFTER DELETE ON votes
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION votes_maintain_counts()
+    """,
+]
+
+# Blocks vote writes (not reads) while the counters are recomputed
+LOCK_VOTES = "LOCK TABLE votes IN SHARE MODE"
+CLEAR_COUNTS = "DELETE FROM vote_counts"
+BACKFILL_COUNTS = (
+    "INSERT INTO vote_counts (item_id, tier_id, count) "
+    "SELECT item_id, tier_id, count(*) FROM votes "
+    "WHERE item_id IS NOT NULL AND tier_id IS NOT NULL "
+    "GROUP BY item_id, tier_id"
+)
+MISMATCHES = (
+    "SELECT COALESCE(a.item_id, c.item_id) AS item_id, "
+    "COALESCE(a.tier_id, c.tier_id) AS tier_id, "
+    "COALESCE(a.n, 0) AS actual, COALESCE(c.count, 0) AS counted "
+    "FROM (SELECT item_id, tier_id, count(*) AS n FROM votes "
+    "      WHERE item_id IS NOT NULL AND tier_id IS NOT NULL "
+    "      GROUP BY item_id, tier_id) a "
+    "FULL OUTER JOIN vote_counts c ON c.item_id = a.item_id AND c.tier_id = a.tier_id "
+    "WHERE COALESCE(a.n, 0) <> COALESCE(c.count, 0) "
+    "ORDER BY 1, 2"
+)
+
+
+async def rebuild_vote_counts(db) -> int:
+    """Recomputes vote_counts from votes in one transaction. Returns the row count."""
+    async with db.transaction():
+        await db.execute(text(LOCK_VOTES))
+        await db.execute(text(CLEAR_COUNTS))
+        await db.execute(text(BACKFILL_COUNTS))
+        row = await db.fetch_one(text("SELECT count(*) AS n FROM vote_counts"))
+    return row["n"]
+
+
+async def verify_vote_counts(db) -> list:
+    """(item_id, tier_id, actual, counted) for every counter that drifted from votes."""
+    async with db.transaction():
+        # One consistent snapshot for both sides of the comparison
+        await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+        rows = await db.fetch_all(text(MISMATCHES))
+    return [dict(r) for r in rows]
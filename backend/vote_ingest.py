@@ -0,0 +1,220 @@
+import asyncio
+import os
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from models import items, tiers
+from changes import record_change, vote_counts_for_items
+from hot_queries import UPSERT_VOTES, hot_execute
+from cache import item_owner, tier_owner
+
+#######################
+# Configuration
+#######################
+
+# "sync"  -> every vote is upserted inside its own request (no buffering)
+# "group" -> votes are buffered and coalesced, the request returns once the
+#            batch containing it is committed (durable, default)
+# "async" -> votes are buffered and the request returns 202 right away; up to
+#            one flush interval of votes is lost if the worker dies
+VOTE_DURABILITY = os.getenv("VOTE_DURABILITY", "group")
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", 0.2))
+# Flush early once this many distinct (user, item) votes are waiting
+VOTE_FLUSH_MAX = int(os.getenv("VOTE_FLUSH_MAX", 1000))
+
+if VOTE_DURABILITY not in ("sync", "group", "async"):
+    raise RuntimeError(f"Unknown VOTE_DURABILITY {VOTE_DURABILITY!r}")
+
+
+class VoteIngestor:
+    def __init__(self, db):
+        self.db = db
+        # (user_id, item_id) -> [tier_id, tierlist_id, [futures waiting on it]]
+        self._pending = {}
+        # The batch a flush is writing right now
+        self._inflight = {}
+        # Held while a buffered batch or a write_batch() is written, so an
+        # older buffered vote can never commit after a newer direct one
+        self._write_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.stats = {"submitted": 0, "coalesced": 0, "written": 0, "flushes": 0, "failed_flushes": 0}
+
+    async def start(self):
+        if VOTE_DURABILITY != "sync":
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let the loop finish the flush it may be in (cancelling it would
+        # lose a batch already taken out of _pending), then flush the rest
+        task, self._task = self._task, None
+        if task:
+            self._stopping = True
+            self._wakeup.set()
+            await task
+        await self.flush()
+        leftover, self._pending = self._pending, {}
+        if leftover:
+            print(f"Vote ingestor stopped with {len(leftover)} votes unwritten")
+        self._fail(leftover)
+
+    @staticmethod
+    def _fail(batch: dict):
+        for entry in batch.values():
+            for waiter in entry[2]:
+                if not waiter.done():
+                    waiter.set_exception(
+                        HTTPException(status_code=503, detail="Vote could not be stored.")
+                    )
+
+    async def validate(self, item_id: int, tier_id: int) -> int:
+        """Returns the item's tierlist_id; 404/400 like the old per-request checks."""
+        # Ownership comes from the shared cache (cache.py), dropped on tier deletion
+        item_tl = item_owner.get(item_id)
+        tier_tl = tier_owner.get(tier_id)
+        if item_tl is None or tier_tl is None:
+            row = await self.db.fetch_one(
+                select(
+                    select(items.c.tierlist_id)
+                    .where(items.c.id == item_id)
+                    .scalar_subquery()
+                    .label("item_tl"),
+                    select(tiers.c.tierlist_id)
+                    .where(tiers.c.id == tier_id)
+                    .scalar_subquery()
+                    .label("tier_tl"),
+                )
+            )
+            item_tl, tier_tl = row["item_tl"], row["tier_tl"]
+            if item_tl is not None:
+                item_owner.put(item_id, item_tl)
+            if tier_tl is not None:
+                tier_owner.put(tier_id, tier_tl)
+        if item_tl is None:
+            raise HTTPException(status_code=404, detail="Item not found.")
+        if tier_tl != item_tl:
+            raise HTTPException(status_code=400, detail="Invalid 'tier_id' for this item.")
+        return item_tl
+
+    async def submit(self, user_id: str, item_id: int, tier_id: int) -> int:
+        tierlist_id = await self.validate(item_id, tier_id)
+        self.stats["submitted"] += 1
+        if VOTE_DURABILITY == "sync":
+            await self._write({(user_id, item_id): [tier_id, tierlist_id, []]})
+            return tierlist_id
+
+        entry = self._pending.get((user_id, item_id))
+        if entry:
+            # Same user re-voted the same item before the flush: last vote wins
+            self.stats["coalesced"] += 1
+            entry[0], entry[1] = tier_id, tierlist_id
+        else:
+            entry = self._pending[(user_id, item_id)] = [tier_id, tierlist_id, []]
+        if len(self._pending) >= VOTE_FLUSH_MAX:
+            self._wakeup.set()
+
+        if VOTE_DURABILITY == "group":
+            waiter = asyncio.get_running_loop().create_future()
+            entry[2].append(waiter)
+            await waiter
+        return tierlist_id
+
+    def pending_for_user(self, user_id: str, tierlist_id: int) -> dict:
+        """{item_id: tier_id} of the user's votes on a tierlist that aren't committed yet."""
+        return {
+            item_id: entry[0]
+            for batch in (self._inflight, self._pending)
+            for (uid, item_id), entry in batch.items()
+            if uid == user_id and entry[1] == tierlist_id
+        }
+
+    async def write_batch(self, user_id: str, tierlist_id: int, choices: dict):
+        """
+        Upserts {item_id: tier_id} for one user right away, in one transaction,
+        replacing anything still buffered for those items (their waiters are
+        answered once this commits). The caller has validated the ids already.
+        """
+        batch = {
+            (user_id, item_id): [tier_id, tierlist_id, []]
+            for item_id, tier_id in choices.items()
+        }
+        async with self._write_lock:
+            for key, entry in batch.items():
+                superseded = self._pending.pop(key, None)
+                if superseded:
+                    entry[2].extend(superseded[2])
+            try:
+                await self._write(batch)
+            except Exception:
+                self._fail(batch)
+                raise
+        self._resolve(batch)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=VOTE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch = self._inflight = self._pending
+            self._pending = {}
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                print(f"Vote flush of {len(batch)} votes failed: {e}")
+                self._fail(batch)
+                if VOTE_DURABILITY == "async":
+                    # Nobody is waiting on these; keep them for the next round
+                    # unless the user already voted again in the meantime
+                    for key, entry in batch.items():
+                        self._pending.setdefault(key, [entry[0], entry[1], []])
+                return
+            finally:
+                self._inflight = {}
+        self._resolve(batch)
+
+    @staticmethod
+    def _resolve(batch: dict):
+        for entry in batch.values():
+            for waiter in entry[2]:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _write(self, batch: dict):
+        user_ids, item_ids, tier_ids = [], [], []
+        by_tierlist = {}
+        for (user_id, item_id), (tier_id, tierlist_id, _) in batch.items():
+            user_ids.append(user_id)
+            item_ids.append(item_id)
+            tier_ids.append(tier_id)
+            by_tierlist.setdefault(tierlist_id, set()).add(item_id)
+        async with self.db.transaction():
+            await hot_execute(self.db, UPSERT_VOTES, user_ids, item_ids, tier_ids)
+            counts = await vote_counts_for_items(self.db, set(item_ids))
+            for tierlist_id, voted in by_tierlist.items():
+                await record_change(
+                    self.db,
+                    tierlist_id,
+                    "votes_changed",
+                    {"votes": {i: counts.get(i, {}) for i in sorted(voted)}},
+                )
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(batch)
+
+    def snapshot_stats(self) -> dict:
+        return {
+            **self.stats,
+            "mode": VOTE_DURABILITY,
+            "pending": len(self._pending),
+            "flush_interval": VOTE_FLUSH_INTERVAL,
+        }
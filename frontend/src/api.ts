@@ -10,6 +10,23 @@ export interface TierlistSummary {
   id: number;
   name: string;
   creator_id: number;
+  version?: number;
+  item_count?: number; // with includeCounts
+  vote_count?: number;
+}
+
+export interface TierlistPage {
+  tierlists: TierlistSummary[];
+  next_cursor: string | null;
+}
+
+export interface TierlistQuery {
+  cursor?: string | null;
+  limit?: number;
+  mine?: boolean;
+  creatorId?: string;
+  q?: string;
+  includeCounts?: boolean;
 }
 
 export interface Tier {
@@ -20,6 +37,13 @@ export interface Tier {
   position: number;
 }
 
+export interface ImageVariant {
+  url: string;
+  width: number;
+  height: number;
+  format: string;
+}
+
 export interface Item {
   id: number;
   tierlist_id: number;
@@ -27,6 +51,22 @@ export interface Item {
   position: number;
   name: string;
   image_url: string | null;
+  preview_url?: string | null;
+  variants?: ImageVariant[] | null;
+}
+
+// Builds a srcset string from the derivatives of one format (default webp)
+export function variantSrcSet(item: Item, baseUrl: string, format = 'webp'): string | undefined {
+  const list = (item.variants ?? []).filter((v) => v.format === format);
+  if (list.length === 0) return undefined;
+  return list.map((v) => `${baseUrl}${v.url} ${v.width}w`).join(', ');
+}
+
+// Largest derivative, falling back to the original upload
+export function largestImageUrl(item: Item): string | null {
+  const list = item.variants ?? [];
+  if (list.length === 0) return item.image_url;
+  return list.reduce((a, b) => (b.width > a.width ? b : a)).url;
 }
 
 export interface VoteResponse {
@@ -45,8 +85,18 @@ export async function getCurrentUser() {
   }
 }
 
-export async function fetchTierlists(): Promise<TierlistSummary[]> {
-  const res = await api.get('/tierlists');
+// One page of tierlists, newest first; pass next_cursor back for the next one
+export async function fetchTierlists(query: TierlistQuery = {}): Promise<TierlistPage> {
+  const res = await api.get('/tierlists', {
+    params: {
+      cursor: query.cursor || undefined,
+      limit: query.limit,
+      mine: query.mine || undefined,
+      creator_id: query.creatorId || undefined,
+      q: query.q || undefined,
+      include_counts: query.includeCounts || undefined,
+    },
+  });
   return res.data;
 }
 
@@ -57,11 +107,85 @@ export async function fetchTierlistDetail(
   return res.data;
 }
 
+export interface TierlistSnapshot {
+  tierlist: { id: number; name: string; creator_id: string; version: number };
+  tiers: Tier[];
+  items: Record<string, Item[]>; // keyed by tier id, plus "unassigned"
+  votes: Record<string, Record<string, number>>;
+  me: { id: string; username: string; email: string } | null;
+}
+
+// Tierlist, tiers, items, vote counts and the current user in one request
+export async function fetchSnapshot(id: number): Promise<TierlistSnapshot> {
+  const res = await api.get(`/tierlists/${id}/snapshot`);
+  return res.data;
+}
+
+export interface SnapshotSummary {
+  id: number;
+  version: number;
+  kind: 'full' | 'delta';
+  label: string | null;
+  created_at: string;
+}
+
+// Saved versions of a tierlist, newest first
+export async function fetchSnapshots(
+  tierlistId: number,
+  before?: number | null
+): Promise<{ snapshots: SnapshotSummary[]; next_before: number | null }> {
+  const res = await api.get(`/tierlists/${tierlistId}/snapshots`, {
+    params: before ? { before } : {},
+  });
+  return res.data;
+}
+
+export async function saveSnapshot(tierlistId: number, label?: string) {
+  const res = await api.post(`/tierlists/${tierlistId}/snapshots`, label ? { label } : {});
+  return res.data;
+}
+
+// Restores tiers and item placements server-side in one transaction
+export async function revertSnapshot(tierlistId: number, snapshotId: number) {
+  const res = await api.post(`/tierlists/${tierlistId}/snapshots/${snapshotId}/revert`);
+  return res.data;
+}
+
+export interface LiveEvent {
+  tierlist_id: number;
+  version?: number;
+  kind: string; // item_added, items_moved, tier_updated, votes_changed, reverted, items_imported, resync, ...
+  data?: any;
+}
+
+// Server-sent deltas for one tierlist, starting after `since`
+export function subscribeTierlistEvents(
+  tierlistId: number,
+  since: number,
+  onEvent: (ev: LiveEvent) => void
+): EventSource {
+  const source = new EventSource(
+    `${api.defaults.baseURL}/tierlists/${tierlistId}/events?since=${since}`,
+    { withCredentials: true }
+  );
+  source.onmessage = (msg) => onEvent(JSON.parse(msg.data));
+  return source;
+}
+
 export async function fetchItems(id: number): Promise<Item[]> {
   const res = await api.get(`/tierlists/${id}/items`);
   return res.data;
 }
 
+// Rendered server-side from the item previews, cached per tierlist version
+export async function exportTierlistPng(id: number, unassigned = false): Promise<Blob> {
+  const res = await api.get(`/tierlists/${id}/export.png`, {
+    params: { unassigned },
+    responseType: 'blob',
+  });
+  return res.data;
+}
+
 export async function updateItem(
   itemId: number,
   data: { tier_id?: number | null; position?: number }
@@ -70,16 +194,108 @@ export async function updateItem(
   return res.data;
 }
 
+// Either an explicit position, or the neighbours the item was dropped between
+// (the backend then picks a sparse position so nothing else gets renumbered).
+export interface ItemMove {
+  item_id: number;
+  tier_id: number | null;
+  position?: number;
+  after_id?: number | null;
+  before_id?: number | null;
+}
+
+export interface ItemPlacement {
+  id: number;
+  tier_id: number | null;
+  position: number;
+}
+
+export async function reorderItems(tierlistId: number, moves: ItemMove[]) {
+  const res = await api.post(`/tierlists/${tierlistId}/items/reorder`, { moves });
+  return res.data as { updated: number; items: ItemPlacement[] };
+}
+
 export async function castVote(itemId: number, tierId: number) {
   const res = await api.post(`/items/${itemId}/vote`, { tier_id: tierId });
   return res.data as VoteResponse;
 }
 
+// Many votes of the current user in one request / transaction
+export async function castVotes(tierlistId: number, votes: { item_id: number; tier_id: number }[]) {
+  const res = await api.post(`/tierlists/${tierlistId}/votes/batch`, { votes });
+  return res.data as { status: string; user_id: string; votes: Record<string, number> };
+}
+
+// The current user's existing votes: { item_id: tier_id }
+export async function fetchMyVotes(tierlistId: number): Promise<Record<string, number>> {
+  const res = await api.get(`/tierlists/${tierlistId}/votes/me`);
+  return res.data;
+}
+
 export async function createTierlist(name: string, tiers: { name: string; colour: string }[]) {
   const res = await api.post('/tierlists', { name, tiers });
   return res.data;
 }
 
+export interface ImportLine {
+  kind: 'progress' | 'entry' | 'done' | 'error';
+  [key: string]: any;
+}
+
+// Bulk import of a zip/tar of images (optionally with manifest.ndjson); the
+// response is NDJSON, handed line by line to onLine as it streams in
+export async function importItems(
+  tierlistId: number,
+  archive: File,
+  onLine: (line: ImportLine) => void,
+  tierId?: number
+): Promise<void> {
+  const query = tierId ? `?tier_id=${tierId}` : '';
+  const res = await fetch(`${api.defaults.baseURL}/tierlists/${tierlistId}/import${query}`, {
+    method: 'POST',
+    body: archive,
+    credentials: 'include',
+    headers: { 'Content-Type': archive.type || 'application/octet-stream' },
+  });
+  if (!res.ok || !res.body) {
+    const body = await res.json().catch(() => null);
+    throw new Error(body?.detail ?? `Import failed (${res.status})`);
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split('\n');
+    buffered = lines.pop() ?? '';
+    lines.filter((l) => l.trim()).forEach((l) => onLine(JSON.parse(l)));
+  }
+  if (buffered.trim()) onLine(JSON.parse(buffered));
+}
+
+// NDJSON backup of a whole tierlist, streamed by the backend (a plain download link)
+export function tierlistBackupUrl(tierlistId: number, images = false): string {
+  return `${api.defaults.baseURL}/tierlists/${tierlistId}/export.ndjson?images=${images}`;
+}
+
+// Restores a backup as a new tierlist owned by the current user (with their own votes only)
+export async function importTierlistBackup(
+  backup: File
+): Promise<{ tierlist_id: number; name: string; counts: Record<string, number> }> {
+  const res = await api.post('/tierlists/import', backup, {
+    headers: { 'Content-Type': 'application/x-ndjson' },
+  });
+  return res.data;
+}
+
+// Server-side copy of tiers and items; the images are shared, not re-uploaded
+export async function forkTierlist(tierlistId: number, name?: string) {
+  const res = await api.post(`/tierlists/${tierlistId}/fork`, name ? { name } : {});
+  return res.data;
+}
+
 export async function addItemToTierlist(tierlistId: number, formData: FormData) {
   const res = await api.post(`/tierlists/${tierlistId}/items`, formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
@@ -1,12 +1,16 @@
-import React, { useEffect, useState, useContext } from 'react';
+import React, { useCallback, useEffect, useState, useContext } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { fetchTierlists, TierlistSummary, getCurrentUser } from '../api'; // make sure getCurrentUser is imported!
 import NewTierlistModal, { TierDef } from './NewTierlistModal';
-import { createTierlist } from '../api';
+import { createTierlist, importTierlistBackup } from '../api';
 import { TopbarContext } from '../App';
 
 const DashboardPage: React.FC = () => {
   const [tierlists, setTierlists] = useState<TierlistSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [search, setSearch] = useState('');
+  const [mineOnly, setMineOnly] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showNewModal, setShowNewModal] = useState(false);
   const [user, setUser] = useState<any>(null);
 
@@ -38,25 +42,55 @@ const DashboardPage: React.FC = () => {
     return () => setTopbarContent("Welcome, Senpai~! 🌱");
   }, [setTopbarContent, user]);
 
+  // First page for the current filters; "Load more" appends the next ones
+  const loadFirstPage = useCallback(async () => {
+    const page = await fetchTierlists({ q: search.trim(), mine: mineOnly, includeCounts: true });
+    setTierlists(page.tierlists);
+    setNextCursor(page.next_cursor);
+  }, [search, mineOnly]);
+
   useEffect(() => {
-    async function load() {
-      const data = await fetchTierlists();
-      setTierlists(data);
+    // Debounce typing in the search box
+    const timer = setTimeout(loadFirstPage, 250);
+    return () => clearTimeout(timer);
+  }, [loadFirstPage]);
+
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchTierlists({
+        cursor: nextCursor,
+        q: search.trim(),
+        mine: mineOnly,
+        includeCounts: true,
+      });
+      setTierlists((prev) => [...prev, ...page.tierlists]);
+      setNextCursor(page.next_cursor);
+    } finally {
+      setLoadingMore(false);
     }
-    load();
-  }, []);
+  };
 
   const handleCreateTierlist = async (name: string, tiers: TierDef[]) => {
     try {
       await createTierlist(name, tiers);
       setShowNewModal(false);
-      const data = await fetchTierlists();
-      setTierlists(data);
+      await loadFirstPage();
     } catch (err: any) {
       alert('Failed to create tierlist: ' + (err?.message || err));
     }
   };
 
+  const handleImportBackup = async (file: File) => {
+    try {
+      const imported = await importTierlistBackup(file);
+      navigate(`/tierlists/${imported.tierlist_id}`);
+    } catch (err: any) {
+      alert('Failed to import backup: ' + (err?.response?.data?.detail || err?.message || err));
+    }
+  };
+
   if (!user) {
     return <div className="p-4">Loading uwu...</div>;
   }
@@ -70,6 +104,19 @@ const DashboardPage: React.FC = () => {
         >
           + New Tierlist
         </button>
+        <label className="new-tierlist-btn cursor-pointer ml-2">
+          Import backup
+          <input
+            type="file"
+            accept=".ndjson,application/x-ndjson"
+            className="hidden"
+            onChange={(e) => {
+              const file = e.target.files?.[0];
+              e.target.value = '';
+              if (file) handleImportBackup(file);
+            }}
+          />
+        </label>
         {showNewModal && (
           <NewTierlistModal
             onClose={() => setShowNewModal(false)}
@@ -77,6 +124,24 @@ const DashboardPage: React.FC = () => {
           />
         )}
 
+        <div className="flex gap-2 items-center mt-3">
+          <input
+            type="search"
+            className="flex-1 p-2 rounded"
+            placeholder="Search tierlists..."
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+          />
+          <label className="flex gap-1 items-center text-sm">
+            <input
+              type="checkbox"
+              checked={mineOnly}
+              onChange={(e) => setMineOnly(e.target.checked)}
+            />
+            My lists
+          </label>
+        </div>
+
         {tierlists.length === 0 ? (
           <div className="dashboard-empty">
             <span role="img" aria-label="empty">🦝</span>
@@ -88,6 +153,11 @@ const DashboardPage: React.FC = () => {
               <Link to={`/tierlists/${tl.id}`} key={tl.id} className="dashboard-card hover:scale-105 transition-transform">
                 <div className="dashboard-card-title">{tl.name}</div>
                 <div className="dashboard-card-id">ID: {tl.id}</div>
+                {tl.item_count !== undefined && (
+                  <div className="dashboard-card-id">
+                    {tl.item_count} items · {tl.vote_count ?? 0} votes
+                  </div>
+                )}
                 <div className="dashboard-card-footer flex gap-1 items-center text-xs text-gray-400 mt-auto">
                   <span role="img" aria-label="paw">🐾</span>
                   Tierlist ready for animal ranking!
@@ -96,6 +166,11 @@ const DashboardPage: React.FC = () => {
             ))}
           </div>
         )}
+        {nextCursor && (
+          <button className="new-tierlist-btn mt-3" onClick={handleLoadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
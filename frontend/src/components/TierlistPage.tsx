@@ -1,19 +1,31 @@
 import React, { useEffect, useState, useCallback, useContext } from 'react';
-import { useParams } from 'react-router-dom';
+import { useParams, useNavigate } from 'react-router-dom';
 import {
-  fetchTierlistDetail,
-  fetchItems,
+  fetchSnapshot,
   Tier,
   Item,
-  updateItem,
+  reorderItems,
+  ItemMove,
+  variantSrcSet,
+  largestImageUrl,
   castVote,
   addItemToTierlist,
-  getCurrentUser,
+  exportTierlistPng,
+  forkTierlist,
+  tierlistBackupUrl,
+  importItems,
+  ImportLine,
+  fetchSnapshots,
+  saveSnapshot,
+  revertSnapshot,
+  SnapshotSummary,
+  LiveEvent,
+  subscribeTierlistEvents,
 } from '../api';
 import { DragDropContext, Droppable, Draggable, DropResult } from '@hello-pangea/dnd';
-import html2canvas from 'html2canvas';
 import AddItemModal from './AddItemModal';
-import { TopbarContext, SidebarDefaultContext } from '../App';
+import { TopbarContext, SidebarDefaultContext, SidebarContext } from '../App';
+import VersionHistory from './VersionHistory';
 
 import TierEditorSidebar from './TierEditorSidebar';
 import { createTier, updateTier, deleteTier } from '../api';
@@ -39,6 +51,8 @@ const BACKEND_URL = "http://192.168.178.249:13371";
 const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
   const { setTopbarContent } = useContext(TopbarContext);
   const { setDefaultSidebarContent } = useContext(SidebarDefaultContext);
+  const { openSidebar } = useContext(SidebarContext);
+  const navigate = useNavigate();
 
 
   const [lightboxImage, setLightboxImage] = useState<string | null>(null);
@@ -49,26 +63,100 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
   const [items, setItems] = useState<ItemWithVotes[]>([]);
   const [isCreator, setIsCreator] = useState(false);
 
-  // Load tierlist details and items on mount
+  const [version, setVersion] = useState<number | null>(null);
+  const [importStatus, setImportStatus] = useState<string | null>(null);
+
+  // Load tierlist details and items (on mount, and whenever the live feed says resync)
+  const loadSnapshot = useCallback(async () => {
+    if (!id) return;
+    // One round trip for tierlist, tiers, items and the current user
+    const snap = await fetchSnapshot(Number(id));
+    if (!snap.me) {
+      window.location.href = `${BACKEND_URL}/auth/login`;
+      return;
+    }
+    setIsCreator(snap.me.id === snap.tierlist.creator_id);
+    setTierlistName(snap.tierlist.name ?? null); // set the name from backend
+    const sortedTiers = snap.tiers.sort((a, b) => a.position - b.position);
+    setTiers(sortedTiers);
+    const itms = [
+      ...sortedTiers.flatMap((t) => snap.items[t.id.toString()] ?? []),
+      ...(snap.items['unassigned'] ?? []),
+    ];
+    setItems(itms.map((it) => ({ ...it, votingEnabled: false })));
+    setVersion(snap.tierlist.version);
+  }, [id]);
+
   useEffect(() => {
-    async function load() {
-      if (!id) return;
-      const [tl, u] = await Promise.all([
-        fetchTierlistDetail(Number(id)),
-        getCurrentUser(),
-      ]);
-      if (!u) {
-        window.location.href = `${BACKEND_URL}/auth/login`;
-        return;
+    loadSnapshot();
+  }, [loadSnapshot]);
+
+  // Apply small deltas pushed by the backend instead of reloading everything
+  const applyLiveEvent = useCallback((ev: LiveEvent) => {
+    const byPosition = (list: ItemWithVotes[]) =>
+      [...list].sort((a, b) => a.position - b.position);
+    switch (ev.kind) {
+      case 'items_moved': {
+        const moved = new Map(
+          (ev.data.items as { id: number; tier_id: number | null; position: number }[]).map(
+            (m) => [m.id, m]
+          )
+        );
+        setItems((prev) =>
+          byPosition(
+            prev.map((it) => {
+              const m = moved.get(it.id);
+              return m ? { ...it, tier_id: m.tier_id, position: m.position } : it;
+            })
+          )
+        );
+        break;
       }
-      setIsCreator(u.id === tl.creator_id);
-      setTierlistName(tl.name ?? null); // set the name from backend
-      setTiers(tl.tiers.sort((a, b) => a.position - b.position));
-      const itms = await fetchItems(Number(id));
-      setItems(itms.map((it) => ({ ...it, votingEnabled: false })));
+      case 'item_added':
+        setItems((prev) =>
+          prev.some((it) => it.id === ev.data.id)
+            ? prev
+            : byPosition([...prev, { ...(ev.data as Item), votingEnabled: false }])
+        );
+        break;
+      case 'item_updated':
+        setItems((prev) =>
+          byPosition(prev.map((it) => (it.id === ev.data.id ? { ...it, ...(ev.data as Item) } : it)))
+        );
+        break;
+      case 'tier_created':
+        setTiers((prev) =>
+          prev.some((t) => t.id === ev.data.id) ? prev : [...prev, ev.data as Tier]
+        );
+        break;
+      case 'tier_updated':
+        setTiers((prev) => prev.map((t) => (t.id === ev.data.id ? (ev.data as Tier) : t)));
+        break;
+      case 'tier_deleted':
+        setTiers((prev) => prev.filter((t) => t.id !== ev.data.tier_id));
+        setItems((prev) =>
+          prev.map((it) => (it.tier_id === ev.data.tier_id ? { ...it, tier_id: null } : it))
+        );
+        break;
+      case 'reverted':
+      case 'items_imported':
+      case 'resync':
+        loadSnapshot();
+        break;
+      default:
+        // votes_changed etc. don't affect the board
+        break;
     }
-    load();
-  }, [id]);
+  }, [loadSnapshot]);
+
+  // Live feed: opened once per tierlist, EventSource resumes via Last-Event-ID
+  const connected = version !== null;
+  useEffect(() => {
+    if (!id || !connected) return;
+    const source = subscribeTierlistEvents(Number(id), version as number, applyLiveEvent);
+    return () => source.close();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [id, connected]);
 
   // Set the global topbar with tierlist name and right buttons
   useEffect(() => {
@@ -91,6 +179,22 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
               onDelete={handleDeleteTier}
             />
           )}>Edit Tiers</button>
+          <button onClick={handleShowHistory}>History</button>
+          <button onClick={handleFork}>Fork</button>
+          <a href={tierlistBackupUrl(Number(id), true)}>Backup</a>
+          <label className="cursor-pointer">
+            Import archive
+            <input
+              type="file"
+              accept=".zip,.tar,.tgz,.tar.gz,application/zip,application/x-tar,application/gzip"
+              className="hidden"
+              onChange={(e) => {
+                const file = e.target.files?.[0];
+                e.target.value = '';
+                if (file) handleImport(file);
+              }}
+            />
+          </label>
           <button className="bg-green-500 hover:bg-green-600 text-white px-3 py-1 rounded"
             onClick={() => setShowAddItem(true)}
           >
@@ -120,46 +224,40 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
 
     const destIndex = result.destination.index;
 
-    let updatedItems: ItemWithVotes[] = [];
-
-    setItems((prev) => {
-      const grouped: Record<string, ItemWithVotes[]> = {};
-      prev.forEach((it) => {
-        const key = (it.tier_id ?? 'untiered').toString();
-        if (!grouped[key]) grouped[key] = [];
-        grouped[key].push(it);
-      });
-
-      const srcKey = (sourceTierId ?? 'untiered').toString();
-      const dstKey = (destTierId ?? 'untiered').toString();
-
-      const [moved] = grouped[srcKey].splice(result.source.index, 1);
-      moved.tier_id = destTierId;
-      grouped[dstKey].splice(destIndex, 0, moved);
-
+    const grouped: Record<string, ItemWithVotes[]> = {};
+    items.forEach((it) => {
+      const key = (it.tier_id ?? 'untiered').toString();
+      if (!grouped[key]) grouped[key] = [];
+      grouped[key].push(it);
+    });
 
-      updatedItems = Object.values(grouped).flat();
+    const srcKey = (sourceTierId ?? 'untiered').toString();
+    const dstKey = (destTierId ?? 'untiered').toString();
 
-      const groupedAfter: Record<string, ItemWithVotes[]> = {};
-      updatedItems.forEach((it) => {
-        const key = (it.tier_id ?? 'untiered').toString();
-        if (!groupedAfter[key]) groupedAfter[key] = [];
-        groupedAfter[key].push(it);
-      });
+    const [moved] = grouped[srcKey].splice(result.source.index, 1);
+    if (!grouped[dstKey]) grouped[dstKey] = [];
+    const dest = grouped[dstKey];
+    dest.splice(destIndex, 0, { ...moved, tier_id: destTierId });
 
-      Object.values(groupedAfter).forEach((list) => {
-        list.forEach((it, idx) => {
-          it.position = idx;
-        });
-      });
+    // Only the dragged item changes: tell the backend which neighbours it
+    // landed between and let it pick a position in the gap.
+    const move: ItemMove = {
+      item_id: itemId,
+      tier_id: destTierId,
+      after_id: destIndex > 0 ? dest[destIndex - 1].id : null,
+      before_id: destIndex + 1 < dest.length ? dest[destIndex + 1].id : null,
+    };
 
-      return updatedItems;
-    });
+    setItems(Object.values(grouped).flat());
 
-    await Promise.all(
-      updatedItems.map((it) =>
-        updateItem(it.id, { tier_id: it.tier_id, position: it.position })
-      )
+    if (!id) return;
+    const res = await reorderItems(Number(id), [move]);
+    const placements = new Map(res.items.map((p) => [p.id, p]));
+    setItems((prev) =>
+      prev.map((it) => {
+        const p = placements.get(it.id);
+        return p ? { ...it, tier_id: p.tier_id, position: p.position } : it;
+      })
     );
   };
 
@@ -179,27 +277,95 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
 
   // Export the visible tierlist container as a PNG
   const handleExport = async () => {
-    const el = document.getElementById('tierlist-export');
-    if (!el) return;
-    const canvas = await html2canvas(el, {
-      useCORS: true,
-      ignoreElements: (element) =>
-        element.classList?.contains('unassigned-sticky-row'),
-    });
-    const dataUrl = canvas.toDataURL('image/png');
-    const link = document.createElement('a');
-    link.href = dataUrl;
-    link.download = `tierlist_${id}.png`;
-    link.click();
+    if (!id) return;
+    try {
+      const blob = await exportTierlistPng(Number(id));
+      const url = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `tierlist_${id}.png`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (err: any) {
+      alert('Export failed: ' + (err?.message || err));
+    }
+  };
+
+  const handleFork = async () => {
+    if (!id) return;
+    try {
+      const forked = await forkTierlist(Number(id));
+      navigate(`/tierlists/${forked.tierlist_id}`);
+    } catch (err: any) {
+      alert('Fork failed: ' + (err?.message || err));
+    }
+  };
+
+  // Bulk import; the board reloads on the "items_imported" live event
+  const handleImport = async (file: File) => {
+    if (!id) return;
+    const failed: string[] = [];
+    let summary: ImportLine | null = null;
+    try {
+      await importItems(Number(id), file, (line) => {
+        if (line.kind === 'progress') {
+          setImportStatus(`Importing… ${line.processed}/${line.total}`);
+        } else if (line.kind === 'entry' && line.status === 'error') {
+          failed.push(`${line.file}: ${line.error}`);
+        } else if (line.kind === 'done' || line.kind === 'error') {
+          summary = line;
+        }
+      });
+    } catch (err: any) {
+      alert('Import failed: ' + (err?.message || err));
+      return;
+    } finally {
+      setImportStatus(null);
+    }
+    const result = summary as ImportLine | null;
+    if (result?.kind === 'error') {
+      alert('Import failed: ' + result.error);
+    } else if (failed.length > 0) {
+      alert(`Imported ${result?.imported ?? 0} items, ${failed.length} failed:\n` + failed.join('\n'));
+    }
+    await loadSnapshot();
+  };
+
+  // Version history sidebar; a revert arrives back as a live "reverted" event
+  const handleShowHistory = async () => {
+    if (!id) return;
+    const { snapshots } = await fetchSnapshots(Number(id));
+    openSidebar(
+      <VersionHistory
+        versions={snapshots}
+        onSave={async () => {
+          await saveSnapshot(Number(id));
+          handleShowHistory();
+        }}
+        onRevert={async (v: SnapshotSummary) => {
+          const message =
+            `Revert to ${v.label ?? `version ${v.version}`}?\n` +
+            'Tiers created since then are deleted together with their votes.';
+          if (!window.confirm(message)) return;
+          try {
+            const result = await revertSnapshot(Number(id), v.id);
+            if (result?.warning) alert(result.warning);
+            await loadSnapshot();
+            handleShowHistory();
+          } catch (err: any) {
+            alert('Revert failed: ' + (err?.message || err));
+          }
+        }}
+      />
+    );
   };
 
   // Add item via modal form
   const handleAddItem = async (formData: FormData) => {
     if (!id) return;
-    await addItemToTierlist(Number(id), formData);
-    // Reload items after adding!
-    const itms = await fetchItems(Number(id));
-    setItems(itms.map((it) => ({ ...it, votingEnabled: false })));
+    const created: Item = await addItemToTierlist(Number(id), formData);
+    // Same as the live "item_added" event, whichever arrives first wins
+    applyLiveEvent({ tierlist_id: Number(id), kind: 'item_added', data: created });
     setShowAddItem(false);
   };
 
@@ -237,6 +403,9 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
   return (
     <div className="tierlist-root flex flex-col min-h-screen">
       {/* NO HEADER HERE! Only global topbar! */}
+      {importStatus && (
+        <div className="text-sm text-center text-gray-500 py-1">{importStatus}</div>
+      )}
       <div className="tierlist-flexzone flex flex-1 min-h-0 overflow-hidden">
         <main className="tierlist-maincontent flex-1 p-6 overflow-auto">
           <div id="tierlist-export" className="tierlist-main-vertical">
@@ -286,11 +455,13 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
                                     {it.image_url && (
                                       <img
                                         src={BACKEND_URL + (it.preview_url || it.image_url)}
+                                        srcSet={variantSrcSet(it, BACKEND_URL)}
+                                        sizes="96px"
                                         alt={it.name}
                                         className="item-image"
                                         crossOrigin="anonymous"
                                         onClick={() =>
-                                          setLightboxImage(BACKEND_URL + it.image_url)
+                                          setLightboxImage(BACKEND_URL + largestImageUrl(it))
                                         }
                                       />
                                     )}
@@ -342,11 +513,13 @@ const TierlistPage: React.FC<TierlistPageProps> = ({ user }) => {
                                 {it.image_url && (
                                   <img
                                     src={BACKEND_URL + (it.preview_url || it.image_url)}
+                                    srcSet={variantSrcSet(it, BACKEND_URL)}
+                                    sizes="96px"
                                     alt={it.name}
                                     className="item-image"
                                     crossOrigin="anonymous"
                                     onClick={() =>
-                                      setLightboxImage(BACKEND_URL + it.image_url)
+                                      setLightboxImage(BACKEND_URL + largestImageUrl(it))
                                     }
                                   />
                                 )}
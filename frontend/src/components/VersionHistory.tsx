@@ -1,23 +1,35 @@
 import React from 'react';
+import { SnapshotSummary } from '../api';
 
 interface VersionHistoryProps {
-  versions: any[];
-  onRevert: (version: any) => void;
+  versions: SnapshotSummary[];
+  onRevert: (version: SnapshotSummary) => void;
+  onSave?: () => void;
 }
 
-const VersionHistory: React.FC<VersionHistoryProps> = ({ versions, onRevert }) => {
+const VersionHistory: React.FC<VersionHistoryProps> = ({ versions, onRevert, onSave }) => {
   return (
     <div className="bg-white rounded p-4 shadow">
-      <h3 className="font-semibold mb-2">Version History</h3>
+      <div className="flex justify-between items-center mb-2">
+        <h3 className="font-semibold">Version History</h3>
+        {onSave && (
+          <button className="text-blue-500 text-xs hover:underline" onClick={onSave}>
+            Save version
+          </button>
+        )}
+      </div>
 
       {versions.length === 0 && (
         <div className="text-sm text-gray-500">No versions saved yet.</div>
       )}
 
       <ul className="space-y-2 max-h-48 overflow-y-auto">
-        {versions.map((v, idx) => (
-          <li key={idx} className="flex justify-between items-center">
-            <span className="text-sm">{new Date(v.timestamp).toLocaleString()}</span>
+        {versions.map((v) => (
+          <li key={v.id} className="flex justify-between items-center">
+            <span className="text-sm">
+              {v.label ?? `Version ${v.version}`}
+              <span className="text-gray-500 ml-2">{new Date(v.created_at).toLocaleString()}</span>
+            </span>
             <button
               className="text-red-500 text-xs hover:underline"
               onClick={() => onRevert(v)}